@@ -11,6 +11,8 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
 from src.fls_analyzer import db_handler, scraper
+from src.fls_analyzer.bloom import BloomFilter
+from src.fls_analyzer.write_buffer import WriteBuffer
 
 # --- Configuration ---
 CONFIG_DIR = os.path.join(PROJECT_ROOT, 'config')
@@ -20,6 +22,16 @@ EVENT_CONFIGS = {
 }
 COLLECTION_INTERVAL_MINS = 15
 
+# In-memory filter of known URLs. Memory is about 1.8 bytes per URL at 0.1%
+# false positives; size it above the number of URLs you expect to collect.
+BLOOM_CAPACITY = int(os.getenv('FLS_BLOOM_CAPACITY', '5000000'))
+BLOOM_ERROR_RATE = float(os.getenv('FLS_BLOOM_ERROR_RATE', '0.001'))
+
+# Aggregator results are committed together once this many are buffered
+# or the oldest has waited this long
+WRITE_BUFFER_SIZE = 20
+WRITE_BUFFER_DELAY = 60
+
 
 def load_config(config_path: str) -> list:
     """Loads aggregator URLs from a JSON config."""
@@ -30,41 +42,66 @@ def load_config(config_path: str) -> list:
         print(f"Error loading config {config_path}: {e}")
         return []
 
-def process_aggregator(session: Session, agg_url: str, event_obj: db_handler.Event):
-    """Scrapes a single aggregator and saves new links to the DB."""
+def load_known_urls(session: Session) -> BloomFilter:
+    """Builds the Bloom filter of known URLs from the stored url hashes."""
+    stored = session.query(db_handler.ScrapedURL.id).count()
+    # Never size below what is already stored, or the error rate would climb
+    known_urls = BloomFilter(max(BLOOM_CAPACITY, 2 * stored), BLOOM_ERROR_RATE)
+    for hash64 in db_handler.iter_url_hashes(session):
+        known_urls.add_hash(hash64)
+    return known_urls
+
+def process_aggregator(buffer: WriteBuffer, agg_url: str, event_obj: db_handler.Event,
+                       cycle: db_handler.CollectionCycle, known_urls: BloomFilter,
+                       stats: dict):
+    """Scrapes a single aggregator and queues its links for the next group commit."""
     print(f"  Scraping {agg_url}...")
-    
+
+    new_links = scraper.scrape_links_from_url(agg_url)
+    if not new_links:
+        return
+    buffer.add(store_links, agg_url, event_obj.id, cycle.id, new_links, known_urls, stats)
+
+def store_links(session: Session, agg_url: str, event_id: int, cycle_id: int,
+                new_links: set, known_urls: BloomFilter, stats: dict):
+    """
+    Saves an aggregator's new links and logs every sighting (run by the write
+    buffer). Returns the Bloom filter and stats update, applied on commit.
+    """
     # Check if aggregator is already in the DB, if not, create it
     agg_obj = session.query(db_handler.Aggregator).filter_by(url=agg_url).first()
     if not agg_obj:
-        agg_obj = db_handler.Aggregator(url=agg_url, event=event_obj)
+        agg_obj = db_handler.Aggregator(url=agg_url, event_id=event_id)
         session.add(agg_obj)
         session.flush() # Flush to assign an ID before committing
 
-    new_links = scraper.scrape_links_from_url(agg_url)
-    if not new_links:
-        return
-
-    # Check which links are genuinely new
-    existing_urls = {res[0] for res in session.query(db_handler.ScrapedURL.url).filter(db_handler.ScrapedURL.url.in_(new_links)).all()}
-    
-    new_urls_to_add = []
-    for link in new_links:
-        if link not in existing_urls:
-            new_urls_to_add.append(
-                db_handler.ScrapedURL(
-                    url=link,
-                    event_id=event_obj.id,
-                    aggregator_id=agg_obj.id
-                )
-            )
-
-    if new_urls_to_add:
-        session.bulk_save_objects(new_urls_to_add)
-        session.commit()
-        print(f"    -> Stored {len(new_urls_to_add)} new links in DB.")
-    else:
-        print("    -> No new links found.")
+    # Only links the filter has definitely not seen go to the insert
+    maybe_known = {link for link in new_links if link in known_urls}
+    inserted = db_handler.insert_new_urls(session, new_links - maybe_known,
+                                          event_id, agg_obj.id)
+
+    # Log a sighting for every listed link, not just the new ones. The
+    # sightings resolve the URLs themselves; a filter hit with no row behind
+    # it is a false positive, still a new link
+    false_positives = db_handler.record_sightings(session, cycle_id, agg_obj.id, new_links)
+    if false_positives:
+        inserted.update(db_handler.insert_new_urls(session, false_positives,
+                                                   event_id, agg_obj.id))
+        db_handler.record_sightings(session, cycle_id, agg_obj.id, false_positives)
+
+    def on_commit():
+        # Only stored links may enter the filter, or a rolled-back group
+        # would make them look known
+        for link in new_links - maybe_known:
+            known_urls.add(link)
+        stats['links'] += len(new_links)
+        stats['filtered'] += len(maybe_known) - len(false_positives)
+        stats['false_positives'] += len(false_positives)
+        if inserted:
+            print(f"    -> Stored {len(inserted)} new links from {agg_url}.")
+        else:
+            print(f"    -> No new links found on {agg_url}.")
+    return on_commit
 
 
 def main():
@@ -72,15 +109,25 @@ def main():
     print("--- FLS Link Collector Initializing ---")
     
     # Ensure database exists before starting
-    if not os.path.exists(db_handler.DB_PATH):
+    if not db_handler.database_exists():
         print("Database not found. Running init_db()...")
         db_handler.init_db()
 
     session = db_handler.get_session()
+    buffer = WriteBuffer(session, WRITE_BUFFER_SIZE, WRITE_BUFFER_DELAY)
+    buffer.install_signal_handlers()
+
+    print("[*] Loading known URLs into the Bloom filter...")
+    known_urls = load_known_urls(session)
+    print(f"    -> {known_urls.report()}")
 
     try:
         while True:
             print(f"\n--- Starting Collection Cycle ({time.ctime()}) ---")
+            cycle = db_handler.start_collection_cycle(session)
+            session.commit()
+            stats = {'links': 0, 'filtered': 0, 'false_positives': 0}
+
             for event_name, config_path in EVENT_CONFIGS.items():
                 print(f"[*] Processing event: {event_name}")
                 
@@ -91,14 +138,29 @@ def main():
                 
                 aggregator_list = load_config(config_path)
                 for agg_url in aggregator_list:
-                    process_aggregator(session, agg_url, event_obj)
-            
+                    process_aggregator(buffer, agg_url, event_obj, cycle, known_urls, stats)
+
+            buffer.add(db_handler.finish_collection_cycle, cycle)
+            buffer.flush()
+            churn = db_handler.get_cycle_churn(session, cycle.id)
+            print(f"[*] Cycle {cycle.id} churn: {churn['appeared']} appeared, "
+                  f"{churn['persisted']} persisted, {churn['disappeared']} disappeared.")
+            print(f"[*] Bloom filter: {stats['filtered']}/{stats['links']} links skipped the insert, "
+                  f"{stats['false_positives']} false positives. {known_urls.report()}")
+            print(f"[*] Writes: {buffer.report()}")
             print(f"\n--- Cycle Complete. Sleeping for {COLLECTION_INTERVAL_MINS} minutes. ---")
             time.sleep(COLLECTION_INTERVAL_MINS * 60)
 
     except KeyboardInterrupt:
         print("\n[!] Shutdown signal received. Exiting gracefully.")
     finally:
+        # Commit whatever was scraped before the interrupt
+        session.rollback()
+        try:
+            buffer.close()
+        except Exception as e:
+            print(f"[!] Could not store buffered links: {e}")
+        print(f"[*] Writes: {buffer.report()}")
         session.close()
         print("[*] Database session closed.")
 
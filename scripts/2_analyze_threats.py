@@ -1,82 +1,299 @@
 # scripts/2_analyze_threats.py
 
+import asyncio
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session, subqueryload
 
 # Add project root to the Python path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
-from src.fls_analyzer import db_handler, security_analysis
+from src.fls_analyzer import db_handler, drive_by, phishing, retries, vt_archive, vt_async
+from src.fls_analyzer.threat_intel import ThreatIntelMatcher
+from src.fls_analyzer.write_buffer import WriteBuffer
 
-# VirusTotal public API allows 4 requests/min. 16s sleep gives a small buffer.
-VT_API_RATE_LIMIT_SLEEP = 16 
+# URLs are analyzed by vt_async.VTPipeline, up to VT_MAX_IN_FLIGHT at once,
+# paced by the shared per-key rate limiter. New URLs are leased in batches
+# as slots free up. Leases of URLs still in flight are renewed every quarter
+# lease, however long they wait for quota; crashed workers' URLs are
+# reclaimed once theirs expire.
+BATCH_SIZE = 10
+LEASE_SECONDS = 60 * 60
 
-def get_urls_needing_analysis(session: Session, limit: int = 100):
+# Verdicts are committed in groups; well inside the lease, so buffered
+# results are always stored before another worker could reclaim the URL
+WRITE_BUFFER_SIZE = 25
+WRITE_BUFFER_DELAY = 5 * 60
+
+# How often to pick up new or updated threat-intel feed files
+FEED_RELOAD_SECONDS = 10 * 60
+
+# Every URL sent to VT is also visited in a browser to catch drive-by
+# downloads. Visits run in their own threads; no more URLs are leased while
+# this many are still waiting for their visit or VT verdict.
+DRIVE_BY_WORKERS = 2
+MAX_PENDING_URLS = 20
+
+# Visited pages are scored by the phishing classifier this many at a time
+PHISHING_BATCH_SIZE = 20
+
+def get_urls_needing_analysis(session: Session, worker_id: str, limit: int = 100):
     """
-    Fetches a batch of URLs from the DB that haven't been analyzed yet.
+    Leases a batch of URLs from the security work queue for this worker.
     """
-    # Find ScrapedURL objects where a corresponding SecurityAnalysis record does not exist.
+    url_ids = db_handler.claim_tasks(session, 'security', worker_id, limit, LEASE_SECONDS)
+    if not url_ids:
+        return []
     urls = (
         session.query(db_handler.ScrapedURL)
-        .outerjoin(db_handler.SecurityAnalysis)
-        .filter(db_handler.SecurityAnalysis.id == None)
-        .limit(limit)
+        .filter(db_handler.ScrapedURL.id.in_(url_ids))
+        .order_by(db_handler.ScrapedURL.id)
         .all()
     )
     return urls
 
+def store_downloads(session: Session, url_id: int, downloads: list):
+    """
+    Stores the payloads a visit captured (run by the write buffer). Not tied
+    to the lease or the VT verdict: the files are already in the payload store.
+    """
+    new_payloads = db_handler.record_downloads(session, url_id, downloads)
+    if new_payloads:
+        print(f"  > URL {url_id}: {len(new_payloads)} new payloads stored.")
+
+def store_result(session: Session, url_id: int, worker_id: str, vt_score: int,
+                 vt_archive_entry: tuple = None):
+    """Completes the task and stores the verdict (run by the write buffer)."""
+    if not db_handler.complete_task(session, 'security', url_id, worker_id):
+        print(f"  [!] Lease on URL {url_id} expired and it was reclaimed. Discarding result.")
+        return
+    # Also updates the threat summary and domain rollups
+    db_handler.record_security_result(session, url_id, vt_score)
+    if vt_archive_entry is not None:
+        # The full VT response, for re-evaluating the verdict offline
+        vt_archive.archive_result(session, url_id, *vt_archive_entry)
+    db_handler.clear_pending_vt_analysis(session, url_id)
+
+def store_failure(session: Session, url_id: int, worker_id: str, error_kind: str, error: str):
+    """Schedules a retry for a URL VT could not analyze, or gives up on it (run by the write buffer)."""
+    db_handler.clear_pending_vt_analysis(session, url_id)
+    state = db_handler.fail_task(session, 'security', url_id, worker_id, error_kind, error)
+    if state is None:
+        print(f"  [!] Lease on URL {url_id} expired and it was reclaimed. Discarding result.")
+    elif state == db_handler.TASK_FAILED:
+        print(f"  [!] URL {url_id}: giving up after a {error_kind} error.")
+
+def store_intel_match(session: Session, url_id: int, worker_id: str, match):
+    """Completes the task and stores a threat-intel feed verdict (run by the write buffer)."""
+    if not db_handler.complete_task(session, 'security', url_id, worker_id):
+        print(f"  [!] Lease on URL {url_id} expired and it was reclaimed. Discarding result.")
+        return
+    db_handler.record_security_result(
+        session, url_id, vt_score=None, is_phishing=True if match.category == 'phishing' else None,
+        intel_feed=match.feed, intel_match_type=match.match_type, intel_indicator=match.indicator,
+    )
+
+def load_feeds(matcher: ThreatIntelMatcher):
+    reloaded = matcher.reload()
+    for name, entries in reloaded.items():
+        print(f"[*] Loaded threat feed {name}: {entries} indicators.")
+
+class ThreatAnalyzer:
+    """
+    One worker's share of the security queue.
+
+    claim() leases URLs for the VT pipeline, judging those on a threat-intel
+    feed locally, and starts a drive-by visit for each of the others.
+    on_result() takes the pipeline's verdicts. A URL is stored once both its
+    verdict and its visit are in: payloads, phishing score, then the verdict
+    or the failure, all through the write buffer. main() runs it against
+    VirusTotal; scripts/benchmark_vt_pipeline.py runs the same object against
+    mock_virustotal. Without a matcher no URL is judged locally, and without
+    a visit_pool no page is visited, so a URL is stored on its verdict alone.
+    """
+
+    def __init__(self, session: Session, worker_id: str, buffer: WriteBuffer,
+                 matcher: ThreatIntelMatcher = None, visit_pool: ThreadPoolExecutor = None):
+        self.session = session
+        self.worker_id = worker_id
+        self.buffer = buffer
+        self.matcher = matcher
+        self.visit_pool = visit_pool
+        self.intel_matches = 0
+        self._feeds_loaded_at = time.monotonic()
+        self._leased_any = False
+
+        # URLs with their verdict or their visit in, waiting for the other
+        self._partial_results = {}
+
+        # The HTML of visited pages, waiting to be scored as one batch
+        self._phishing_model = phishing.load_model()
+        self._unscored_pages = []
+
+    def score_pages(self, force: bool = False):
+        pages = self._unscored_pages
+        if not pages or (len(pages) < PHISHING_BATCH_SIZE and not force):
+            return
+        threshold = self._phishing_model.threshold
+        scores = self._phishing_model.score_pages([(html, url) for _, url, html in pages])
+        for (url_id, _, _), score in zip(pages, scores):
+            self.buffer.add(db_handler.record_phishing_result, url_id, float(score),
+                            bool(score >= threshold))
+        print(f"  > Scored {len(pages)} pages for phishing, "
+              f"{int((scores >= threshold).sum())} flagged.")
+        pages.clear()
+
+    def finish(self, url_id: int, **parts):
+        entry = self._partial_results.setdefault(url_id, {})
+        entry.update(parts)
+        visited = 'downloads' in entry or self.visit_pool is None
+        if not visited or not ('vt_score' in entry or 'vt_error' in entry):
+            return
+        del self._partial_results[url_id]
+        if entry.get('page_source'):
+            self._unscored_pages.append((url_id, entry['url'], entry['page_source']))
+            self.score_pages()
+        # Payloads are kept whatever VT says, even if it gives up on the URL
+        if 'downloads' in entry:
+            self.buffer.add(store_downloads, url_id, entry['downloads'])
+        if 'vt_error' in entry:
+            # Retried later in full, including the visit; stored payloads are deduplicated
+            self.buffer.add(store_failure, url_id, self.worker_id, *entry['vt_error'])
+        else:
+            self.buffer.add(store_result, url_id, self.worker_id, entry['vt_score'],
+                            entry.get('vt_archive_entry'))
+
+    def on_visit(self, url_id: int, url: str, future):
+        try:
+            downloads, page_source = future.result()
+        except Exception as e:
+            print(f"  [!] URL {url_id}: drive-by visit failed: {e}")
+            downloads, page_source = [], None
+        if downloads:
+            print(f"  > URL {url_id}: drive-by! {len(downloads)} files downloaded.")
+        self.finish(url_id, downloads=downloads, url=url, page_source=page_source)
+
+    def claim(self, limit: int) -> list:
+        """Leases up to `limit` URLs; returns the (url_id, url) pairs to send to VT."""
+        self.buffer.maybe_flush()
+        if self.matcher is not None and time.monotonic() - self._feeds_loaded_at >= FEED_RELOAD_SECONDS:
+            load_feeds(self.matcher)
+            self._feeds_loaded_at = time.monotonic()
+
+        if self.visit_pool is not None:
+            limit = min(limit, MAX_PENDING_URLS - len(self._partial_results))
+        if limit <= 0:
+            return []
+        urls = get_urls_needing_analysis(self.session, self.worker_id, limit=limit)
+        if len(urls) < limit:
+            # No fresh work for these slots: spend the spare quota on due retries
+            requeued = db_handler.requeue_retries(self.session, 'security', limit - len(urls))
+            if requeued:
+                print(f"Retrying {requeued} URLs that failed before...")
+                urls += get_urls_needing_analysis(self.session, self.worker_id, limit=limit - len(urls))
+        self._leased_any = bool(urls)
+        if urls:
+            print(f"Leased {len(urls)} URLs to analyze...")
+        to_scan = []
+        for url_obj in urls:
+            match = self.matcher.match(url_obj.url) if self.matcher is not None else None
+            if match is None:
+                to_scan.append((url_obj.id, url_obj.url))
+                if self.visit_pool is not None:
+                    visit = asyncio.get_running_loop().run_in_executor(
+                        self.visit_pool, drive_by.capture_downloads, url_obj.url
+                    )
+                    visit.add_done_callback(
+                        lambda future, url_id=url_obj.id, url=url_obj.url: self.on_visit(url_id, url, future)
+                    )
+                continue
+            self.intel_matches += 1
+            print(f"  > URL {url_obj.id}: listed in {match.feed} ({match.match_type} match on {match.indicator}).")
+            self.buffer.add(store_intel_match, url_obj.id, self.worker_id, match)
+        return to_scan
+
+    def flush(self):
+        """Scores the pages waiting for a full batch and commits everything buffered."""
+        self.score_pages(force=True)
+        self.buffer.flush()
+
+    async def idle(self):
+        self.flush()
+        if self._leased_any:
+            # Everything leased was matched locally; there may be more queued
+            return
+        print("No new URLs to analyze. Waiting...")
+        await asyncio.sleep(60)
+
+    def on_result(self, url_id: int, vt_report: dict, source: str, payload: dict):
+        if "error" in vt_report:
+            error_kind = vt_report.get('error_kind', retries.ERROR_TRANSIENT)
+            print(f"  [!] URL {url_id}: VT Error ({error_kind}): {vt_report['error']}")
+            self.finish(url_id, vt_error=(error_kind, vt_report['error']))
+            return
+        # 'malicious' is a key in the VT stats dictionary
+        vt_score = vt_report.get('malicious', 0)
+        print(f"  > URL {url_id}: VT Score: {vt_score} malicious vendors.")
+        self.finish(url_id, vt_score=vt_score, vt_archive_entry=(vt_report, source, payload))
+
+    def renew_leases(self):
+        # URLs waiting for quota in a full pipeline can outlive their lease
+        db_handler.renew_leases(self.session, 'security', self.worker_id, LEASE_SECONDS)
+
+    def shutdown(self) -> int:
+        """
+        Stores finished verdicts, then hands the rest back to the queue.
+        Returns the number of URLs released.
+        """
+        self.session.rollback()
+        try:
+            self.score_pages(force=True)
+            self.buffer.close()
+        except Exception as e:
+            print(f"[!] Could not store buffered results: {e}")
+        return db_handler.release_leases(self.session, 'security', self.worker_id)
+
 def main():
     """
     Main execution script to analyze URLs for security threats.
     """
     print("--- FLS Security Threat Analyzer ---")
     session = db_handler.get_session()
+    worker_id = db_handler.default_worker_id()
+    print(f"[*] Worker ID: {worker_id}")
+    buffer = WriteBuffer(session, WRITE_BUFFER_SIZE, WRITE_BUFFER_DELAY)
+    buffer.install_signal_handlers()
 
-    try:
-        while True:
-            urls_to_process = get_urls_needing_analysis(session, limit=50) # Process in batches of 50
-            
-            if not urls_to_process:
-                print("No new URLs to analyze. Waiting...")
-                time.sleep(60)
-                continue
+    # URLs already on a blocklist are judged locally and never sent to VT
+    matcher = ThreatIntelMatcher()
+    load_feeds(matcher)
 
-            print(f"Found {len(urls_to_process)} URLs to analyze...")
-
-            for url_obj in urls_to_process:
-                print(f"[*] Analyzing: {url_obj.url}")
-                
-                # Get the VirusTotal report
-                vt_report = security_analysis.get_virustotal_report(url_obj.url)
-
-                analysis_record = db_handler.SecurityAnalysis(url_id=url_obj.id)
-
-                if "error" in vt_report:
-                    print(f"  [!] VT Error: {vt_report['error']}")
-                    # Still save a record so we don't try this URL again
-                    analysis_record.vt_score = -1 
-                else:
-                    # 'malicious' is a key in the VT stats dictionary
-                    malicious_count = vt_report.get('malicious', 0)
-                    analysis_record.vt_score = malicious_count
-                    print(f"  > VT Score: {malicious_count} malicious vendors.")
-                
-                # TODO: Add logic here to check for drive-by-downloads
-                # and pass the file to the cuckoo analysis function.
-                # For now, we'll just create the security record.
-
-                session.add(analysis_record)
-                session.commit()
-                
-                # Respect API rate limits. For testing, we can reduce this to 1 second.
-                time.sleep(VT_API_RATE_LIMIT_SLEEP)
+    # Every URL sent to VT is also visited in a browser
+    visit_pool = ThreadPoolExecutor(DRIVE_BY_WORKERS, thread_name_prefix='drive-by')
+    analyzer = ThreatAnalyzer(session, worker_id, buffer, matcher, visit_pool)
+
+    pipeline = vt_async.VTPipeline(session, analyzer.on_result)
+    try:
+        asyncio.run(pipeline.run(analyzer.claim, analyzer.idle, min_claim=BATCH_SIZE,
+                                 heartbeat=analyzer.renew_leases,
+                                 heartbeat_interval=LEASE_SECONDS / 4))
 
     except KeyboardInterrupt:
         print("\n[!] Shutdown signal received.")
     finally:
+        # URLs still half-done are released below and analyzed again later
+        visit_pool.shutdown(wait=False, cancel_futures=True)
+        released = analyzer.shutdown()
+        print(f"[*] Writes: {buffer.report()}")
+        print(f"[*] VT pipeline: {pipeline.report()}; {analyzer.intel_matches} URLs matched threat feeds")
+        if released:
+            print(f"[*] Returned {released} unfinished URLs to the queue.")
+        queue = db_handler.queue_counts(session, 'security')
+        print(f"[*] Queue: {queue.get(db_handler.TASK_RETRY, 0)} URLs waiting to be retried, "
+              f"{queue.get(db_handler.TASK_FAILED, 0)} given up on.")
         session.close()
         print("[*] Analysis complete. Database session closed.")
 
@@ -4,34 +4,49 @@ import os
 import sys
 import time
 import json
+from collections import Counter
 from sqlalchemy.orm import Session
 
 # Add project root to the Python path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
-from src.fls_analyzer import db_handler, privacy_analysis, scraper
+from src.fls_analyzer import db_handler, privacy_analysis, script_analysis, scraper
+from src.fls_analyzer.write_buffer import WriteBuffer
 
 # --- Configuration ---
 # For test just re-scraping from the same location. Don't use proxies. Use it for final data collection only.
 # VANTAGE_POINTS = ["CA"] 
 VANTAGE_POINTS = ["CA", "US", "DE", "SG"] 
 
+# Leased URLs not finished within this window are handed to another worker
+LEASE_SECONDS = 15 * 60
 
-def get_unprocessed_urls(session: Session, limit: int = 25):
-    """Fetches URLs that do not have a privacy analysis record yet."""
+# Results are committed in groups, well before their lease runs out
+WRITE_BUFFER_SIZE = 10
+WRITE_BUFFER_DELAY = 2 * 60
+
+
+def get_unprocessed_urls(session: Session, worker_id: str, limit: int = 25):
+    """Leases a batch of URLs from the privacy work queue for this worker."""
+    url_ids = db_handler.claim_tasks(session, 'privacy', worker_id, limit, LEASE_SECONDS)
+    if not url_ids:
+        return []
     urls = (
         session.query(db_handler.ScrapedURL)
-        .outerjoin(db_handler.PrivacyAnalysis)
-        .filter(db_handler.PrivacyAnalysis.id == None)
-        .limit(limit)
+        .filter(db_handler.ScrapedURL.id.in_(url_ids))
+        .order_by(db_handler.ScrapedURL.id)
         .all()
     )
     return urls
 
-def perform_vp_analysis(url: str):
+def perform_vp_analysis(url: str, script_analyzer: script_analysis.ScriptAnalyzer):
     """
     Simulates scraping a URL from multiple vantage points and analyzes each result.
+
+    Scripts already seen (on this page from another VP, or on other pages)
+    are not analyzed again; script_analyzer supplies their cached verdicts.
+
     """
     vp_results = {}
     for vp in VANTAGE_POINTS:
@@ -42,7 +57,7 @@ def perform_vp_analysis(url: str):
         # You might get slightly different content from each VP. Check this before running the data collection on stanly cup finals.
         page_source = f"<html><body><!-- VP: {vp} --> <script>var ua_code = 'UA-1111{VANTAGE_POINTS.index(vp)}-1';</script></body></html>"
 
-        analysis = privacy_analysis.analyze_privacy_from_source(page_source)
+        analysis = privacy_analysis.analyze_privacy_from_source(page_source, script_analyzer, url)
         vp_results[vp] = analysis
         
     return vp_results
@@ -59,15 +74,34 @@ def aggregate_google_ids(vp_results: dict):
     return list(all_ids)
 
 
+def store_result(session: Session, url_id: int, worker_id: str,
+                 vp_analysis_data: dict, unique_google_ids: list):
+    """Completes the task and stores the privacy analysis (run by the write buffer)."""
+    if not db_handler.complete_task(session, 'privacy', url_id, worker_id):
+        print(f"  [!] Lease on URL {url_id} expired and it was reclaimed. Discarding result.")
+        return
+    # Create the database record, plus one indexed row per ID/technique found
+    db_handler.record_privacy_result(session, url_id, vp_analysis_data, unique_google_ids)
+
+
 def main():
     print("--- FLS Privacy Analyzer ---")
     session = db_handler.get_session()
+    worker_id = db_handler.default_worker_id()
+    print(f"[*] Worker ID: {worker_id}")
+    buffer = WriteBuffer(session, WRITE_BUFFER_SIZE, WRITE_BUFFER_DELAY)
+    buffer.install_signal_handlers()
+
+    # Each unique script is analyzed once; its verdict is stored and reused
+    script_analyzer = script_analysis.ScriptAnalyzer(session)
+    script_stats = Counter()
 
     try:
         while True:
-            urls_to_process = get_unprocessed_urls(session, limit=10)
+            urls_to_process = get_unprocessed_urls(session, worker_id, limit=10)
             
             if not urls_to_process:
+                buffer.flush()
                 print("No new URLs for privacy analysis. Waiting...")
                 time.sleep(120)
                 continue
@@ -77,28 +111,38 @@ def main():
                 print(f"[*] Processing: {url_obj.url}")
                 
                 # Perform the analysis from all VPs
-                vp_analysis_data = perform_vp_analysis(url_obj.url)
+                vp_analysis_data = perform_vp_analysis(url_obj.url, script_analyzer)
                 
                 # Consolidate all found Google IDs into one list
                 unique_google_ids = aggregate_google_ids(vp_analysis_data)
                 
-                # Create the database record
-                privacy_record = db_handler.PrivacyAnalysis(
-                    url_id=url_obj.id,
-                    vp_analysis_data=vp_analysis_data,
-                    google_publisher_ids=unique_google_ids
-                )
-                
-                session.add(privacy_record)
-                session.commit()
-                print(f"  > Stored privacy analysis for {url_obj.url}")
+                buffer.add(store_result, url_obj.id, worker_id, vp_analysis_data, unique_google_ids)
+                print(f"  > Queued privacy analysis for {url_obj.url}")
                 
                 # Add a small delay between processing URLs
                 time.sleep(5) 
 
+            buffer.add(script_analysis.store_new_verdicts, script_analyzer.take_new_verdicts(), script_analyzer)
+            crawl_stats = script_analyzer.take_stats()
+            script_stats.update(crawl_stats)
+            print(f"[*] Scripts: {script_analysis.format_stats(crawl_stats)}")
+
     except KeyboardInterrupt:
         print("\n[!] Shutdown signal received.")
     finally:
+        # Store finished analyses before handing the rest back to the queue
+        session.rollback()
+        buffer.add(script_analysis.store_new_verdicts, script_analyzer.take_new_verdicts(), script_analyzer)
+        try:
+            buffer.close()
+        except Exception as e:
+            print(f"[!] Could not store buffered results: {e}")
+        print(f"[*] Writes: {buffer.report()}")
+        script_stats.update(script_analyzer.take_stats())
+        print(f"[*] Scripts (all crawls): {script_analysis.format_stats(script_stats)}")
+        released = db_handler.release_leases(session, 'privacy', worker_id)
+        if released:
+            print(f"[*] Returned {released} unfinished URLs to the queue.")
         session.close()
         print("[*] Database session closed.")
 
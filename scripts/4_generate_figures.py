@@ -2,72 +2,129 @@
 
 import os
 import sys
+from collections import Counter
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sqlalchemy import func
+from sqlalchemy import select
 
 # Add project root to the Python path
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
-from src.fls_analyzer import db_handler
+from src.fls_analyzer import db_handler, vt_archive, vt_cache
 
 # --- Configuration ---
 FIGURES_DIR = os.path.join(PROJECT_ROOT, 'figures')
 os.makedirs(FIGURES_DIR, exist_ok=True)
 
-
-def load_data_into_dataframe():
-    """Loads all relevant data from the database into a pandas DataFrame."""
-    session = db_handler.get_session()
-    
-    # Query to join all tables together
-    query = (
-        session.query(
-            db_handler.ScrapedURL.url,
-            db_handler.Event.name.label('event_name'),
-            db_handler.SecurityAnalysis.vt_score,
-            db_handler.SecurityAnalysis.is_phishing,
-            db_handler.SecurityAnalysis.drive_by_download_detected,
-            db_handler.PrivacyAnalysis.vp_analysis_data
-        )
-        .join(db_handler.Event)
-        .outerjoin(db_handler.SecurityAnalysis)
-        .outerjoin(db_handler.PrivacyAnalysis)
-    )
-    
-    df = pd.read_sql(query.statement, session.bind)
-    session.close()
-    return df
+# Alternative "more than N vendors" cut-offs to compare against VT_POSITIVE_THRESHOLD
+VT_THRESHOLDS = [1, 2, 3, 5, 10]
 
 
-def generate_threat_prevalence_table(df):
+def load_threat_summary():
+    """Loads the per (event, day, aggregator) threat counters into a DataFrame."""
+    session = db_handler.get_session()
+    try:
+        rows = db_handler.get_threat_summary(session)
+    finally:
+        session.close()
+    return pd.DataFrame(rows, columns=['event_name', 'day', 'aggregator_url', *db_handler.SUMMARY_COUNTERS])
+
+
+def _prevalence_by(summary, keys):
+    """Sums the summary counters over `keys` and converts them to % of all URLs."""
+    totals = summary.groupby(keys)[list(db_handler.SUMMARY_COUNTERS)].sum()
+    return pd.DataFrame({
+        'Total_URLs': totals['url_count'],
+        'Drive_by_Downloads': totals['drive_by_count'] / totals['url_count'] * 100,
+        'Malicious_JS': totals['vt_positive_count'] / totals['url_count'] * 100, # >VT_POSITIVE_THRESHOLD vendors
+        'Threat_Feed_Listed': totals['intel_positive_count'] / totals['url_count'] * 100, # not sent to VT
+        'Phishing': totals['phishing_count'] / totals['url_count'] * 100,
+    })
+
+
+def generate_threat_prevalence_table(summary):
     """Generates and prints the Threat Prevalence table (Table I)."""
     print("\n--- Generating Threat Prevalence Table (Table I) ---")
     
-    prevalence = df.groupby('event_name').agg(
-        Total_URLs=('url', 'count'),
-        Drive_by_Downloads=('drive_by_download_detected', lambda x: x.sum() / len(x) * 100),
-        Malicious_JS=('vt_score', lambda x: (x > 5).sum() / len(x) * 100), # Example: >5 vendors
-        Phishing=('is_phishing', lambda x: x.sum() / len(x) * 100)
-    ).round(1)
+    prevalence = _prevalence_by(summary, 'event_name').round(1)
     
     print(prevalence)
 
 
-def generate_comparative_threat_barchart(df):
+def generate_vt_threshold_table():
+    """Shows how the malicious share in Table I moves with the VT vendor threshold."""
+    print("\n--- Generating VT Threshold Sensitivity Table ---")
+
+    thresholds = sorted(set(VT_THRESHOLDS) | {db_handler.VT_POSITIVE_THRESHOLD})
+    session = db_handler.get_session()
+    try:
+        # Computed from the archived VT responses, not re-queried
+        sweep = vt_archive.threshold_sweep(session, thresholds)
+    finally:
+        session.close()
+    if not sweep:
+        print("[!] No archived VT responses yet.")
+        return
+    table = pd.DataFrame([
+        {'event_name': name, 'Analyzed_URLs': event['analyzed'],
+         **{f'>{t}': event[t] / event['analyzed'] * 100 for t in thresholds}}
+        for name, event in sweep.items()
+    ]).set_index('event_name')
+    print(table.round(1))
+
+
+def generate_domain_fallback_table():
+    """
+    For URLs without a verdict of their own, shows how many sit on a domain
+    whose cached VT rollup (the worst of its scanned URLs) is flagged.
+
+    Kept apart from Table I: these are inferred from other URLs, not observed.
+    """
+    print("\n--- Generating Domain Fallback Table ---")
+
+    sa = db_handler.SecurityAnalysis
+    query = (
+        select(db_handler.Event.name.label('event_name'), db_handler.Domain.name.label('domain'))
+        .select_from(db_handler.ScrapedURL)
+        .join(db_handler.Event, db_handler.Event.id == db_handler.ScrapedURL.event_id)
+        .join(db_handler.Domain, db_handler.Domain.id == db_handler.ScrapedURL.domain_id)
+        .outerjoin(sa, sa.url_id == db_handler.ScrapedURL.id)
+        .where(sa.vt_score == None, sa.intel_feed == None)
+    )
+    unscanned = {}  # event -> Counter(domain)
+    session = db_handler.get_session()
+    try:
+        for rows in db_handler.iter_rows(session, query):
+            for row in rows:
+                unscanned.setdefault(row.event_name, Counter())[row.domain] += 1
+    finally:
+        session.close()
+    if not unscanned:
+        print("[!] Every URL has a verdict of its own.")
+        return
+
+    verdicts = vt_cache.get_domain_verdicts(set().union(*unscanned.values()))
+    table = []
+    for name, domains in unscanned.items():
+        total = sum(domains.values())
+        covered = sum(count for domain, count in domains.items() if domain in verdicts)
+        flagged = sum(count for domain, count in domains.items()
+                      if verdicts.get(domain, {}).get('malicious', 0) > db_handler.VT_POSITIVE_THRESHOLD)
+        table.append({'event_name': name, 'Unscanned_URLs': total,
+                      'With_Domain_Verdict': covered / total * 100,
+                      'Domain_Flagged': flagged / total * 100})
+    print(pd.DataFrame(table).set_index('event_name').round(1))
+
+
+def generate_comparative_threat_barchart(summary):
     """Generates a bar chart comparing threat types across events."""
     print("\n--- Generating Comparative Threat Bar Chart ---")
     
-    data_for_plot = df.groupby('event_name').agg(
-        Drive_by_Downloads=('drive_by_download_detected', 'mean'),
-        Phishing=('is_phishing', 'mean'),
-        Malicious_JS=('vt_score', lambda x: (x > 5).mean())
-    ).reset_index()
+    data_for_plot = _prevalence_by(summary, 'event_name').drop(columns='Total_URLs').reset_index()
     
     melted_df = data_for_plot.melt(id_vars='event_name', var_name='Threat Type', value_name='Prevalence')
-    melted_df['Prevalence'] *= 100 # To percentage
 
     plt.figure(figsize=(10, 6))
     sns.barplot(data=melted_df, x='Threat Type', y='Prevalence', hue='event_name')
@@ -82,24 +139,97 @@ def generate_comparative_threat_barchart(df):
     plt.close()
 
 
-def generate_privacy_table(df):
+def generate_prevalence_over_time(summary):
+    """Plots daily malicious-URL prevalence per event; can be re-run during a tournament."""
+    print("\n--- Generating Prevalence Over Time Chart ---")
+
+    daily = _prevalence_by(summary, ['event_name', 'day']).reset_index()
+
+    plt.figure(figsize=(12, 6))
+    sns.lineplot(data=daily, x='day', y='Malicious_JS', hue='event_name', marker='o')
+    plt.title('Daily Prevalence of VT-Flagged FLS URLs')
+    plt.ylabel('Prevalence (%)')
+    plt.xlabel('Day')
+    plt.tight_layout()
+
+    output_path = os.path.join(FIGURES_DIR, 'fig_prevalence_over_time.png')
+    plt.savefig(output_path)
+    print(f"[*] Chart saved to {output_path}")
+    plt.close()
+
+
+def aggregate_privacy_stats():
+    """
+    Builds per-event privacy counters from the stored per-VP JSON results.
+
+    Rows are streamed from the DB in fixed-size chunks and folded into the
+    counters as they arrive, so memory stays flat however many URLs exist.
+    """
+    query = (
+        select(
+            db_handler.Event.name.label('event_name'),
+            db_handler.PrivacyAnalysis.google_publisher_ids,
+            db_handler.PrivacyAnalysis.vp_analysis_data,
+        )
+        .join(db_handler.ScrapedURL, db_handler.ScrapedURL.id == db_handler.PrivacyAnalysis.url_id)
+        .join(db_handler.Event, db_handler.Event.id == db_handler.ScrapedURL.event_id)
+    )
+
+    stats = {}
+    session = db_handler.get_session()
+    try:
+        for rows in db_handler.iter_rows(session, query):
+            for row in rows:
+                event = stats.setdefault(row.event_name, {
+                    'analyzed': 0, 'tracking': 0, 'fingerprinting': 0, 'publisher_ids': set()
+                })
+                event['analyzed'] += 1
+                if row.google_publisher_ids:
+                    event['tracking'] += 1
+                    event['publisher_ids'].update(row.google_publisher_ids)
+                if any(vp.get('fingerprinting_techniques') for vp in (row.vp_analysis_data or {}).values()):
+                    event['fingerprinting'] += 1
+    finally:
+        session.close()
+
+    return pd.DataFrame([
+        {
+            'event_name': name,
+            'Analyzed_URLs': event['analyzed'],
+            'Tracking_IDs': event['tracking'] / event['analyzed'] * 100,
+            'Fingerprinting': event['fingerprinting'] / event['analyzed'] * 100,
+            'Distinct_Publisher_IDs': len(event['publisher_ids']),
+        }
+        for name, event in stats.items()
+    ])
+
+
+def generate_privacy_table(privacy_stats):
     """Generates the privacy analysis table (Table II)."""
-    print("\n--- Generating Privacy Analysis Table (Table II) - Placeholder ---")
-    # todo - generate a table based on the JSON data not your current customized script
+    print("\n--- Generating Privacy Analysis Table (Table II) ---")
+
+    if privacy_stats.empty:
+        print("[!] No privacy analysis results yet.")
+        return
+    print(privacy_stats.set_index('event_name').round(1))
 
 
 def main():
     """Main function to load data and generate all paper figures."""
     print("--- Figure Generation Script ---")
     
-    df = load_data_into_dataframe()
-    if df.empty:
+    summary = load_threat_summary()
+    if summary.empty:
         print("[!] Database is empty or no analyzed data found. Exiting.")
         return
         
-    generate_threat_prevalence_table(df)
-    generate_comparative_threat_barchart(df)
-    generate_privacy_table(df)
+    generate_threat_prevalence_table(summary)
+    generate_vt_threshold_table()
+    generate_domain_fallback_table()
+    generate_comparative_threat_barchart(summary)
+    generate_prevalence_over_time(summary)
+
+    generate_privacy_table(aggregate_privacy_stats())
 
     print("\n--- All figures generated successfully. ---")
 
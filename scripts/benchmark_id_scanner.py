@@ -0,0 +1,127 @@
+# scripts/benchmark_id_scanner.py
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+# Add project root to the Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from src.fls_analyzer.id_scanner import DEFAULT_PATTERNS, IDPattern, IDScanner, load_patterns
+
+# Compares the cost of scanning a page for publisher/tracker IDs as the
+# pattern registry grows, for three strategies:
+#   findall    - one findall() per pattern (the old _find_google_ids)
+#   one-pass   - every pattern in one alternation of named groups, one finditer()
+#   prefilter  - IDScanner: one Aho-Corasick pass for the prefilter literals,
+#                then only the candidate patterns
+# Beyond the real registry, synthetic networks ('XN017-AB12CD34') are added.
+#   python scripts/benchmark_id_scanner.py --page-kb 200 2000 --patterns 4 16 64 256
+
+SAMPLE_IDS = [
+    "var ua = 'UA-9876543-2';", "gtag('config', 'G-ABCDEFGH12');", "(window,document,'GTM-ABC1234');",
+    'data-ad-client="ca-pub-1234567890123456"', "fbq('init', '123456789012345');",
+    'ym(12345678, "init", {clickmap:true});', '<script src="//cdn.taboola.com/libtrc/mysite/loader.js">',
+]
+
+
+def synthetic_patterns(count: int) -> list:
+    return [IDPattern(f'XN{k:03d}', 'synthetic', rf'XN{k:03d}-[A-Z0-9]{{8}}', (f'XN{k:03d}-',))
+            for k in range(count)]
+
+
+def registry(size: int) -> list:
+    """The first `size` patterns: Google's, then the configured ones, then synthetic."""
+    patterns = list(DEFAULT_PATTERNS)
+    patterns += [p for p in load_patterns() if p.id_type not in {d.id_type for d in DEFAULT_PATTERNS}]
+    patterns += synthetic_patterns(max(size - len(patterns), 0))
+    return patterns[:size]
+
+
+def make_page(size_kb: int, seed: int) -> str:
+    """Minified-JS-like filler with a few real IDs scattered through it."""
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + '(){};.,=+"\' '
+    chunks, length = [], 0
+    while length < size_kb * 1024:
+        chunk = ''.join(rng.choices(alphabet, k=2000))
+        if rng.random() < 0.05:
+            chunk += rng.choice(SAMPLE_IDS)
+        chunks.append(chunk)
+        length += len(chunk)
+    return ''.join(chunks)
+
+
+def scan_findall(compiled: list, page: str) -> dict:
+    found = {}
+    for id_type, pattern in compiled:
+        matches = pattern.findall(page)
+        if matches:
+            found.setdefault(id_type, set()).update(matches)
+    return found
+
+
+def alternation(patterns: list):
+    """All patterns as one regex, with each branch's group named after its position."""
+    branches = []
+    for index, spec in enumerate(patterns):
+        body = re.sub(r'\(\?P<(\w+)>', lambda m: f'(?P<p{index}_{m[1]}>', spec.pattern)
+        branches.append(f'(?P<p{index}>{body})')
+    return re.compile('|'.join(branches))
+
+
+def scan_one_pass(combined, patterns: list, page: str) -> dict:
+    found = {}
+    for match in combined.finditer(page):
+        index = int(match.lastgroup[1:])
+        value = match.group(f'p{index}_id' if '(?P<id>' in patterns[index].pattern else match.lastgroup)
+        found.setdefault(patterns[index].id_type, set()).add(value)
+    return found
+
+
+def timed(func, pages, repeat: int) -> float:
+    """Best of `repeat` runs, in ms per page."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in pages:
+            func(page)
+        best = min(best, time.perf_counter() - started)
+    return best / len(pages) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark publisher/tracker ID scanning against pattern count.")
+    parser.add_argument('--page-kb', type=int, nargs='+', default=[200, 2000])
+    parser.add_argument('--patterns', type=int, nargs='+', default=[4, 19, 64, 256])
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--one-pass-max', type=int, default=64,
+                        help="Skip the one-pass alternation above this many patterns (it takes minutes).")
+    args = parser.parse_args()
+
+    print("page KB".rjust(8) + "patterns".rjust(10) + "findall".rjust(12)
+          + "one-pass".rjust(12) + "prefilter".rjust(12) + "   (ms/page)")
+    for size_kb in args.page_kb:
+        pages = [make_page(size_kb, seed) for seed in range(args.pages)]
+        for count in args.patterns:
+            patterns = registry(count)
+            # Patterns with an 'id' group store only that group; findall gives the same
+            compiled = [(p.id_type, re.compile(p.pattern.replace('(?P<id>', '('))) for p in patterns]
+            combined = alternation(patterns)
+            one_pass = (f"{timed(lambda page: scan_one_pass(combined, patterns, page), pages, args.repeat):>12.2f}"
+                        if len(patterns) <= args.one_pass_max else '-'.rjust(12))
+            scanner = IDScanner(patterns)
+            print(f"{size_kb:>8}{len(patterns):>10}"
+                  f"{timed(lambda page: scan_findall(compiled, page), pages, args.repeat):>12.2f}"
+                  f"{one_pass}"
+                  f"{timed(scanner.scan, pages, args.repeat):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
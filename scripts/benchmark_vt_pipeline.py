@@ -0,0 +1,180 @@
+# scripts/benchmark_vt_pipeline.py
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+# Add project root to the Python path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from src.fls_analyzer import mock_virustotal
+
+# Measures the threat analyzer's VT throughput (URLs/hour) against a local
+# mock_virustotal server, once per --concurrency value. Each run drives
+# scripts/2_analyze_threats.py's own ThreatAnalyzer (leasing, lease renewal,
+# the write buffer, storing verdicts and failures) through the shared rate
+# limiter; only the drive-by browser visits and threat feeds are left out.
+# Everything is written to a scratch database, e.g.:
+#   python scripts/benchmark_vt_pipeline.py --urls 1000 --concurrency 10 50 200
+#   python scripts/benchmark_vt_pipeline.py --per-minute 240 --keys 4 --error-rate 0.02
+
+
+class _Drained(Exception):
+    """Every URL of the run has a verdict or a failure."""
+
+
+def load_analyzer():
+    """Imports scripts/2_analyze_threats.py, whose name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(
+        'analyze_threats', os.path.join(PROJECT_ROOT, 'scripts', '2_analyze_threats.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def configure(args, port: int):
+    """
+    Points the analyzer modules at the mock and a scratch database.
+
+    Must run before they are imported: endpoints, keys, quotas and poll
+    timing are read from the environment at import time.
+    """
+    scratch = tempfile.mkdtemp(prefix='fls-vt-bench-')
+    os.environ.update({
+        'FLS_DATABASE_URL': f'sqlite:///{os.path.join(scratch, "bench.db")}',
+        'VT_CACHE_URL': f'sqlite:///{os.path.join(scratch, "vt_cache.db")}',
+        'VT_API_URL': f'http://127.0.0.1:{port}',
+        'VIRUSTOTAL_API_KEYS': ','.join(f'bench-key-{i}' for i in range(args.keys)),
+        # The limiter paces to the mock's quota; without one, it never waits
+        'VT_REQUESTS_PER_MINUTE': str(args.per_minute or 1e9),
+        'VT_REQUESTS_PER_DAY': str(args.per_day or 10 ** 9),
+        'VT_FIRST_POLL_DELAY': str(args.first_poll_delay),
+        'VT_POLL_INTERVAL': str(args.poll_interval),
+    })
+    return scratch
+
+
+async def fetch_stats(port: int) -> Counter:
+    async with aiohttp.ClientSession() as http:
+        async with http.get(f'http://127.0.0.1:{port}/stats') as response:
+            return Counter(await response.json())
+
+
+async def run_once(port: int, run: int, url_count: int, max_in_flight: int, verbose: bool) -> dict:
+    from src.fls_analyzer import db_handler, retries, vt_async
+    from src.fls_analyzer.write_buffer import WriteBuffer
+    analyze_threats = load_analyzer()
+
+    session = db_handler.get_session()
+    # One domain per URL, so neither cache short-circuits a lookup
+    urls = {f'http://run{run}-site{i}.bench.example/watch/{i}' for i in range(url_count)}
+    db_handler.insert_new_urls(session, urls, event_id=1, aggregator_id=None)
+    session.commit()
+
+    buffer = WriteBuffer(session, analyze_threats.WRITE_BUFFER_SIZE, analyze_threats.WRITE_BUFFER_DELAY)
+    analyzer = analyze_threats.ThreatAnalyzer(session, f'bench-{run}', buffer)
+    outcomes = Counter()
+
+    def on_result(url_id, stats, source, payload):
+        outcomes[stats.get('error_kind', retries.ERROR_TRANSIENT) if 'error' in stats else source] += 1
+        analyzer.on_result(url_id, stats, source, payload)
+
+    async def idle():
+        # The analyzer's own idle() waits for more work; a run ends once drained
+        analyzer.flush()
+        raise _Drained()
+
+    before = await fetch_stats(port)
+    pipeline = vt_async.VTPipeline(session, on_result, max_in_flight=max_in_flight)
+    started = time.monotonic()
+    # The analyzer prints a line per URL; keep the run's output to its summary
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+        try:
+            await pipeline.run(analyzer.claim, idle, min_claim=max(1, max_in_flight // 5),
+                               metrics_interval=30, heartbeat=analyzer.renew_leases,
+                               heartbeat_interval=analyze_threats.LEASE_SECONDS / 4)
+        except _Drained:
+            pass
+        finally:
+            analyzer.shutdown()
+    elapsed = time.monotonic() - started
+    server = await fetch_stats(port)
+    server.subtract(before)
+    metrics = pipeline.metrics()
+    session.close()
+    return {
+        'max_in_flight': max_in_flight,
+        'elapsed': elapsed,
+        'analyzed': metrics['completed'],
+        'errors': metrics['errors'],
+        'urls_per_hour': metrics['completed'] / elapsed * 3600 if elapsed else 0.0,
+        'latency_avg': metrics['latency_avg'],
+        'latency_p95': metrics['latency_p95'],
+        'outcomes': dict(outcomes),
+        'requests': server['requests'],
+        'quota_refusals': server['http_429'],
+        'server_errors': sum(count for key, count in server.items()
+                             if key.startswith('http_5')),
+    }
+
+
+async def benchmark(args):
+    app = mock_virustotal.app_from_args(args)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+    port = runner.addresses[0][1]
+    scratch = configure(args, port)
+    print(f"[*] Mock VirusTotal on port {port}; scratch database in {scratch}")
+
+    from src.fls_analyzer import db_handler
+    db_handler.init_db()
+
+    results = []
+    try:
+        for run, max_in_flight in enumerate(args.concurrency):
+            print(f"[*] Run {run + 1}/{len(args.concurrency)}: {args.urls} URLs, {max_in_flight} in flight...")
+            result = await run_once(port, run, args.urls, max_in_flight, args.verbose)
+            results.append(result)
+            print(f"  > {result['analyzed']} analyzed, {result['errors']} failed in {result['elapsed']:.1f}s "
+                  f"({result['urls_per_hour']:.0f} URLs/hour); outcomes {result['outcomes']}")
+    finally:
+        await runner.cleanup()
+
+    print()
+    print("in flight".rjust(10) + "URLs/hour".rjust(12) + "elapsed".rjust(10) + "failed".rjust(8)
+          + "lat avg".rjust(9) + "lat p95".rjust(9) + "requests".rjust(10) + "429s".rjust(7) + "5xx".rjust(6))
+    for r in results:
+        print(f"{r['max_in_flight']:>10}{r['urls_per_hour']:>12.0f}{r['elapsed']:>9.1f}s{r['errors']:>8}"
+              f"{r['latency_avg']:>8.1f}s{r['latency_p95']:>8.1f}s{r['requests']:>10}"
+              f"{r['quota_refusals']:>7}{r['server_errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the VT pipeline against a local mock VirusTotal.")
+    parser.add_argument('--urls', type=int, default=500, help="URLs analyzed per run.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200],
+                        help="max_in_flight for each run.")
+    parser.add_argument('--keys', type=int, default=1, help="API keys to spread requests across.")
+    parser.add_argument('--first-poll-delay', type=float, default=5)
+    parser.add_argument('--poll-interval', type=float, default=2)
+    parser.add_argument('--port', type=int, default=0, help="Mock server port (default: any free port).")
+    parser.add_argument('--verbose', action='store_true', help="Show the analyzer's per-URL output.")
+    mock_virustotal.add_arguments(parser)
+    parser.set_defaults(completion='uniform:5,15')
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
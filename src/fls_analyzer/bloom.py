@@ -0,0 +1,62 @@
+# src/fls_analyzer/bloom.py
+
+import math
+
+from .url_utils import url_hash
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over 64-bit URL hashes.
+
+    Answers "definitely not seen" or "probably seen". Sized from the expected
+    number of items and the target false-positive rate; positions are derived
+    from the two 32-bit halves of the hash (Kirsch-Mitzenmacher double hashing),
+    so each lookup costs a single hash of the URL.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate in (0, 1)")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hash64: int):
+        hash64 &= 0xFFFFFFFFFFFFFFFF
+        h1, h2 = hash64 & 0xFFFFFFFF, (hash64 >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add_hash(self, hash64: int):
+        """Adds a precomputed url_hash() value."""
+        for pos in self._positions(hash64):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def contains_hash(self, hash64: int) -> bool:
+        """Checks a precomputed url_hash() value."""
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(hash64))
+
+    def add(self, url: str):
+        self.add_hash(url_hash(url))
+
+    def __contains__(self, url: str) -> bool:
+        return self.contains_hash(url_hash(url))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def estimated_error_rate(self) -> float:
+        """Expected false-positive rate at the current fill level."""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def report(self) -> str:
+        return (f"{self.count} URLs, {self.memory_bytes / 2**20:.1f} MiB, "
+                f"{self.num_hashes} hashes, est. false-positive rate "
+                f"{self.estimated_error_rate:.2e} (target {self.error_rate:.0e})")
@@ -1,10 +1,24 @@
 # src/fls_analyzer/db_handler.py
 
+import argparse
+import io
+import json
 import os
-from sqlalchemy import (create_engine, Column, Integer, String, Text, 
-                        ForeignKey, DateTime, Boolean, JSON)
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from datetime import datetime
+import socket
+import zlib
+from sqlalchemy import (create_engine, BigInteger, Column, Integer, String, Text, 
+                        ForeignKey, Date, DateTime, Boolean, Float, JSON, Index, LargeBinary,
+                        and_, bindparam, case, func, inspect, literal, or_, select, text, update)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker, declarative_base, declared_attr, relationship
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+from . import retries
+from .url_utils import registered_domain, url_hash
+
+# Database settings may come from the same .env file as the API keys
+load_dotenv()
 
 # Define the base class for declarative models
 Base = declarative_base()
@@ -13,6 +27,35 @@ Base = declarative_base()
 DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
 DB_PATH = os.path.join(DB_DIR, 'fls_data.db')
 
+# Set this to a SQLAlchemy URL (e.g. postgresql+psycopg2://user:pw@host/fls) to
+# use a shared server instead of the local SQLite file.
+DATABASE_URL_ENV = 'FLS_DATABASE_URL'
+# Connections held open per worker process (server databases only)
+DB_POOL_SIZE = int(os.getenv('FLS_DB_POOL_SIZE', '2'))
+DB_MAX_OVERFLOW = int(os.getenv('FLS_DB_MAX_OVERFLOW', '2'))
+
+# Rows per batch when copying an existing database into a new one
+MIGRATION_BATCH_SIZE = 5000
+
+# A URL counts as malicious when more than this many VT vendors flag it
+VT_POSITIVE_THRESHOLD = 5
+
+# Work queue task states
+TASK_PENDING = 'pending'
+TASK_LEASED = 'leased'
+TASK_DONE = 'done'
+# Failed, waiting for next_attempt_at; or given up on (see retries.py)
+TASK_RETRY = 'retry'
+TASK_FAILED = 'failed'
+
+# JSON on SQLite, JSONB (indexable with GIN) on PostgreSQL
+JSONType = JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+# Rows per INSERT batch. Kept well under SQLite's bound-parameter limit.
+INSERT_CHUNK_SIZE = 500
+# Rows per chunk when streaming large query results
+STREAM_CHUNK_SIZE = 10000
+
 
 # --- ORM Models ---
 
@@ -37,53 +80,326 @@ class Aggregator(Base):
     scraped_urls = relationship("ScrapedURL", back_populates="source_aggregator")
 
 
+class Domain(Base):
+    """A registered domain, with rollups maintained incrementally as data arrives."""
+    __tablename__ = 'domains'
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False) # e.g. "streameast.live"
+
+    url_count = Column(Integer, default=0, nullable=False)
+    first_seen = Column(DateTime)
+    last_seen = Column(DateTime)
+    max_vt_score = Column(Integer)
+    publisher_id_count = Column(Integer, default=0, nullable=False)
+
+    # Relationships
+    urls = relationship("ScrapedURL", back_populates="domain")
+
+
+class DomainPublisherID(Base):
+    """Distinct publisher IDs seen on a domain; backs Domain.publisher_id_count."""
+    __tablename__ = 'domain_publisher_ids'
+    domain_id = Column(Integer, ForeignKey('domains.id'), primary_key=True)
+    publisher_id = Column(String, primary_key=True, index=True)
+
+
 class ScrapedURL(Base):
     __tablename__ = 'scraped_urls'
     id = Column(Integer, primary_key=True)
     url = Column(String, unique=True, nullable=False)
+    url_hash = Column(BigInteger, index=True)  # url_utils.url_hash(url)
     event_id = Column(Integer, ForeignKey('events.id'))
     aggregator_id = Column(Integer, ForeignKey('aggregators.id'))
-    first_seen = Column(DateTime, default=datetime.utcnow)
+    domain_id = Column(Integer, ForeignKey('domains.id'), index=True)
+    first_seen = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     event = relationship("Event", back_populates="urls")
+    domain = relationship("Domain", back_populates="urls")
     source_aggregator = relationship("Aggregator", back_populates="scraped_urls")
     security_analysis = relationship("SecurityAnalysis", back_populates="scraped_url", uselist=False, cascade="all, delete-orphan")
     privacy_analysis = relationship("PrivacyAnalysis", back_populates="scraped_url", uselist=False, cascade="all, delete-orphan")
 
 
+class CollectionCycle(Base):
+    __tablename__ = 'collection_cycles'
+    id = Column(Integer, primary_key=True)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime)
+
+
+class URLSighting(Base):
+    """A run of consecutive collection cycles in which an aggregator listed a URL."""
+    __tablename__ = 'url_sightings'
+    id = Column(Integer, primary_key=True)
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), nullable=False)
+    aggregator_id = Column(Integer, ForeignKey('aggregators.id'), nullable=False)
+    first_cycle_id = Column(Integer, ForeignKey('collection_cycles.id'), nullable=False)
+    last_cycle_id = Column(Integer, ForeignKey('collection_cycles.id'), nullable=False)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    sightings = Column(Integer, default=1, nullable=False)
+
+    __table_args__ = (
+        # Lifetime lookups per URL
+        Index('ix_url_sightings_url', 'url_id', 'first_seen', 'last_seen'),
+        # Extending the intervals still open for an aggregator
+        Index('ix_url_sightings_open', 'aggregator_id', 'last_cycle_id', 'url_id'),
+        # Churn: intervals opened / last renewed in a given cycle
+        Index('ix_url_sightings_first_cycle', 'first_cycle_id'),
+        Index('ix_url_sightings_last_cycle', 'last_cycle_id'),
+    )
+
+
 class SecurityAnalysis(Base):
     __tablename__ = 'security_analysis'
     id = Column(Integer, primary_key=True)
     url_id = Column(Integer, ForeignKey('scraped_urls.id'), unique=True, nullable=False)
     
-    vt_score = Column(Integer, default=0)
+    # VirusTotal's malicious count; NULL until VT has analyzed the URL
+    vt_score = Column(Integer)
     is_phishing = Column(Boolean, default=False)
     drive_by_download_detected = Column(Boolean, default=False)
     # TODO: Maybe store full JSON report from Cuckoo? For now, just a path.
     malware_analysis_report = Column(Text)
+    # Set when the URL matched an offline threat-intel feed instead of going to VT
+    intel_feed = Column(String, index=True)
+    intel_match_type = Column(String)  # 'url', 'host' or 'path'
+    intel_indicator = Column(String)
+    phishing_score = Column(Float)  # phishing.PhishingModel probability
+    analyzed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     scraped_url = relationship("ScrapedURL", back_populates="security_analysis")
 
 
+class VTReport(Base):
+    """
+    The full VirusTotal response behind a URL's vt_score, zstd-compressed,
+    so thresholds and engine subsets can be re-evaluated offline (see
+    vt_archive.py). The stats columns are extracted for indexed queries.
+    """
+    __tablename__ = 'vt_reports'
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), primary_key=True)
+    source = Column(String, nullable=False)  # 'analysis', 'report' or 'cache'
+    malicious = Column(Integer, index=True)
+    suspicious = Column(Integer, index=True)
+    harmless = Column(Integer)
+    undetected = Column(Integer)
+    engine_count = Column(Integer)
+    analysis_date = Column(DateTime)
+    fetched_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # None when only the stats were at hand (cached verdicts)
+    payload = Column(LargeBinary)
+
+
 class PrivacyAnalysis(Base):
     __tablename__ = 'privacy_analysis'
     id = Column(Integer, primary_key=True)
     url_id = Column(Integer, ForeignKey('scraped_urls.id'), unique=True, nullable=False)
 
     # Storing the results from different vantage points as a JSON object.
-    vp_analysis_data = Column(JSON)
-    google_publisher_ids = Column(JSON)
+    vp_analysis_data = Column(JSONType)
+    google_publisher_ids = Column(JSONType)
+    analyzed_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     scraped_url = relationship("ScrapedURL", back_populates="privacy_analysis")
 
+    __table_args__ = (
+        # Containment queries (@>, ?) on PostgreSQL; SQLite has no equivalent
+        Index('ix_privacy_analysis_vp_data', 'vp_analysis_data',
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+        Index('ix_privacy_analysis_publisher_ids', 'google_publisher_ids',
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+
+class PublisherIDFinding(Base):
+    """One tracking/publisher ID found on a URL from one vantage point."""
+    __tablename__ = 'publisher_id_findings'
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), primary_key=True)
+    vantage_point = Column(String, primary_key=True) # "CA", "US", ...
+    id_type = Column(String, primary_key=True)       # "GA_UA", "ADSENSE", ...
+    id_value = Column(String, primary_key=True)
+
+    __table_args__ = (
+        # "Which URLs share publisher ID X?"
+        Index('ix_publisher_id_findings_value', 'id_value', 'url_id'),
+    )
+
+
+class FingerprintFinding(Base):
+    """One fingerprinting technique detected on a URL from one vantage point."""
+    __tablename__ = 'fingerprint_findings'
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), primary_key=True)
+    vantage_point = Column(String, primary_key=True)
+    technique = Column(String, primary_key=True)
+
+    __table_args__ = (
+        # "How many pages use technique T (from vantage point V)?"
+        Index('ix_fingerprint_findings_technique', 'technique', 'vantage_point', 'url_id'),
+    )
+
+
+class ScriptVerdict(Base):
+    """
+    The static analysis of one unique script, keyed by the hash of its
+    normalized source (see script_analysis.py).
+    """
+    __tablename__ = 'script_verdicts'
+    script_hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    verdict = Column(JSON, nullable=False)
+    analyzer_version = Column(Integer, nullable=False)
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ThreatSummary(Base):
+    """
+    Per (event, day, aggregator) threat counters behind Table I.
+
+    Maintained in the same transaction as the URL and analysis writes, so
+    report queries scale with the number of groups rather than URLs. Ids are
+    0 when a URL has no event or aggregator.
+    """
+    __tablename__ = 'threat_summary'
+    event_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    aggregator_id = Column(Integer, primary_key=True)
+
+    url_count = Column(Integer, default=0, nullable=False)
+    analyzed_count = Column(Integer, default=0, nullable=False)
+    vt_positive_count = Column(Integer, default=0, nullable=False)
+    # Listed in a threat-intel feed (and so never sent to VT)
+    intel_positive_count = Column(Integer, default=0, nullable=False)
+    phishing_count = Column(Integer, default=0, nullable=False)
+    drive_by_count = Column(Integer, default=0, nullable=False)
+
+
+# Counter columns of ThreatSummary
+SUMMARY_COUNTERS = ('url_count', 'analyzed_count', 'vt_positive_count', 'intel_positive_count',
+                    'phishing_count', 'drive_by_count')
+
+
+class _AnalysisTaskMixin:
+    """Columns shared by the per-analysis work queues."""
+    id = Column(Integer, primary_key=True)
+    state = Column(String, default=TASK_PENDING, nullable=False)
+    lease_owner = Column(String)  # "<hostname>:<pid>" of the worker holding the lease
+    lease_expires_at = Column(DateTime)
+    attempts = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Set when an attempt fails: when to try again, and why it failed
+    next_attempt_at = Column(DateTime)
+    error_kind = Column(String)  # retries.ERROR_QUOTA / ERROR_TRANSIENT / ERROR_PERMANENT
+    last_error = Column(Text)
+
+    @declared_attr
+    def url_id(cls):
+        return Column(Integer, ForeignKey('scraped_urls.id'), unique=True, nullable=False)
+
+
+class SecurityTask(_AnalysisTaskMixin, Base):
+    __tablename__ = 'security_queue'
+    __table_args__ = (Index('ix_security_queue_claim', 'state', 'lease_expires_at', 'id'),
+                      Index('ix_security_queue_retry', 'state', 'next_attempt_at'))
+
+
+class PrivacyTask(_AnalysisTaskMixin, Base):
+    __tablename__ = 'privacy_queue'
+    __table_args__ = (Index('ix_privacy_queue_claim', 'state', 'lease_expires_at', 'id'),
+                      Index('ix_privacy_queue_retry', 'state', 'next_attempt_at'))
+
+
+# Work queue and result model for each analysis type
+ANALYSIS_QUEUES = {
+    'security': (SecurityTask, SecurityAnalysis),
+    'privacy': (PrivacyTask, PrivacyAnalysis),
+}
+
+
+class APIQuota(Base):
+    """
+    Shared token bucket for one API key, see rate_limiter.RateLimiter.
+
+    Keys are stored as a hash, never in clear text.
+    """
+    __tablename__ = 'api_quotas'
+    key_id = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    day = Column(Date, nullable=False)
+    day_count = Column(Integer, default=0, nullable=False)
+
+
+class Download(Base):
+    """A file pushed by an FLS page, stored once however many pages pushed it."""
+    __tablename__ = 'downloads'
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    file_name = Column(String)  # name suggested the first time it was seen
+    storage_path = Column(String, nullable=False)
+    url_count = Column(Integer, default=0, nullable=False)
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_seen = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Sandbox analysis: status is None until submitted, then 'submitted',
+    # 'reported' or 'failed'. The JSON report is stored zlib-compressed.
+    sandbox_status = Column(String, index=True)
+    sandbox_task_id = Column(Integer)
+    sandbox_submitted_at = Column(DateTime)
+    sandbox_score = Column(Float)
+    sandbox_report = Column(LargeBinary)
+    sandbox_error = Column(Text)
+    # Sandbox requests for this payload that failed and were retried
+    sandbox_attempts = Column(Integer, default=0)
+    analyzed_at = Column(DateTime)
+
+
+class URLDownload(Base):
+    """Which URLs pushed which payload."""
+    __tablename__ = 'url_downloads'
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), primary_key=True)
+    sha256 = Column(String(64), ForeignKey('downloads.sha256'), primary_key=True)
+    download_url = Column(Text)
+    file_name = Column(String)
+    seen_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index('ix_url_downloads_sha256_url', 'sha256', 'url_id'),)
+
+
+class PendingVTAnalysis(Base):
+    """A submitted VirusTotal analysis whose result has not been collected yet."""
+    __tablename__ = 'vt_pending_analyses'
+    url_id = Column(Integer, ForeignKey('scraped_urls.id'), primary_key=True)
+    analysis_id = Column(String, nullable=False)
+    submitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 
 # --- Database Session Management ---
 
-def get_engine():
+# One engine (and connection pool) per database URL per process
+_ENGINES = {}
+
+
+def get_database_url() -> str:
+    """Returns the configured database URL, defaulting to the local SQLite file."""
+    return os.getenv(DATABASE_URL_ENV) or f'sqlite:///{DB_PATH}'
+
+
+def get_engine(url: str = None):
     """Initializes the database engine."""
-    os.makedirs(DB_DIR, exist_ok=True)
-    return create_engine(f'sqlite:///{DB_PATH}')
+    url = url or get_database_url()
+    if url not in _ENGINES:
+        if url.startswith('sqlite'):
+            os.makedirs(DB_DIR, exist_ok=True)
+            _ENGINES[url] = create_engine(url)
+        else:
+            _ENGINES[url] = create_engine(
+                url,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_pre_ping=True,
+            )
+    return _ENGINES[url]
 
 def get_session():
     """Provides a database session."""
@@ -92,11 +408,41 @@ def get_session():
     return Session()
 
 
+def database_exists() -> bool:
+    """Checks whether the configured database has been initialized."""
+    return inspect(get_engine()).has_table(Event.__tablename__)
+
+
+def _add_missing_columns(engine) -> list:
+    """
+    Adds columns and indexes introduced after a table was first created.
+
+    Returns the (table, column) names added.
+    """
+    # create_all() only creates missing tables, so existing DBs need this
+    added = []
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+                    added.append((table.name, column.name))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
+
+
 def init_db():
     """Creates database tables from the models."""
     engine = get_engine()
     Base.metadata.create_all(engine)
-    print(f"Database initialized at {DB_PATH}")
+    added_columns = _add_missing_columns(engine)
+    print(f"Database initialized at {engine.url.render_as_string(hide_password=True)}")
     
     # Pre-populate the events table
     session = get_session()
@@ -105,9 +451,1423 @@ def init_db():
     if not session.query(Event).filter_by(name="NHL Stanley Cup 2025").first():
         session.add(Event(name="NHL Stanley Cup 2025"))
     session.commit()
+
+    # Queue URLs collected before the work queues existed
+    for analysis_type, queued in backfill_queues(session).items():
+        if queued:
+            print(f"Queued {queued} existing URLs for {analysis_type} analysis.")
+    session.commit()
+
+    # Retry VT errors stored before failed analyses were retried, and scan
+    # URLs that were given their domain's verdict instead of their own
+    rescheduled = requeue_vt_errors(session)
+    refetch = requeue_domain_fallbacks(session)
+    new_counters = any(table == ThreatSummary.__tablename__ for table, _ in added_columns)
+    if rescheduled or refetch or new_counters:
+        # Neither counts as analyzed any more; a new counter starts out NULL
+        rebuild_threat_summary(session)
+    session.commit()
+    if rescheduled:
+        print(f"Scheduled {rescheduled} URLs with VT errors for another analysis.")
+    if refetch:
+        print(f"Scheduled {refetch} URLs stored with a domain verdict for their own VT analysis.")
+
+    # Hash URLs collected before the url_hash column existed
+    hashed = backfill_url_hashes(session)
+    session.commit()
+    if hashed:
+        print(f"Backfilled url_hash for {hashed} URLs.")
+
+    # Attach URLs collected before the domains table existed
+    backfilled = backfill_domains(session)
+    session.commit()
+    if backfilled:
+        print(f"Backfilled domains for {backfilled} URLs.")
+
+    # Explode privacy results stored before the findings tables existed
+    if (session.query(PrivacyAnalysis.id).first()
+            and not session.query(PublisherIDFinding.url_id).first()
+            and not session.query(FingerprintFinding.url_id).first()):
+        exploded = backfill_privacy_findings(session)
+        session.commit()
+        print(f"Backfilled privacy findings for {exploded} analyzed URLs.")
+
+    # Seed the summary table from existing data the first time
+    if not session.query(ThreatSummary).first():
+        groups = rebuild_threat_summary(session)
+        session.commit()
+        if groups:
+            print(f"Built threat summary for {groups} (event, day, aggregator) groups.")
     session.close()
 
 
+# --- Streaming Queries ---
+
+def iter_keyset(session, query, key_column, chunk_size: int = STREAM_CHUNK_SIZE,
+                key_name: str = None):
+    """
+    Yields the rows of a select() in chunks, using keyset pagination.
+
+    Each chunk is its own indexed range query (key > last ORDER BY key LIMIT n),
+    so memory is bounded by chunk_size, no cursor stays open between chunks
+    and the caller may write to the rows it is iterating over. The query must
+    select key_column, which should be unique and indexed (usually an id);
+    pass key_name if it is selected under a label.
+    """
+    key_name = key_name or key_column.key
+    last_key = None
+    while True:
+        page = query.order_by(key_column).limit(chunk_size)
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+        rows = session.execute(page).all()
+        if not rows:
+            return
+        last_key = getattr(rows[-1], key_name)
+        yield rows
+
+
+def iter_rows(session, query, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Yields the rows of a select() in chunks from a single streaming cursor.
+
+    Uses yield_per, i.e. a server-side cursor on PostgreSQL, which suits
+    read-only scans with arbitrary ordering or joins. Prefer iter_keyset()
+    when writing while iterating.
+    """
+    result = session.execute(query, execution_options={'yield_per': chunk_size})
+    for partition in result.partitions():
+        yield partition
+
+
+# --- Bulk Ingestion ---
+
+def _copy_field(value) -> str:
+    """Formats one value as a PostgreSQL CSV field. NULL is the only unquoted empty field."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_rows(session, table_name: str, columns: list, rows: list):
+    """Streams rows (dicts) into a PostgreSQL table with COPY ... FROM STDIN."""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(','.join(_copy_field(row.get(column)) for column in columns))
+        buf.write('\n')
+    buf.seek(0)
+
+    # Runs on the session's own DBAPI connection, inside its transaction
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY {table_name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buf
+        )
+    finally:
+        cursor.close()
+
+
+def _copy_insert_returning(session, table, rows: list, conflict_column: str, returning: list):
+    """
+    Bulk-inserts rows on PostgreSQL via COPY, skipping conflicts.
+
+    COPY cannot express ON CONFLICT, so rows are copied into a temporary
+    staging table and moved over with INSERT ... SELECT ... ON CONFLICT DO
+    NOTHING RETURNING, which keeps the same semantics as the executemany path.
+    Meant for a whole batch at once: that is three statements however many
+    rows, and the move empties the staging table for the next call.
+    """
+    columns = list(rows[0].keys())
+    column_list = ', '.join(columns)
+    stage = f'_stage_{table.name}'
+
+    session.execute(text(
+        f'CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DROP AS '
+        f'SELECT {column_list} FROM {table.name} WITH NO DATA'
+    ))
+    _copy_rows(session, stage, columns, rows)
+    return session.execute(text(
+        f'WITH staged AS (DELETE FROM {stage} RETURNING {column_list}) '
+        f'INSERT INTO {table.name} ({column_list}) '
+        f'SELECT {column_list} FROM staged ORDER BY {conflict_column} '
+        f'ON CONFLICT ({conflict_column}) DO NOTHING '
+        f'RETURNING {", ".join(returning)}'
+    ))
+
+
+def _dialect_insert(session):
+    """Returns the dialect-specific insert() construct that supports ON CONFLICT."""
+    if session.bind.dialect.name == 'postgresql':
+        return postgresql.insert
+    return sqlite.insert
+
+
+def _chunked(items, size: int):
+    """Yields successive lists of at most `size` items."""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def insert_new_urls(session, urls, event_id: int, aggregator_id: int,
+                    chunk_size: int = INSERT_CHUNK_SIZE) -> dict:
+    """
+    Inserts scraped URLs, skipping any that are already stored.
+
+    Each chunk is a single INSERT ... ON CONFLICT (url) DO NOTHING RETURNING
+    round trip, so concurrent collectors never abort a batch on the unique
+    constraint. Works on both SQLite (3.35+) and PostgreSQL; on PostgreSQL
+    the whole batch is copied and inserted at once. New rows are
+    linked to their domain, the domain rollups are updated and the URLs are
+    queued for every analysis type.
+
+    Args:
+        session: An open database session. The caller commits.
+        urls: An iterable of URL strings.
+        event_id: The event the URLs were collected for.
+        aggregator_id: The aggregator the URLs were scraped from.
+        chunk_size: Maximum number of rows per INSERT (per domain lookup
+            when copying).
+
+    Returns:
+        A dict of {url: id} for the rows that were actually inserted.
+    """
+    table = ScrapedURL.__table__
+    stmt = (
+        _dialect_insert(session)(table)
+        .on_conflict_do_nothing(index_elements=['url'])
+        .returning(table.c.id, table.c.url)
+    )
+    now = datetime.utcnow()
+
+    inserted = {}
+    # Sorting gives concurrent writers a consistent lock order on PostgreSQL.
+    urls = sorted(set(urls))
+    use_copy = session.bind.dialect.name == 'postgresql' and urls
+    # COPY pays off per batch, not per chunk: only the domain lookups are chunked then
+    for batch in ([urls] if use_copy else _chunked(urls, chunk_size)):
+        url_domains = {url: registered_domain(url) for url in batch}
+        domain_ids = {}
+        for names in _chunked(sorted(filter(None, set(url_domains.values()))), chunk_size):
+            domain_ids.update(_ensure_domains(session, names))
+        rows = [
+            {'url': url, 'url_hash': url_hash(url), 'event_id': event_id,
+             'aggregator_id': aggregator_id, 'domain_id': domain_ids.get(url_domains[url]),
+             'first_seen': now}
+            for url in batch
+        ]
+
+        if use_copy:
+            result = _copy_insert_returning(session, table, rows, 'url', ['id', 'url'])
+        else:
+            result = session.execute(stmt, rows)
+
+        new_per_domain = {}
+        for row in result:
+            inserted[row.url] = row.id
+            domain_id = domain_ids.get(url_domains[row.url])
+            if domain_id is not None:
+                new_per_domain[domain_id] = new_per_domain.get(domain_id, 0) + 1
+
+        _bump_domain_counts(session, {
+            domain_id: (count, now, now) for domain_id, count in new_per_domain.items()
+        })
+
+    if inserted:
+        _bump_threat_summary(session, {
+            (event_id or 0, now.date(), aggregator_id or 0): {'url_count': len(inserted)}
+        })
+    enqueue_urls(session, inserted.values())
+    return inserted
+
+
+def get_url_ids(session, urls, chunk_size: int = INSERT_CHUNK_SIZE) -> dict:
+    """
+    Resolves URL strings to their scraped_urls ids.
+
+    Looks rows up through the integer url_hash index rather than the string
+    one; the URL itself is compared afterwards to rule out hash collisions.
+    """
+    table = ScrapedURL.__table__
+    wanted = set(urls)
+    ids = {}
+    for chunk in _chunked(wanted, chunk_size):
+        hashes = [url_hash(url) for url in chunk]
+        for row in session.execute(select(table.c.id, table.c.url).where(table.c.url_hash.in_(hashes))):
+            if row.url in wanted:
+                ids[row.url] = row.id
+    return ids
+
+
+def iter_url_hashes(session, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yields the url_hash of every stored URL, streaming in chunks."""
+    query = select(ScrapedURL.url_hash).where(ScrapedURL.url_hash != None)
+    for rows in iter_rows(session, query, chunk_size):
+        for row in rows:
+            yield row.url_hash
+
+
+def backfill_url_hashes(session, chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    """Fills url_hash for URLs stored before the column existed. Returns the count."""
+    urls = ScrapedURL.__table__
+    assign = (
+        update(urls).where(urls.c.id == bindparam('b_id'))
+        .values(url_hash=bindparam('b_hash'))
+    )
+    updated = 0
+    missing = select(urls.c.id, urls.c.url).where(urls.c.url_hash == None)
+    for rows in iter_keyset(session, missing, urls.c.id, chunk_size):
+        session.execute(assign, [{'b_id': row.id, 'b_hash': url_hash(row.url)} for row in rows])
+        updated += len(rows)
+    return updated
+
+
+# --- URL Sightings ---
+
+def start_collection_cycle(session) -> CollectionCycle:
+    """Opens a new collection cycle and returns it."""
+    cycle = CollectionCycle(started_at=datetime.utcnow())
+    session.add(cycle)
+    session.flush()
+    return cycle
+
+
+def finish_collection_cycle(session, cycle: CollectionCycle):
+    """Marks a collection cycle as finished."""
+    cycle.finished_at = datetime.utcnow()
+    session.flush()
+
+
+def record_sightings(session, cycle_id: int, aggregator_id: int, urls,
+                     seen_at: datetime = None, chunk_size: int = INSERT_CHUNK_SIZE) -> set:
+    """
+    Records that an aggregator listed the given URLs during a collection cycle.
+
+    Sightings are coalesced into intervals: if the URL was also listed by this
+    aggregator in the aggregator's previous cycle, that interval is extended;
+    otherwise a new interval is opened. The table therefore grows with the
+    number of (re)appearances, not with the number of cycles. Recording the
+    same cycle twice is a no-op.
+
+    URLs are resolved to their ids inside the sighting statements, through
+    the url_hash index, so callers don't need a separate get_url_ids() round
+    trip for links they already know are stored.
+
+    Args:
+        session: An open database session. The caller commits.
+        cycle_id: The current collection cycle.
+        aggregator_id: The aggregator the URLs were listed on.
+        urls: An iterable of URL strings.
+        seen_at: Observation time. Defaults to now.
+        chunk_size: Maximum number of URLs per statement.
+
+    Returns:
+        The set of URLs that are not stored, and so were not recorded.
+    """
+    table = URLSighting.__table__
+    urls_table = ScrapedURL.__table__
+    seen_at = seen_at or datetime.utcnow()
+
+    # The aggregator's previous cycle, so a failed scrape in between doesn't split intervals
+    prev_cycle_id = session.execute(
+        select(func.max(table.c.last_cycle_id))
+        .where(table.c.aggregator_id == aggregator_id, table.c.last_cycle_id < cycle_id)
+    ).scalar()
+
+    missing = set()
+    for chunk in _chunked(sorted(set(urls)), chunk_size):
+        hashes = [url_hash(url) for url in chunk]
+        if prev_cycle_id is not None:
+            session.execute(
+                update(table)
+                .where(table.c.aggregator_id == aggregator_id,
+                       table.c.last_cycle_id == prev_cycle_id,
+                       table.c.url_id.in_(
+                           select(urls_table.c.id)
+                           .where(urls_table.c.url_hash.in_(hashes), urls_table.c.url.in_(chunk))
+                       ))
+                .values(last_cycle_id=cycle_id, last_seen=seen_at,
+                        sightings=table.c.sightings + 1)
+            )
+
+        # Each stored URL's id, and whether it already has this cycle's interval
+        wanted = set(chunk)
+        ids, current = {}, set()
+        for row in session.execute(
+            select(urls_table.c.id, urls_table.c.url, table.c.url_id.label('current'))
+            .outerjoin(table, and_(table.c.url_id == urls_table.c.id,
+                                   table.c.aggregator_id == aggregator_id,
+                                   table.c.last_cycle_id == cycle_id))
+            .where(urls_table.c.url_hash.in_(hashes))
+        ):
+            if row.url in wanted:
+                ids[row.url] = row.id
+                if row.current is not None:
+                    current.add(row.id)
+        missing.update(wanted - ids.keys())
+
+        rows = [
+            {'url_id': url_id, 'aggregator_id': aggregator_id,
+             'first_cycle_id': cycle_id, 'last_cycle_id': cycle_id,
+             'first_seen': seen_at, 'last_seen': seen_at, 'sightings': 1}
+            for url_id in sorted(set(ids.values()) - current)
+        ]
+        if rows:
+            session.execute(table.insert(), rows)
+
+        if ids:
+            _touch_domains(session, list(ids.values()), seen_at)
+    return missing
+
+
+def get_link_lifetimes(session, url_ids):
+    """
+    Returns per-URL lifetime statistics from the sightings log.
+
+    Each row has url_id, first_seen, last_seen, aggregator_count (distinct
+    aggregators that listed it), intervals (number of separate appearances)
+    and sightings (total cycles observed). Served by the url_id index.
+    """
+    table = URLSighting.__table__
+    results = []
+    for chunk in _chunked(set(url_ids), INSERT_CHUNK_SIZE):
+        results.extend(session.execute(
+            select(
+                table.c.url_id,
+                func.min(table.c.first_seen).label('first_seen'),
+                func.max(table.c.last_seen).label('last_seen'),
+                func.count(func.distinct(table.c.aggregator_id)).label('aggregator_count'),
+                func.count().label('intervals'),
+                func.sum(table.c.sightings).label('sightings'),
+            )
+            .where(table.c.url_id.in_(chunk))
+            .group_by(table.c.url_id)
+        ).all())
+    return results
+
+
+def get_cycle_churn(session, cycle_id: int) -> dict:
+    """
+    Summarizes link churn for one collection cycle.
+
+    Returns a dict with the number of listings that appeared (intervals opened
+    in this cycle), persisted (intervals renewed from an earlier cycle) and
+    disappeared (intervals last renewed in the previous cycle but not in this
+    one). All three are served by the cycle indexes.
+    """
+    table = URLSighting.__table__
+    prev_cycle_id = session.execute(
+        select(func.max(CollectionCycle.id)).where(CollectionCycle.id < cycle_id)
+    ).scalar()
+
+    appeared = session.execute(
+        select(func.count()).where(table.c.first_cycle_id == cycle_id)
+    ).scalar()
+    persisted = session.execute(
+        select(func.count()).where(table.c.last_cycle_id == cycle_id,
+                                   table.c.first_cycle_id < cycle_id)
+    ).scalar()
+    disappeared = 0
+    if prev_cycle_id is not None:
+        disappeared = session.execute(
+            select(func.count()).where(table.c.last_cycle_id == prev_cycle_id)
+        ).scalar()
+
+    return {'appeared': appeared, 'persisted': persisted, 'disappeared': disappeared}
+
+
+# --- Domain Rollups ---
+
+def _ensure_domains(session, names) -> dict:
+    """Creates any missing domains and returns a {name: id} dict."""
+    names = sorted(name for name in names if name)
+    if not names:
+        return {}
+    table = Domain.__table__
+    stmt = _dialect_insert(session)(table).on_conflict_do_nothing(index_elements=['name'])
+    session.execute(stmt, [{'name': name, 'url_count': 0, 'publisher_id_count': 0} for name in names])
+    return {
+        row.name: row.id
+        for row in session.execute(select(table.c.id, table.c.name).where(table.c.name.in_(names)))
+    }
+
+
+def _bump_domain_counts(session, updates: dict):
+    """
+    Applies {domain_id: (new_url_count, first_seen, last_seen)} to the domain rollups.
+    """
+    if not updates:
+        return
+    table = Domain.__table__
+    first, last = bindparam('b_first'), bindparam('b_last')
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam('b_id'))
+        .values(
+            url_count=table.c.url_count + bindparam('b_count'),
+            first_seen=case((or_(table.c.first_seen == None, table.c.first_seen > first), first),
+                            else_=table.c.first_seen),
+            last_seen=case((or_(table.c.last_seen == None, table.c.last_seen < last), last),
+                           else_=table.c.last_seen),
+        )
+    )
+    session.execute(stmt, [
+        {'b_id': domain_id, 'b_count': count, 'b_first': first_seen, 'b_last': last_seen}
+        for domain_id, (count, first_seen, last_seen) in sorted(updates.items())
+    ])
+
+
+def _touch_domains(session, url_ids, seen_at: datetime):
+    """Advances last_seen for the domains of the given URLs."""
+    table = Domain.__table__
+    domain_ids = select(ScrapedURL.__table__.c.domain_id).where(ScrapedURL.__table__.c.id.in_(url_ids))
+    session.execute(
+        update(table)
+        .where(table.c.id.in_(domain_ids),
+               or_(table.c.last_seen == None, table.c.last_seen < seen_at))
+        .values(last_seen=seen_at)
+    )
+
+
+def update_domain_vt_score(session, url_id: int, vt_score: int):
+    """Raises the max_vt_score of the URL's domain if this score is higher."""
+    if vt_score is None or vt_score < 0:
+        return
+    table = Domain.__table__
+    domain_id = select(ScrapedURL.__table__.c.domain_id).where(ScrapedURL.__table__.c.id == url_id)
+    session.execute(
+        update(table)
+        .where(table.c.id == domain_id.scalar_subquery(),
+               or_(table.c.max_vt_score == None, table.c.max_vt_score < vt_score))
+        .values(max_vt_score=vt_score)
+    )
+
+
+def add_domain_publisher_ids(session, url_id: int, publisher_ids) -> int:
+    """
+    Records publisher IDs found on a URL against its domain.
+
+    Returns the number of IDs that were new for the domain; only those are
+    added to Domain.publisher_id_count.
+    """
+    publisher_ids = sorted(set(publisher_ids or []))
+    domain_id = session.execute(
+        select(ScrapedURL.__table__.c.domain_id).where(ScrapedURL.__table__.c.id == url_id)
+    ).scalar()
+    if domain_id is None or not publisher_ids:
+        return 0
+
+    link = DomainPublisherID.__table__
+    stmt = (
+        _dialect_insert(session)(link)
+        .on_conflict_do_nothing(index_elements=['domain_id', 'publisher_id'])
+        .returning(link.c.publisher_id)
+    )
+    added = len(session.execute(stmt, [
+        {'domain_id': domain_id, 'publisher_id': publisher_id} for publisher_id in publisher_ids
+    ]).all())
+
+    if added:
+        table = Domain.__table__
+        session.execute(
+            update(table).where(table.c.id == domain_id)
+            .values(publisher_id_count=table.c.publisher_id_count + added)
+        )
+    return added
+
+
+def backfill_domains(session, chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    """
+    Links URLs without a domain to one and folds them into the domain rollups.
+
+    Walks scraped_urls in id order one chunk at a time, so it is safe to run
+    on a large DB and cheap to re-run. Returns the number of URLs updated.
+    """
+    urls = ScrapedURL.__table__
+    assign = (
+        update(urls).where(urls.c.id == bindparam('b_id'))
+        .values(domain_id=bindparam('b_domain_id'))
+    )
+
+    updated = 0
+    missing = select(urls.c.id, urls.c.url, urls.c.first_seen).where(urls.c.domain_id == None)
+    for rows in iter_keyset(session, missing, urls.c.id, chunk_size):
+        url_domains = {row.id: registered_domain(row.url) for row in rows}
+        domain_ids = _ensure_domains(session, set(url_domains.values()))
+
+        assignments, rollups = [], {}
+        for row in rows:
+            domain_id = domain_ids.get(url_domains[row.id])
+            if domain_id is None:
+                continue
+            assignments.append({'b_id': row.id, 'b_domain_id': domain_id})
+            seen = row.first_seen or datetime.utcnow()
+            count, first_seen, last_seen = rollups.get(domain_id, (0, seen, seen))
+            rollups[domain_id] = (count + 1, min(first_seen, seen), max(last_seen, seen))
+        if not assignments:
+            continue
+
+        session.execute(assign, assignments)
+        _bump_domain_counts(session, rollups)
+
+        # Fold in results the analyzers already stored for these URLs
+        url_ids = [a['b_id'] for a in assignments]
+        for url_id, vt_score in session.execute(
+            select(SecurityAnalysis.url_id, SecurityAnalysis.vt_score)
+            .where(SecurityAnalysis.url_id.in_(url_ids))
+        ):
+            update_domain_vt_score(session, url_id, vt_score)
+        for url_id, publisher_ids in session.execute(
+            select(PrivacyAnalysis.url_id, PrivacyAnalysis.google_publisher_ids)
+            .where(PrivacyAnalysis.url_id.in_(url_ids))
+        ):
+            add_domain_publisher_ids(session, url_id, publisher_ids)
+
+        updated += len(assignments)
+    return updated
+
+
+# --- Threat Summary ---
+
+def _bump_threat_summary(session, deltas: dict):
+    """
+    Adds {(event_id, day, aggregator_id): {counter: delta}} to the summary rows,
+    creating them as needed, with INSERT ... ON CONFLICT DO UPDATE.
+    """
+    if not deltas:
+        return
+    table = ThreatSummary.__table__
+    stmt = _dialect_insert(session)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['event_id', 'day', 'aggregator_id'],
+        set_={name: table.c[name] + stmt.excluded[name] for name in SUMMARY_COUNTERS},
+    )
+    session.execute(stmt, [
+        {'event_id': event_id, 'day': day, 'aggregator_id': aggregator_id,
+         **{name: delta.get(name, 0) for name in SUMMARY_COUNTERS}}
+        for (event_id, day, aggregator_id), delta in sorted(deltas.items())
+    ])
+
+
+def _threat_flags(record: SecurityAnalysis) -> dict:
+    """
+    The summary counters a single security verdict contributes.
+
+    A record only counts as analyzed once it holds a VT score or a feed
+    match; one created for a phishing score or a drive-by visit alone does not.
+    """
+    return {
+        'analyzed_count': int(record.vt_score is not None or record.intel_feed is not None),
+        'vt_positive_count': int(record.vt_score is not None and record.vt_score > VT_POSITIVE_THRESHOLD),
+        'intel_positive_count': int(record.intel_feed is not None),
+        'phishing_count': int(bool(record.is_phishing)),
+        'drive_by_count': int(bool(record.drive_by_download_detected)),
+    }
+
+
+def _get_security_record(session, url_id: int):
+    """
+    Returns (record, its current summary flags), creating the record if needed.
+
+    A new record has no VT score until record_security_result() stores one.
+    """
+    record = session.query(SecurityAnalysis).filter_by(url_id=url_id).one_or_none()
+    if record is None:
+        record = SecurityAnalysis(url_id=url_id)
+        session.add(record)
+        return record, {}
+    return record, _threat_flags(record)
+
+
+def _apply_threat_delta(session, url_id: int, record: SecurityAnalysis, old_flags: dict):
+    """Applies the change in a record's summary flags to the threat summary."""
+    new_flags = _threat_flags(record)
+    delta = {name: new_flags[name] - old_flags.get(name, 0) for name in new_flags}
+    if any(delta.values()):
+        url = session.execute(
+            select(ScrapedURL.event_id, ScrapedURL.aggregator_id, ScrapedURL.first_seen)
+            .where(ScrapedURL.id == url_id)
+        ).one()
+        day = (url.first_seen or datetime.utcnow()).date()
+        _bump_threat_summary(session, {(url.event_id or 0, day, url.aggregator_id or 0): delta})
+
+
+def record_security_result(session, url_id: int, vt_score: int, is_phishing: bool = None,
+                           drive_by_download_detected: bool = None, intel_feed: str = None,
+                           intel_match_type: str = None, intel_indicator: str = None) -> SecurityAnalysis:
+    """
+    Stores (or updates) a URL's security verdict.
+
+    vt_score is None for URLs judged from a threat-intel feed match, whose
+    provenance is kept in the intel_* columns. is_phishing and
+    drive_by_download_detected are left as they are unless given, since the
+    phishing classifier and record_downloads() set them separately.
+
+    The threat summary and the domain's max VT score are updated in the same
+    transaction. When a verdict is overwritten, only the difference to the
+    previous one is applied to the summary. The caller commits.
+    """
+    record, old_flags = _get_security_record(session, url_id)
+
+    record.vt_score = vt_score
+    if is_phishing is not None:
+        record.is_phishing = is_phishing
+    if drive_by_download_detected is not None:
+        record.drive_by_download_detected = drive_by_download_detected
+    record.intel_feed = intel_feed
+    record.intel_match_type = intel_match_type
+    record.intel_indicator = intel_indicator
+
+    _apply_threat_delta(session, url_id, record, old_flags)
+    update_domain_vt_score(session, url_id, vt_score)
+    session.flush()
+    return record
+
+
+def record_phishing_result(session, url_id: int, phishing_score: float,
+                           is_phishing: bool) -> SecurityAnalysis:
+    """
+    Stores the phishing classifier's verdict for a URL.
+
+    Only the phishing fields are touched, so it may run before or after the
+    VT verdict is stored. A URL flagged by a phishing feed stays flagged.
+    The caller commits.
+    """
+    record, old_flags = _get_security_record(session, url_id)
+    record.phishing_score = phishing_score
+    record.is_phishing = bool(is_phishing or (record.intel_feed and record.is_phishing))
+    _apply_threat_delta(session, url_id, record, old_flags)
+    session.flush()
+    return record
+
+
+def record_downloads(session, url_id: int, downloads) -> list:
+    """
+    Records the files a URL pushed during a visit and flags it as a drive-by.
+
+    Each payload is a row in `downloads` keyed by its SHA-256, created the
+    first time any page pushes it; url_downloads links it to the URL. The
+    caller commits.
+
+    Args:
+        downloads: drive_by.CapturedDownload tuples (or anything with the
+            same attributes).
+
+    Returns:
+        The hashes that were new to the downloads table, i.e. still to be analyzed.
+    """
+    downloads = list({d.sha256: d for d in downloads}.values())
+    record, old_flags = _get_security_record(session, url_id)
+    if downloads:
+        record.drive_by_download_detected = True
+    elif record.drive_by_download_detected is None:
+        record.drive_by_download_detected = False
+    _apply_threat_delta(session, url_id, record, old_flags)
+    if not downloads:
+        session.flush()
+        return []
+
+    insert = _dialect_insert(session)
+    now = datetime.utcnow()
+    new_hashes = [
+        row.sha256 for row in session.execute(
+            insert(Download.__table__).on_conflict_do_nothing().returning(Download.__table__.c.sha256),
+            [{'sha256': d.sha256, 'size': d.size, 'file_name': d.file_name,
+              'storage_path': d.storage_path, 'url_count': 0, 'first_seen': now, 'last_seen': now}
+             for d in downloads],
+        )
+    ]
+    linked = [
+        row.sha256 for row in session.execute(
+            insert(URLDownload.__table__).on_conflict_do_nothing().returning(URLDownload.__table__.c.sha256),
+            [{'url_id': url_id, 'sha256': d.sha256, 'download_url': d.download_url,
+              'file_name': d.file_name, 'seen_at': now} for d in downloads],
+        )
+    ]
+    if linked:
+        table = Download.__table__
+        session.execute(
+            update(table).where(table.c.sha256.in_(linked))
+            .values(url_count=table.c.url_count + 1, last_seen=now)
+        )
+    session.flush()
+    return new_hashes
+
+
+def rebuild_threat_summary(session) -> int:
+    """
+    Recomputes the whole threat summary from scraped_urls and security_analysis.
+
+    The analyzers keep the summary current as they write, so this is only
+    needed to seed it or to repair drift. Returns the number of groups.
+    """
+    urls = ScrapedURL.__table__
+    results = SecurityAnalysis.__table__
+    table = ThreatSummary.__table__
+
+    def count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    event_id = func.coalesce(urls.c.event_id, 0)
+    day = func.date(urls.c.first_seen)
+    aggregator_id = func.coalesce(urls.c.aggregator_id, 0)
+    groups = (
+        select(
+            event_id, day, aggregator_id,
+            func.count(urls.c.id),
+            count_if(or_(results.c.vt_score != None, results.c.intel_feed != None)),
+            count_if(results.c.vt_score > VT_POSITIVE_THRESHOLD),
+            count_if(results.c.intel_feed != None),
+            count_if(results.c.is_phishing == True),
+            count_if(results.c.drive_by_download_detected == True),
+        )
+        .select_from(urls.outerjoin(results, results.c.url_id == urls.c.id))
+        .where(urls.c.first_seen != None)
+        .group_by(event_id, day, aggregator_id)
+    )
+
+    session.execute(table.delete())
+    result = session.execute(
+        table.insert().from_select(['event_id', 'day', 'aggregator_id', *SUMMARY_COUNTERS], groups)
+    )
+    return result.rowcount
+
+
+def get_threat_summary(session) -> list:
+    """Returns the summary rows labelled with event names and aggregator URLs."""
+    table = ThreatSummary.__table__
+    return session.execute(
+        select(
+            Event.name.label('event_name'),
+            table.c.day,
+            Aggregator.url.label('aggregator_url'),
+            *[table.c[name] for name in SUMMARY_COUNTERS],
+        )
+        .select_from(table)
+        .outerjoin(Event, Event.id == table.c.event_id)
+        .outerjoin(Aggregator, Aggregator.id == table.c.aggregator_id)
+        .order_by(table.c.day)
+    ).all()
+
+
+# --- Privacy Findings ---
+
+def _findings_rows(url_id: int, vp_analysis_data: dict) -> tuple:
+    """Explodes one URL's per-VP results into publisher ID and fingerprinting rows."""
+    id_rows, technique_rows = set(), set()
+    for vantage_point, data in (vp_analysis_data or {}).items():
+        for id_type, values in data.get('google_ids', {}).items():
+            for value in values:
+                id_rows.add((url_id, vantage_point, id_type, value))
+        for technique in data.get('fingerprinting_techniques', []):
+            technique_rows.add((url_id, vantage_point, technique))
+    return id_rows, technique_rows
+
+
+def _insert_findings(session, id_rows, technique_rows, chunk_size: int = INSERT_CHUNK_SIZE):
+    """Bulk-inserts finding tuples, ignoring any that are already stored."""
+    for model, columns, rows in (
+        (PublisherIDFinding, ('url_id', 'vantage_point', 'id_type', 'id_value'), id_rows),
+        (FingerprintFinding, ('url_id', 'vantage_point', 'technique'), technique_rows),
+    ):
+        stmt = _dialect_insert(session)(model.__table__).on_conflict_do_nothing()
+        for chunk in _chunked(sorted(rows), chunk_size):
+            session.execute(stmt, [dict(zip(columns, row)) for row in chunk])
+
+
+def record_privacy_result(session, url_id: int, vp_analysis_data: dict,
+                          google_publisher_ids: list) -> PrivacyAnalysis:
+    """
+    Stores a URL's privacy analysis.
+
+    Besides the raw per-VP JSON, every ID and fingerprinting technique is
+    written as an indexed row in publisher_id_findings / fingerprint_findings,
+    and the domain's publisher-ID rollup is updated. The caller commits.
+    """
+    record = PrivacyAnalysis(
+        url_id=url_id,
+        vp_analysis_data=vp_analysis_data,
+        google_publisher_ids=google_publisher_ids,
+    )
+    session.add(record)
+    _insert_findings(session, *_findings_rows(url_id, vp_analysis_data))
+    add_domain_publisher_ids(session, url_id, google_publisher_ids)
+    session.flush()
+    return record
+
+
+def backfill_privacy_findings(session, chunk_size: int = INSERT_CHUNK_SIZE) -> int:
+    """
+    Explodes the JSON of existing privacy_analysis rows into the findings tables.
+
+    Rows are streamed in id order one chunk at a time and inserts ignore
+    duplicates, so this is safe to re-run. Returns the number of rows read.
+    """
+    table = PrivacyAnalysis.__table__
+    processed = 0
+    query = select(table.c.id, table.c.url_id, table.c.vp_analysis_data)
+    for rows in iter_keyset(session, query, table.c.id, chunk_size):
+        id_rows, technique_rows = set(), set()
+        for row in rows:
+            ids, techniques = _findings_rows(row.url_id, row.vp_analysis_data)
+            id_rows |= ids
+            technique_rows |= techniques
+        _insert_findings(session, id_rows, technique_rows)
+        processed += len(rows)
+    return processed
+
+
+def get_urls_sharing_id(session, id_value: str) -> list:
+    """Returns the URLs on which a publisher/tracking ID was found (any vantage point)."""
+    findings = PublisherIDFinding.__table__
+    url_ids = select(findings.c.url_id).where(findings.c.id_value == id_value).distinct()
+    return session.execute(
+        select(ScrapedURL.id, ScrapedURL.url).where(ScrapedURL.id.in_(url_ids)).order_by(ScrapedURL.id)
+    ).all()
+
+
+def count_urls_with_technique(session, technique: str, vantage_point: str = None) -> int:
+    """Counts URLs on which a fingerprinting technique was seen, optionally from one VP."""
+    findings = FingerprintFinding.__table__
+    query = select(func.count(func.distinct(findings.c.url_id))).where(findings.c.technique == technique)
+    if vantage_point:
+        query = query.where(findings.c.vantage_point == vantage_point)
+    return session.execute(query).scalar()
+
+
+# --- VirusTotal Reports ---
+
+def record_vt_report(session, url_id: int, source: str, stats: dict, payload: bytes = None,
+                     engine_count: int = None, analysis_date: datetime = None):
+    """Stores (or replaces) a URL's archived VT response. The caller commits."""
+    table = VTReport.__table__
+    row = {
+        'url_id': url_id, 'source': source,
+        'malicious': stats.get('malicious'), 'suspicious': stats.get('suspicious'),
+        'harmless': stats.get('harmless'), 'undetected': stats.get('undetected'),
+        'engine_count': engine_count, 'analysis_date': analysis_date,
+        'fetched_at': datetime.utcnow(), 'payload': payload,
+    }
+    stmt = _dialect_insert(session)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['url_id'],
+        set_={name: stmt.excluded[name] for name in row if name != 'url_id'},
+    )
+    session.execute(stmt, row)
+
+
+# --- Script Verdicts ---
+
+def get_script_verdicts(session, script_hashes, analyzer_version: int) -> dict:
+    """Returns {script_hash: verdict} for the hashes analyzed by this analyzer version."""
+    table = ScriptVerdict.__table__
+    verdicts = {}
+    for chunk in _chunked(list(script_hashes), INSERT_CHUNK_SIZE):
+        rows = session.execute(
+            select(table.c.script_hash, table.c.verdict)
+            .where(table.c.script_hash.in_(chunk), table.c.analyzer_version == analyzer_version)
+        )
+        verdicts.update((row.script_hash, row.verdict) for row in rows)
+    return verdicts
+
+
+def store_script_verdicts(session, verdicts: dict, analyzer_version: int):
+    """
+    Stores {script_hash: (size, verdict)}, replacing verdicts from older
+    analyzer versions. The caller commits.
+    """
+    if not verdicts:
+        return
+    table = ScriptVerdict.__table__
+    stmt = _dialect_insert(session)(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['script_hash'],
+        set_={'verdict': stmt.excluded.verdict, 'analyzer_version': stmt.excluded.analyzer_version},
+    )
+    now = datetime.utcnow()
+    rows = [{'script_hash': script_hash, 'size': size, 'verdict': verdict,
+             'analyzer_version': analyzer_version, 'first_seen': now}
+            for script_hash, (size, verdict) in sorted(verdicts.items())]
+    for chunk in _chunked(rows, INSERT_CHUNK_SIZE):
+        session.execute(stmt, chunk)
+
+
+# --- Analysis Work Queues ---
+
+def default_worker_id() -> str:
+    """Identifies this process as a lease owner."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_urls(session, url_ids, analysis_types=tuple(ANALYSIS_QUEUES),
+                 chunk_size: int = INSERT_CHUNK_SIZE):
+    """Adds URLs to the work queue of each analysis type. Already queued URLs are skipped."""
+    url_ids = sorted(set(url_ids))
+    if not url_ids:
+        return
+    now = datetime.utcnow()
+    for analysis_type in analysis_types:
+        table = ANALYSIS_QUEUES[analysis_type][0].__table__
+        stmt = _dialect_insert(session)(table).on_conflict_do_nothing(index_elements=['url_id'])
+        for chunk in _chunked(url_ids, chunk_size):
+            session.execute(stmt, [
+                {'url_id': url_id, 'state': TASK_PENDING, 'attempts': 0, 'updated_at': now}
+                for url_id in chunk
+            ])
+
+
+def backfill_queues(session) -> dict:
+    """
+    Queues every URL that has neither a task nor a result yet.
+
+    This is the old anti-join, run once when the queues are introduced
+    rather than on every poll. Returns {analysis_type: rows_queued}.
+    """
+    urls = ScrapedURL.__table__
+    now = datetime.utcnow()
+    queued = {}
+    for analysis_type, (task_model, result_model) in ANALYSIS_QUEUES.items():
+        table, results = task_model.__table__, result_model.__table__
+        missing = (
+            select(urls.c.id, literal(TASK_PENDING), literal(0), literal(now, DateTime))
+            .where(~select(table.c.id).where(table.c.url_id == urls.c.id).exists())
+            .where(~select(results.c.id).where(results.c.url_id == urls.c.id).exists())
+        )
+        stmt = (
+            _dialect_insert(session)(table)
+            .from_select(['url_id', 'state', 'attempts', 'updated_at'], missing)
+            .on_conflict_do_nothing(index_elements=['url_id'])
+        )
+        queued[analysis_type] = session.execute(stmt).rowcount
+    return queued
+
+
+def claim_tasks(session, analysis_type: str, worker_id: str, limit: int,
+                lease_seconds: int) -> list:
+    """
+    Atomically leases up to `limit` URLs from an analysis queue.
+
+    Pending tasks and tasks whose lease has expired (a crashed worker) are
+    both claimable. An expired task that has used up its
+    retries.RETRY_MAX_ATTEMPTS is marked failed instead, so a URL that kills
+    its worker every time is not handed out forever. The claim is a single
+    UPDATE ... RETURNING, with the candidate rows selected FOR UPDATE SKIP
+    LOCKED on PostgreSQL, so any number of workers can claim concurrently
+    without overlap. The claim is committed immediately.
+
+    Returns:
+        The list of claimed url_ids.
+    """
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    now = datetime.utcnow()
+    expired = and_(table.c.state == TASK_LEASED, table.c.lease_expires_at < now)
+
+    session.execute(
+        update(table)
+        .where(expired, table.c.attempts >= retries.RETRY_MAX_ATTEMPTS)
+        .values(state=TASK_FAILED, lease_owner=None, lease_expires_at=None, next_attempt_at=None,
+                error_kind=retries.ERROR_TRANSIENT,
+                last_error=f"Lease expired on all {retries.RETRY_MAX_ATTEMPTS} attempts.",
+                updated_at=now)
+    )
+    candidates = (
+        select(table.c.id)
+        .where(or_(table.c.state == TASK_PENDING,
+                   and_(expired, table.c.attempts < retries.RETRY_MAX_ATTEMPTS)))
+        .order_by(table.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(table)
+        .where(table.c.id.in_(candidates.scalar_subquery()))
+        .values(state=TASK_LEASED, lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=table.c.attempts + 1, updated_at=now)
+        .returning(table.c.url_id)
+    )
+    url_ids = [row.url_id for row in session.execute(stmt)]
+    session.commit()
+    return sorted(url_ids)
+
+
+def complete_task(session, analysis_type: str, url_id: int, worker_id: str) -> bool:
+    """
+    Marks a leased task as done, in the caller's transaction.
+
+    Returns False if this worker no longer holds the lease (it expired and
+    another worker reclaimed the URL); the caller should then discard its
+    result instead of committing it.
+    """
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    result = session.execute(
+        update(table)
+        .where(table.c.url_id == url_id, table.c.state == TASK_LEASED,
+               table.c.lease_owner == worker_id)
+        .values(state=TASK_DONE, lease_owner=None, lease_expires_at=None,
+                updated_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+def release_leases(session, analysis_type: str, worker_id: str) -> int:
+    """
+    Returns all of a worker's unfinished tasks to the queue, e.g. on shutdown.
+    Their attempts are handed back, so restarts don't use up a URL's attempts.
+    """
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    result = session.execute(
+        update(table)
+        .where(table.c.state == TASK_LEASED, table.c.lease_owner == worker_id)
+        .values(state=TASK_PENDING, lease_owner=None, lease_expires_at=None,
+                attempts=case((table.c.attempts > 0, table.c.attempts - 1), else_=0),
+                updated_at=datetime.utcnow())
+    )
+    session.commit()
+    return result.rowcount
+
+
+def renew_leases(session, analysis_type: str, worker_id: str, lease_seconds: int) -> int:
+    """
+    Extends the leases a worker still holds, so URLs that take longer than
+    one lease (e.g. waiting for VT quota) are not reclaimed while it works on
+    them. Committed immediately. Returns the number of leases renewed.
+    """
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    now = datetime.utcnow()
+    result = session.execute(
+        update(table)
+        .where(table.c.state == TASK_LEASED, table.c.lease_owner == worker_id)
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def fail_task(session, analysis_type: str, url_id: int, worker_id: str,
+              error_kind: str, error: str) -> str:
+    """
+    Records a failed attempt at a leased task, in the caller's transaction.
+
+    The task is scheduled for another attempt according to retries.py, or
+    marked failed for good once the error is permanent or the task has used
+    up its attempts. Quota errors hand back the attempt they used.
+
+    Returns the task's new state (TASK_RETRY or TASK_FAILED), or None if
+    this worker no longer holds the lease.
+    """
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    attempts = session.execute(
+        select(table.c.attempts)
+        .where(table.c.url_id == url_id, table.c.state == TASK_LEASED,
+               table.c.lease_owner == worker_id)
+    ).scalar()
+    if attempts is None:
+        return None
+    now = datetime.utcnow()
+    retry_at = retries.next_attempt_at(error_kind, attempts, now)
+    state = TASK_RETRY if retry_at else TASK_FAILED
+    if error_kind == retries.ERROR_QUOTA:
+        attempts -= 1
+    session.execute(
+        update(table)
+        .where(table.c.url_id == url_id, table.c.lease_owner == worker_id)
+        .values(state=state, lease_owner=None, lease_expires_at=None, attempts=attempts,
+                next_attempt_at=retry_at, error_kind=error_kind, last_error=error[:1000],
+                updated_at=now)
+    )
+    return state
+
+
+def requeue_retries(session, analysis_type: str, limit: int) -> int:
+    """
+    Returns up to `limit` failed tasks whose retry time has come to the queue.
+
+    Analyzers call this when the queue has no fresh work, so retries only
+    use quota that would otherwise go unused. Oldest-due first; committed
+    immediately. Returns the number of tasks requeued.
+    """
+    if limit <= 0:
+        return 0
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    now = datetime.utcnow()
+    due = (
+        select(table.c.id)
+        .where(table.c.state == TASK_RETRY, table.c.next_attempt_at <= now)
+        .order_by(table.c.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = session.execute(
+        update(table)
+        .where(table.c.id.in_(due.scalar_subquery()))
+        .values(state=TASK_PENDING, updated_at=now)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def queue_counts(session, analysis_type: str) -> dict:
+    """Returns {state: number of tasks} for an analysis queue."""
+    table = ANALYSIS_QUEUES[analysis_type][0].__table__
+    return dict(session.execute(
+        select(table.c.state, func.count()).group_by(table.c.state)
+    ).tuples().all())
+
+
+def _schedule_vt_retry(session, url_ids, reason: str) -> int:
+    """
+    Makes the security tasks of the URLs selected by url_ids due again at
+    once, with a fresh set of attempts. Returns the number rescheduled.
+    """
+    results = SecurityAnalysis.__table__
+    tasks = SecurityTask.__table__
+    now = datetime.utcnow()
+    # URLs analyzed before the work queues existed have no task yet
+    session.execute(
+        _dialect_insert(session)(tasks)
+        .from_select(['url_id', 'state', 'attempts', 'updated_at'],
+                     select(results.c.url_id, literal(TASK_RETRY), literal(0), literal(now, DateTime))
+                     .where(results.c.url_id.in_(url_ids)))
+        .on_conflict_do_nothing(index_elements=['url_id'])
+    )
+    return session.execute(
+        update(tasks)
+        .where(tasks.c.url_id.in_(url_ids))
+        .values(state=TASK_RETRY, lease_owner=None, lease_expires_at=None, attempts=0,
+                next_attempt_at=now, error_kind=retries.ERROR_TRANSIENT,
+                last_error=reason, updated_at=now)
+    ).rowcount
+
+
+def requeue_vt_errors(session) -> int:
+    """
+    Schedules a retry for URLs stored with the old vt_score = -1 error marker.
+
+    Their vt_score is cleared (no VT verdict yet) and their security task is
+    due at once. Rebuild the threat summary afterwards: those URLs no longer
+    count as analyzed. Returns the number of URLs rescheduled. The caller
+    commits.
+    """
+    results = SecurityAnalysis.__table__
+    errored = select(results.c.url_id).where(results.c.vt_score == -1)
+    rescheduled = _schedule_vt_retry(session, errored, 'VirusTotal error recorded before retries existed')
+    session.execute(update(results).where(results.c.vt_score == -1).values(vt_score=None))
+    return rescheduled
+
+
+def requeue_domain_fallbacks(session) -> int:
+    """
+    Schedules a retry for URLs whose stored verdict was their domain's rollup.
+
+    Earlier analyzers stored the vt_cache domain rollup as the vt_score of a
+    URL they failed to scan. Those scores are cleared, their archived reports
+    dropped and their domains' max_vt_score recomputed from the remaining
+    verdicts. Returns the number of URLs rescheduled. The caller commits.
+    """
+    results = SecurityAnalysis.__table__
+    reports = VTReport.__table__
+    urls = ScrapedURL.__table__
+    domains = Domain.__table__
+    fallbacks = select(reports.c.url_id).where(reports.c.source == 'domain')
+
+    rescheduled = _schedule_vt_retry(session, fallbacks, 'Domain verdict stored in place of a VirusTotal scan')
+    if not rescheduled:
+        return 0
+    session.execute(update(results).where(results.c.url_id.in_(fallbacks)).values(vt_score=None))
+    max_score = (
+        select(func.max(results.c.vt_score))
+        .select_from(urls.join(results, results.c.url_id == urls.c.id))
+        .where(urls.c.domain_id == domains.c.id, results.c.vt_score >= 0)
+        .scalar_subquery()
+    )
+    session.execute(
+        update(domains)
+        .where(domains.c.id.in_(select(urls.c.domain_id).where(urls.c.id.in_(fallbacks))))
+        .values(max_vt_score=max_score)
+    )
+    session.execute(reports.delete().where(reports.c.source == 'domain'))
+    return rescheduled
+
+
+# --- Pending VirusTotal Analyses ---
+
+def save_pending_vt_analysis(session, url_id: int, analysis_id: str,
+                             submitted_at: datetime = None):
+    """
+    Records a submitted VT analysis and commits at once, so a restarted (or
+    different) worker resumes polling it instead of submitting the URL again.
+    """
+    session.merge(PendingVTAnalysis(url_id=url_id, analysis_id=analysis_id,
+                                    submitted_at=submitted_at or datetime.utcnow()))
+    session.commit()
+
+
+def get_pending_vt_analysis(session, url_id: int):
+    """Returns the URL's outstanding PendingVTAnalysis, or None."""
+    return session.get(PendingVTAnalysis, url_id)
+
+
+def clear_pending_vt_analysis(session, url_id: int):
+    """Forgets a URL's outstanding analysis once its result is stored. The caller commits."""
+    session.execute(PendingVTAnalysis.__table__.delete().where(PendingVTAnalysis.url_id == url_id))
+
+
+# --- Sandbox Analyses ---
+
+def get_downloads_for_sandbox(session, limit: int, exclude=()) -> list:
+    """
+    Returns up to `limit` payloads still to be analyzed, oldest first.
+
+    That is payloads never submitted and ones submitted but not reported yet,
+    whose task the caller resumes polling. Hashes in `exclude` (already being
+    worked on) are skipped.
+    """
+    query = (
+        session.query(Download)
+        .filter(or_(Download.sandbox_status.is_(None), Download.sandbox_status == 'submitted'))
+        .order_by(Download.first_seen, Download.sha256)
+    )
+    if exclude:
+        query = query.filter(Download.sha256.notin_(list(exclude)))
+    return query.limit(limit).all()
+
+
+def save_sandbox_task(session, sha256: str, task_id: int):
+    """Records the sandbox task a payload was submitted as, and commits at once."""
+    session.execute(
+        update(Download.__table__).where(Download.__table__.c.sha256 == sha256)
+        .values(sandbox_status='submitted', sandbox_task_id=task_id,
+                sandbox_submitted_at=datetime.utcnow(), sandbox_error=None)
+    )
+    session.commit()
+
+
+def store_sandbox_report(session, sha256: str, report: dict, score: float = None):
+    """Stores a payload's sandbox report, compressed. The caller commits."""
+    session.execute(
+        update(Download.__table__).where(Download.__table__.c.sha256 == sha256)
+        .values(sandbox_status='reported', sandbox_score=score, sandbox_error=None,
+                sandbox_report=zlib.compress(json.dumps(report).encode('utf-8')),
+                analyzed_at=datetime.utcnow())
+    )
+
+
+def record_sandbox_error(session, sha256: str, error: str) -> int:
+    """
+    Counts a failed sandbox request for a payload that will be retried, and
+    commits at once. Returns the payload's number of failed attempts.
+    """
+    table = Download.__table__
+    attempts = session.execute(
+        update(table).where(table.c.sha256 == sha256)
+        .values(sandbox_attempts=func.coalesce(table.c.sandbox_attempts, 0) + 1, sandbox_error=error)
+        .returning(table.c.sandbox_attempts)
+    ).scalar()
+    session.commit()
+    return attempts or 0
+
+
+def record_sandbox_failure(session, sha256: str, error: str):
+    """Marks a payload as failed so it is not submitted again. The caller commits."""
+    session.execute(
+        update(Download.__table__).where(Download.__table__.c.sha256 == sha256)
+        .values(sandbox_status='failed', sandbox_error=error, analyzed_at=datetime.utcnow())
+    )
+
+
+def get_sandbox_report(session, sha256: str):
+    """Returns a payload's decompressed sandbox report, or None if it has none."""
+    blob = session.execute(
+        select(Download.sandbox_report).where(Download.sha256 == sha256)
+    ).scalar()
+    return json.loads(zlib.decompress(blob)) if blob else None
+
+
+# --- Migration ---
+
+def migrate_database(source_url: str, target_url: str, batch_size: int = MIGRATION_BATCH_SIZE):
+    """
+    Copies every table from one database into another, e.g. SQLite to PostgreSQL.
+
+    Rows are streamed from the source and committed to the target in batches,
+    so memory use is bounded by batch_size. Tables keyed by a single id are
+    resumed from the highest id already in the target, so an interrupted
+    migration can simply be re-run.
+    """
+    source = create_engine(source_url)
+    target = get_engine(target_url)
+    Base.metadata.create_all(target)
+    _add_missing_columns(target)
+    TargetSession = sessionmaker(bind=target)
+    use_copy = target.dialect.name == 'postgresql'
+
+    print(f"Migrating {source.url.render_as_string(hide_password=True)} -> "
+          f"{target.url.render_as_string(hide_password=True)}")
+    source_tables = set(inspect(source).get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in source_tables:
+            continue
+        pk = list(table.primary_key.columns)
+        keyset = len(pk) == 1 and pk[0].name == 'id'
+        # Only copy columns the source actually has (it may predate some)
+        source_columns = {col['name'] for col in inspect(source).get_columns(table.name)}
+        columns = [col for col in table.columns if col.name in source_columns]
+
+        query = select(*columns).order_by(*pk)
+        if keyset:
+            with TargetSession() as tsession:
+                last_id = tsession.execute(select(func.max(pk[0]))).scalar()
+            if last_id is not None:
+                query = query.where(pk[0] > last_id)
+
+        copied = 0
+        with source.connect() as conn:
+            result = conn.execution_options(yield_per=batch_size).execute(query)
+            for batch in result.partitions():
+                rows = [dict(row._mapping) for row in batch]
+                with TargetSession() as tsession:
+                    if keyset and use_copy:
+                        _copy_rows(tsession, table.name, [col.name for col in columns], rows)
+                    else:
+                        tsession.execute(_dialect_insert(tsession)(table).on_conflict_do_nothing(), rows)
+                    tsession.commit()
+                copied += len(rows)
+
+        if keyset and use_copy:
+            # COPY bypasses the serial sequence; move it past the copied ids
+            with target.begin() as conn:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table.name}), false)"
+                ))
+        print(f"  {table.name}: {copied} rows")
+
+    print("Migration complete.")
+
+
 # This allows the script to be run directly to set up the DB
 if __name__ == '__main__':
-    init_db()
+    parser = argparse.ArgumentParser(description="Initialize or migrate the FLS database.")
+    subparsers = parser.add_subparsers(dest='command')
+    migrate = subparsers.add_parser('migrate', help="Copy an existing database into the configured one.")
+    migrate.add_argument('--source', default=f'sqlite:///{DB_PATH}',
+                         help="SQLAlchemy URL to copy from (default: the local SQLite file).")
+    migrate.add_argument('--target', default=os.getenv(DATABASE_URL_ENV),
+                         help=f"SQLAlchemy URL to copy into (default: ${DATABASE_URL_ENV}).")
+    migrate.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        if not args.target:
+            parser.error(f"--target is required when {DATABASE_URL_ENV} is not set.")
+        migrate_database(args.source, args.target, args.batch_size)
+    else:
+        init_db()
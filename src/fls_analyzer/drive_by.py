@@ -0,0 +1,127 @@
+# src/fls_analyzer/drive_by.py
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+
+from . import db_handler
+from .scraper import _setup_driver
+
+# Payloads are stored once each, content-addressed by SHA-256
+DOWNLOADS_DIR = os.path.join(db_handler.DB_DIR, 'downloads')
+# Per-visit sandbox directories, on the same filesystem so payloads can be moved
+VISITS_DIR = os.path.join(DOWNLOADS_DIR, '_visits')
+
+# How long to let a page run its scripts, and to wait for started downloads
+PAGE_SETTLE_SECONDS = 10
+DOWNLOAD_TIMEOUT_SECONDS = 60
+HASH_CHUNK_SIZE = 1024 * 1024
+
+CapturedDownload = namedtuple('CapturedDownload',
+                              ['sha256', 'size', 'file_name', 'download_url', 'storage_path'])
+# What a visit left behind: the payloads, and the page's HTML once it settled
+# (None if the page could not be loaded), e.g. for the phishing classifier
+Visit = namedtuple('Visit', ['downloads', 'page_source'])
+
+
+def hash_file(path: str) -> tuple:
+    """Streams a file through SHA-256. Returns (hex digest, size in bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def storage_path(sha256: str) -> str:
+    return os.path.join(DOWNLOADS_DIR, sha256[:2], sha256)
+
+
+def store_payload(path: str) -> tuple:
+    """
+    Moves a downloaded file into the content-addressed store.
+
+    A payload that is already stored (the same file pushed by another page)
+    is simply deleted. Returns (sha256, size, storage path).
+    """
+    sha256, size = hash_file(path)
+    target = storage_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return sha256, size, target
+
+
+def _download_events(driver) -> dict:
+    """Reads download events from the performance log: {guid: {url, file_name, state}}."""
+    downloads = {}
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        method, params = message.get('method', ''), message.get('params', {})
+        if method.endswith('.downloadWillBegin'):
+            downloads.setdefault(params['guid'], {}).update(
+                url=params.get('url'), file_name=params.get('suggestedFilename'), state='inProgress'
+            )
+        elif method.endswith('.downloadProgress'):
+            downloads.setdefault(params['guid'], {})['state'] = params.get('state')
+    return downloads
+
+
+def capture_downloads(url: str) -> Visit:
+    """
+    Visits a URL in a fresh browser and captures every file it downloads.
+
+    Downloads go to a private directory for this visit and are tracked
+    through the DevTools download events. Once they finish (or time out),
+    each file is hashed and moved into the payload store. Returns a Visit:
+    a list of CapturedDownload (empty if nothing was pushed) and the page's
+    HTML.
+    """
+    os.makedirs(VISITS_DIR, exist_ok=True)
+    visit_dir = tempfile.mkdtemp(prefix='visit-', dir=VISITS_DIR)
+    driver = _setup_driver(download_dir=visit_dir)
+    if not driver:
+        shutil.rmtree(visit_dir, ignore_errors=True)
+        return Visit([], None)
+
+    events = {}
+    page_source = None
+    try:
+        driver.get(url)
+        time.sleep(PAGE_SETTLE_SECONDS)
+        page_source = driver.page_source
+        deadline = time.monotonic() + DOWNLOAD_TIMEOUT_SECONDS
+        while True:
+            for guid, event in _download_events(driver).items():
+                events.setdefault(guid, {}).update(event)
+            in_progress = any(e.get('state') == 'inProgress' for e in events.values())
+            partial = any(name.endswith('.crdownload') for name in os.listdir(visit_dir))
+            if not (in_progress or partial) or time.monotonic() > deadline:
+                break
+            time.sleep(1)
+    except Exception as e:
+        print(f"  [!] Error visiting {url} for downloads: {e}")
+    finally:
+        driver.quit()
+
+    captured = []
+    try:
+        for name in os.listdir(visit_dir):
+            path = os.path.join(visit_dir, name)
+            if name.endswith('.crdownload') or not os.path.isfile(path):
+                continue
+            event = events.get(name, {})
+            sha256, size, stored = store_payload(path)
+            captured.append(CapturedDownload(sha256, size, event.get('file_name') or name,
+                                             event.get('url'), stored))
+    finally:
+        shutil.rmtree(visit_dir, ignore_errors=True)
+    return Visit(captured, page_source)
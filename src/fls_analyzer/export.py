@@ -0,0 +1,256 @@
+# src/fls_analyzer/export.py
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+from sqlalchemy import select, union
+
+from . import db_handler
+
+# Partitioned Parquet export of the joined dataset, for notebooks
+EXPORT_DIR = os.path.join(db_handler.DB_DIR, 'export')
+STATE_FILE = '_export_state.json'  # '_' prefix keeps it out of the dataset
+EXPORT_CHUNK_SIZE = 10000
+
+# Rows changed just before the previous export started may not have been
+# committed yet. Re-exporting this window is harmless: the partitions it
+# touches are compacted afterwards.
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('event', pa.string()), ('day', pa.string())]), flavor='hive'
+)
+
+EXPORT_SCHEMA = pa.schema([
+    ('url_id', pa.int64()),
+    ('url', pa.string()),
+    ('domain', pa.string()),
+    ('aggregator_url', pa.string()),
+    ('first_seen', pa.timestamp('us')),
+    ('vt_score', pa.int32()),
+    ('is_phishing', pa.bool_()),
+    ('drive_by_download_detected', pa.bool_()),
+    ('phishing_score', pa.float64()),
+    ('intel_feed', pa.string()),
+    ('google_publisher_ids', pa.list_(pa.string())),
+    ('fingerprinting_techniques', pa.list_(pa.string())),
+    ('vantage_point_count', pa.int32()),
+    ('exported_at', pa.timestamp('us')),
+    ('event', pa.string()),
+    ('day', pa.string()),
+])
+
+
+def _load_state(export_dir: str) -> dict:
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _save_state(export_dir: str, state: dict):
+    # Write-then-rename so an interrupted export never leaves a torn state file
+    path = os.path.join(export_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+# Columns stored in the part files; event and day are in the directory names
+FILE_SCHEMA = pa.schema([field for field in EXPORT_SCHEMA if field.name not in PARTITIONING.schema.names])
+
+
+def _changed_url_ids(since: datetime):
+    """Selects ids of URLs that were added or (re)analyzed since a timestamp."""
+    return union(
+        select(db_handler.ScrapedURL.id).where(db_handler.ScrapedURL.first_seen >= since),
+        select(db_handler.SecurityAnalysis.url_id).where(db_handler.SecurityAnalysis.analyzed_at >= since),
+        select(db_handler.PrivacyAnalysis.url_id).where(db_handler.PrivacyAnalysis.analyzed_at >= since),
+    )
+
+
+def _flatten_privacy(vp_analysis_data) -> tuple:
+    """Reduces the per-VP JSON blob to (fingerprinting techniques, VP count)."""
+    if not vp_analysis_data:
+        return [], 0
+    techniques = set()
+    for data in vp_analysis_data.values():
+        techniques.update(data.get('fingerprinting_techniques', []))
+    return sorted(techniques), len(vp_analysis_data)
+
+
+def _to_arrow(rows: list, exported_at: datetime) -> pa.Table:
+    """Converts a chunk of joined rows into a table matching EXPORT_SCHEMA."""
+    columns = {name: [] for name in EXPORT_SCHEMA.names}
+    for row in rows:
+        techniques, vp_count = _flatten_privacy(row.vp_analysis_data)
+        columns['url_id'].append(row.url_id)
+        columns['url'].append(row.url)
+        columns['domain'].append(row.domain)
+        columns['aggregator_url'].append(row.aggregator_url)
+        columns['first_seen'].append(row.first_seen)
+        columns['vt_score'].append(row.vt_score)
+        columns['is_phishing'].append(row.is_phishing)
+        columns['drive_by_download_detected'].append(row.drive_by_download_detected)
+        columns['phishing_score'].append(row.phishing_score)
+        columns['intel_feed'].append(row.intel_feed)
+        columns['google_publisher_ids'].append(row.google_publisher_ids or [])
+        columns['fingerprinting_techniques'].append(techniques)
+        columns['vantage_point_count'].append(vp_count)
+        columns['exported_at'].append(exported_at)
+        columns['event'].append(row.event)
+        columns['day'].append(row.first_seen.strftime('%Y-%m-%d') if row.first_seen else 'unknown')
+    return pa.Table.from_pydict(columns, schema=EXPORT_SCHEMA)
+
+
+def _latest_rows(table: pa.Table) -> pa.Table:
+    """Keeps only the most recently exported row of each url_id."""
+    table = table.sort_by([('url_id', 'ascending'), ('exported_at', 'descending')])
+    ids = table['url_id'].to_numpy()
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = ids[1:] != ids[:-1]
+    return table.filter(pa.array(first))
+
+
+def _compact_partition(partition_dir: str, started: datetime):
+    """
+    Rewrites one event/day partition as a single file with one row per URL.
+
+    The compacted file is written under a '_' name the dataset ignores and
+    renamed into place before the old files are removed, so an interrupted
+    compaction only leaves duplicates behind (which load_dataset() drops and
+    the next compaction removes), never a gap.
+    """
+    files = sorted(os.path.join(partition_dir, name) for name in os.listdir(partition_dir)
+                   if name.endswith('.parquet') and not name.startswith(('_', '.')))
+    if len(files) < 2:
+        return
+    table = _latest_rows(ds.dataset(files, schema=FILE_SCHEMA, format='parquet').to_table())
+    compacted = os.path.join(partition_dir, f"part-{started:%Y%m%dT%H%M%S%f}-compacted.parquet")
+    staging = os.path.join(partition_dir, '_compacting.parquet')
+    pq.write_table(table, staging)
+    os.replace(staging, compacted)
+    for path in files:
+        if path != compacted:
+            os.remove(path)
+
+
+def export_dataset(session, export_dir: str = EXPORT_DIR, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """
+    Writes the joined URL/analysis dataset to Parquet, partitioned by event and day.
+
+    The export is incremental: only URLs added or analyzed since the previous
+    run are written, as new part files next to the existing ones. Each
+    event/day partition written to is then compacted into one file holding
+    the latest row of each URL, so the Parquet files can be read directly
+    without duplicates. A URL's partition never changes, since both its
+    event and first_seen are fixed. Rows are read in id order one chunk at a
+    time; compaction holds one partition in memory at a time.
+
+    Returns:
+        The number of rows written.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    state = _load_state(export_dir)
+    started = datetime.utcnow()
+
+    query = (
+        select(
+            db_handler.ScrapedURL.id.label('url_id'),
+            db_handler.ScrapedURL.url,
+            db_handler.ScrapedURL.first_seen,
+            db_handler.Event.name.label('event'),
+            db_handler.Domain.name.label('domain'),
+            db_handler.Aggregator.url.label('aggregator_url'),
+            db_handler.SecurityAnalysis.vt_score,
+            db_handler.SecurityAnalysis.is_phishing,
+            db_handler.SecurityAnalysis.drive_by_download_detected,
+            db_handler.SecurityAnalysis.phishing_score,
+            db_handler.SecurityAnalysis.intel_feed,
+            db_handler.PrivacyAnalysis.google_publisher_ids,
+            db_handler.PrivacyAnalysis.vp_analysis_data,
+        )
+        .select_from(db_handler.ScrapedURL)
+        .outerjoin(db_handler.Event, db_handler.ScrapedURL.event_id == db_handler.Event.id)
+        .outerjoin(db_handler.Domain, db_handler.ScrapedURL.domain_id == db_handler.Domain.id)
+        .outerjoin(db_handler.Aggregator, db_handler.ScrapedURL.aggregator_id == db_handler.Aggregator.id)
+        .outerjoin(db_handler.SecurityAnalysis)
+        .outerjoin(db_handler.PrivacyAnalysis)
+    )
+    if state.get('watermark'):
+        since = datetime.fromisoformat(state['watermark'])
+        query = query.where(db_handler.ScrapedURL.id.in_(_changed_url_ids(since)))
+
+    written = 0
+    touched = set()
+    for rows in db_handler.iter_keyset(session, query, db_handler.ScrapedURL.id, chunk_size,
+                                       key_name='url_id'):
+        last_id = rows[-1].url_id
+        ds.write_dataset(
+            _to_arrow(rows, started),
+            export_dir,
+            format='parquet',
+            partitioning=PARTITIONING,
+            basename_template=f"part-{started:%Y%m%dT%H%M%S%f}-{last_id}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda file: touched.add(os.path.dirname(file.path)),
+        )
+        written += len(rows)
+
+    for partition_dir in sorted(touched):
+        _compact_partition(partition_dir, started)
+
+    _save_state(export_dir, {
+        'watermark': (started - WATERMARK_OVERLAP).isoformat(),
+        'last_export': started.isoformat(),
+        'rows_written': written,
+    })
+    return written
+
+
+def load_dataset(columns: list = None, filter=None, export_dir: str = EXPORT_DIR):
+    """
+    Reads the exported dataset into a pandas DataFrame.
+
+    Only the requested columns are read, from memory-mapped files, and
+    `filter` (a pyarrow.dataset expression, e.g. ds.field('event') == 'UCL 2025')
+    prunes partitions before anything is loaded. If an interrupted export
+    left a URL in a partition twice, only its most recent row is kept.
+    Before the first export the DataFrame is empty, with the requested
+    columns.
+    """
+    wanted = list(columns or EXPORT_SCHEMA.names)
+    read = list(dict.fromkeys(wanted + ['url_id', 'exported_at']))
+    if not os.path.isdir(export_dir):
+        return EXPORT_SCHEMA.empty_table().select(wanted).to_pandas()
+
+    # The schema is given rather than inferred, so a directory holding only
+    # the state file still reads as an empty table
+    dataset = ds.dataset(
+        export_dir,
+        schema=EXPORT_SCHEMA,
+        format='parquet',
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    df = dataset.to_table(columns=read, filter=filter).to_pandas()
+    if df['url_id'].duplicated().any():
+        df = df.sort_values('exported_at').drop_duplicates('url_id', keep='last')
+    return df[wanted].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    session = db_handler.get_session()
+    try:
+        print(f"Exporting dataset to {EXPORT_DIR}...")
+        rows = export_dataset(session)
+        print(f"Exported {rows} new or changed rows.")
+    finally:
+        session.close()
@@ -0,0 +1,178 @@
+# src/fls_analyzer/mock_sandbox.py
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+from . import db_handler
+
+# Status a mock task reports at each fraction of its analysis time
+STAGES = ((0.1, 'pending'), (0.8, 'running'), (1.0, 'completed'))
+
+
+def fake_report(task_id: int, sha256: str, file_name: str) -> dict:
+    """A small but well-formed report, derived from the hash so reruns match."""
+    seed = int(sha256[:8], 16)
+    score = round((seed % 100) / 10, 1)
+    malicious = score >= 5
+    return {
+        'info': {'id': task_id, 'score': score, 'ended': datetime.utcnow().isoformat()},
+        'target': {'file': {'name': file_name, 'sha256': sha256}},
+        'signatures': [{'name': 'persistence_autorun', 'severity': 3},
+                       {'name': 'network_http_post', 'severity': 2}] if malicious else [],
+        'network': {
+            'dns': [{'request': f'cdn{seed % 7}.example.net'}],
+            'http': [{'method': 'POST', 'uri': f'http://c2-{seed % 13}.example.net/report'}]
+            if malicious else [],
+        },
+        'behavior': {'summary': {
+            'regkey_written': ['HKEY_CURRENT_USER\\Software\\Microsoft\\Windows\\CurrentVersion\\Run\\updater']
+            if malicious else [],
+            'file_created': [f'C:\\Users\\user\\AppData\\Roaming\\{sha256[:8]}.exe'] if malicious else [],
+        }},
+    }
+
+
+def create_app(analysis_seconds: float = 5.0, failure_rate: float = 0.0, token: str = None,
+               error_rate: float = 0.0, error_status: int = 503) -> web.Application:
+    """
+    A stand-in for the sandbox's REST API (the subset sandbox.SandboxClient uses).
+
+    Tasks move from pending to running to completed to reported over
+    analysis_seconds, and a failure_rate share of them ends in
+    failed_analysis. An error_rate share of API requests is answered with
+    error_status instead. The server counts requests and its peak number of
+    unfinished tasks, served from /stats.
+    """
+    tasks = {}
+    active = set()  # ids of tasks not finished when last checked
+    stats = {'submitted': 0, 'status_requests': 0, 'reports_served': 0, 'peak_active': 0, 'errors': 0}
+
+    @web.middleware
+    async def inject_errors(request, handler):
+        if request.path != '/stats' and random.random() < error_rate:
+            stats['errors'] += 1
+            return web.json_response({'error': 'injected'}, status=error_status)
+        return await handler(request)
+
+    def authorize(request):
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            raise web.HTTPUnauthorized()
+
+    def status_of(task) -> str:
+        progress = (time.monotonic() - task['created']) / analysis_seconds if analysis_seconds else 1.0
+        if progress >= 1.0:
+            return 'failed_analysis' if task['fails'] else 'reported'
+        return next(status for limit, status in STAGES if progress < limit)
+
+    def get_task(request):
+        task = tasks.get(int(request.match_info['task_id']))
+        if task is None:
+            raise web.HTTPNotFound()
+        return task
+
+    async def create_file(request):
+        authorize(request)
+        form = await request.post()
+        upload = form.get('file')
+        if upload is None or not hasattr(upload, 'file'):
+            raise web.HTTPBadRequest(text='file is required')
+        sha256 = hashlib.sha256(upload.file.read()).hexdigest()
+        task_id = len(tasks) + 1
+        tasks[task_id] = {'sha256': sha256, 'file_name': upload.filename, 'created': time.monotonic(),
+                          'fails': random.random() < failure_rate}
+        stats['submitted'] += 1
+        active.add(task_id)
+        active.difference_update([i for i in active if status_of(tasks[i]) in ('reported', 'failed_analysis')])
+        stats['peak_active'] = max(stats['peak_active'], len(active))
+        return web.json_response({'task_id': task_id})
+
+    async def view_task(request):
+        authorize(request)
+        task = get_task(request)
+        stats['status_requests'] += 1
+        return web.json_response({'task': {'id': int(request.match_info['task_id']),
+                                           'status': status_of(task)}})
+
+    async def task_report(request):
+        authorize(request)
+        task = get_task(request)
+        if status_of(task) != 'reported':
+            raise web.HTTPNotFound()
+        stats['reports_served'] += 1
+        return web.json_response(fake_report(int(request.match_info['task_id']),
+                                             task['sha256'], task['file_name']))
+
+    async def get_stats(request):
+        return web.json_response({**stats, 'tasks': len(tasks)})
+
+    app = web.Application(client_max_size=256 * 1024 * 1024, middlewares=[inject_errors])
+    app.add_routes([
+        web.post('/tasks/create/file', create_file),
+        web.get('/tasks/view/{task_id}', view_task),
+        web.get('/tasks/report/{task_id}', task_report),
+        web.get('/stats', get_stats),
+    ])
+    return app
+
+
+def seed_downloads(count: int, size: int = 4096) -> int:
+    """
+    Stores `count` random payloads in the downloads table for a load test.
+
+    Point FLS_DATABASE_URL at a scratch database first. The files are
+    written to a temporary directory.
+    """
+    seed_dir = tempfile.mkdtemp(prefix='fls-sandbox-seed-')
+    db_handler.init_db()
+    session = db_handler.get_session()
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        data = os.urandom(size)
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = os.path.join(seed_dir, sha256)
+        with open(path, 'wb') as f:
+            f.write(data)
+        rows.append({'sha256': sha256, 'size': size, 'file_name': f'seed-{i}.exe', 'storage_path': path,
+                     'url_count': 0, 'first_seen': now, 'last_seen': now})
+    session.execute(db_handler.Download.__table__.insert(), rows)
+    session.commit()
+    session.close()
+    return count
+
+
+if __name__ == '__main__':
+    # Load test: FLS_DATABASE_URL=sqlite:////tmp/load.db python -m src.fls_analyzer.mock_sandbox seed 5000
+    #            python -m src.fls_analyzer.mock_sandbox serve --analysis-seconds 2
+    #            FLS_DATABASE_URL=... SANDBOX_POLL_INTERVAL=1 python -m src.fls_analyzer.sandbox --once --max-in-flight 200
+    parser = argparse.ArgumentParser(description="Local mock of the sandbox API, for offline tests.")
+    subparsers = parser.add_subparsers(dest='command')
+    serve = subparsers.add_parser('serve', help="Run the mock sandbox server (default).")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8090)
+    serve.add_argument('--analysis-seconds', type=float, default=5.0)
+    serve.add_argument('--failure-rate', type=float, default=0.0)
+    serve.add_argument('--token', default=os.getenv('SANDBOX_API_TOKEN'))
+    serve.add_argument('--error-rate', type=float, default=0.0,
+                       help="Share of API requests answered with --error-status.")
+    serve.add_argument('--error-status', type=int, default=503)
+    seed = subparsers.add_parser('seed', help="Store random payloads to analyze.")
+    seed.add_argument('count', type=int)
+    seed.add_argument('--size', type=int, default=4096)
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        print(f"Stored {seed_downloads(args.count, args.size)} payloads.")
+    else:
+        if args.command is None:
+            args = serve.parse_args([])
+        web.run_app(create_app(args.analysis_seconds, args.failure_rate, args.token,
+                               args.error_rate, args.error_status),
+                    host=args.host, port=args.port)
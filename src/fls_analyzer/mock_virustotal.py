@@ -0,0 +1,199 @@
+# src/fls_analyzer/mock_virustotal.py
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+ENGINES = [f'MockEngine{i:02d}' for i in range(70)]
+
+
+def parse_distribution(spec: str):
+    """
+    Parses a delay distribution into a function returning seconds.
+
+    Forms: '0.2' or 'fixed:0.2', 'uniform:LOW,HIGH', 'exp:MEAN' and
+    'lognormal:MU,SIGMA' (of the underlying normal, in log-seconds).
+    """
+    kind, _, params = spec.partition(':')
+    if not params:
+        kind, params = 'fixed', kind
+    values = [float(value) for value in params.split(',')]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / values[0]) if values[0] else 0.0
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown distribution {spec!r}")
+
+
+def _verdict(url: str, malicious_rate: float) -> dict:
+    """Per-engine results for a URL, derived from its hash so every scan agrees."""
+    seed = int(hashlib.sha256(url.encode()).hexdigest()[:12], 16)
+    rng = random.Random(seed)
+    flagged = rng.randint(3, 15) if rng.random() < malicious_rate else rng.randint(0, 1)
+    malicious = set(rng.sample(ENGINES, flagged))
+    suspicious = set(rng.sample(ENGINES, rng.randint(0, 2))) - malicious
+    results = {}
+    for engine in ENGINES:
+        category = ('malicious' if engine in malicious else
+                    'suspicious' if engine in suspicious else
+                    rng.choice(('harmless', 'undetected', 'undetected')))
+        results[engine] = {'category': category, 'engine_name': engine, 'method': 'blacklist',
+                           'result': 'malware' if category == 'malicious' else 'clean'}
+    stats = {category: 0 for category in ('malicious', 'suspicious', 'harmless', 'undetected', 'timeout')}
+    for result in results.values():
+        stats[result['category']] += 1
+    return {'results': results, 'stats': stats}
+
+
+def _error(status: int, code: str, message: str):
+    return web.json_response({'error': {'code': code, 'message': message}}, status=status)
+
+
+def create_app(latency: str = '0', completion: str = '5', error_rate: float = 0.0,
+               error_statuses=(500, 503), per_minute: float = None, per_day: int = None,
+               known_rate: float = 0.0, report_age_days: float = 1.0,
+               malicious_rate: float = 0.1) -> web.Application:
+    """
+    A stand-in for the VirusTotal v3 URL API, for benchmarks and offline tests.
+
+    Serves POST /urls, GET /urls/{id} and GET /analyses/{id}, each answered
+    after a delay drawn from `latency`. A submitted analysis completes after
+    a delay drawn from `completion`. error_rate of requests fail with one of
+    error_statuses. With per_minute and/or per_day, each x-apikey is held to
+    those quotas and refused with 429 beyond them, like the real API.
+    known_rate of URLs already have a report, report_age_days old. Counters
+    are served from /stats.
+    """
+    latency, completion = parse_distribution(latency), parse_distribution(completion)
+    analyses = {}  # analysis id -> (url, ready at)
+    requests_by_key = defaultdict(list)  # key -> monotonic request times in the last minute
+    day_counts = defaultdict(int)
+    stats = defaultdict(int)
+
+    def check_quota(request):
+        key = request.headers.get('x-apikey')
+        if not key:
+            return _error(401, 'WrongCredentialsError', 'Missing x-apikey header')
+        now = time.monotonic()
+        if per_minute is not None:
+            recent = [t for t in requests_by_key[key] if now - t < 60]
+            requests_by_key[key] = recent
+            if len(recent) >= per_minute:
+                return _error(429, 'QuotaExceededError', 'Per-minute quota exceeded')
+            recent.append(now)
+        if per_day is not None:
+            if day_counts[key] >= per_day:
+                return _error(429, 'QuotaExceededError', 'Daily quota exceeded')
+        day_counts[key] += 1
+        return None
+
+    @web.middleware
+    async def simulate(request, handler):
+        if request.path == '/stats':
+            return await handler(request)
+        stats['requests'] += 1
+        await asyncio.sleep(latency())
+        refused = check_quota(request)
+        if refused is None and random.random() < error_rate:
+            refused = _error(random.choice(error_statuses), 'TransientError', 'Injected error')
+        if refused is not None:
+            stats[f'http_{refused.status}'] += 1
+            return refused
+        return await handler(request)
+
+    async def submit_url(request):
+        form = await request.post()
+        url = form.get('url')
+        if not url:
+            return _error(400, 'InvalidArgumentError', 'url is required')
+        stats['submitted'] += 1
+        url_id = hashlib.sha256(url.encode()).hexdigest()
+        analysis_id = f'u-{url_id}-{len(analyses)}'
+        analyses[analysis_id] = (url, time.monotonic() + completion())
+        return web.json_response({'data': {'type': 'analysis', 'id': analysis_id}})
+
+    async def url_report(request):
+        encoded = request.match_info['url_id']
+        try:
+            url = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)).decode()
+        except ValueError:
+            return _error(400, 'InvalidArgumentError', 'Bad URL identifier')
+        if random.Random(url).random() >= known_rate:
+            stats['reports_missing'] += 1
+            return _error(404, 'NotFoundError', f'URL "{encoded}" not found')
+        stats['reports_served'] += 1
+        verdict = _verdict(url, malicious_rate)
+        return web.json_response({'data': {'type': 'url', 'id': encoded, 'attributes': {
+            'url': url,
+            'last_analysis_date': int(time.time() - report_age_days * 86400),
+            'last_analysis_stats': verdict['stats'],
+            'last_analysis_results': verdict['results'],
+            'categories': {},
+        }}})
+
+    async def analysis(request):
+        analysis_id = request.match_info['analysis_id']
+        if analysis_id not in analyses:
+            return _error(404, 'NotFoundError', f'Analysis "{analysis_id}" not found')
+        url, ready_at = analyses[analysis_id]
+        stats['polls'] += 1
+        attributes = {'date': int(time.time()), 'status': 'queued', 'stats': {}, 'results': {}}
+        if time.monotonic() >= ready_at:
+            stats['completed_polls'] += 1
+            attributes.update(status='completed', **_verdict(url, malicious_rate))
+        return web.json_response({'data': {'type': 'analysis', 'id': analysis_id,
+                                           'attributes': attributes}})
+
+    async def get_stats(request):
+        return web.json_response({**stats, 'analyses': len(analyses)})
+
+    app = web.Application(middlewares=[simulate])
+    app.add_routes([
+        web.post('/urls', submit_url),
+        web.get('/urls/{url_id}', url_report),
+        web.get('/analyses/{analysis_id}', analysis),
+        web.get('/stats', get_stats),
+    ])
+    return app
+
+
+def add_arguments(parser):
+    """The mock's settings, shared with scripts/benchmark_vt_pipeline.py."""
+    parser.add_argument('--latency', default='lognormal:-2.5,0.6',
+                        help="Per-request delay distribution, e.g. 0.1, uniform:0.05,0.3, exp:0.1, lognormal:-2.5,0.6")
+    parser.add_argument('--completion', default='uniform:20,60',
+                        help="Delay from submission until an analysis completes.")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-statuses', default='500,503')
+    parser.add_argument('--per-minute', type=float, help="Per-key quota (default: unlimited).")
+    parser.add_argument('--per-day', type=int, help="Per-key daily quota (default: unlimited).")
+    parser.add_argument('--known-rate', type=float, default=0.3,
+                        help="Share of URLs that already have a report.")
+    parser.add_argument('--malicious-rate', type=float, default=0.1)
+
+
+def app_from_args(args) -> web.Application:
+    return create_app(args.latency, args.completion, args.error_rate,
+                      tuple(int(status) for status in args.error_statuses.split(',')),
+                      args.per_minute, args.per_day, args.known_rate, malicious_rate=args.malicious_rate)
+
+
+if __name__ == '__main__':
+    # Point the analyzers at it with VT_API_URL=http://127.0.0.1:8070
+    parser = argparse.ArgumentParser(description="Local mock of the VirusTotal v3 URL API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_VT_PORT', '8070')))
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(app_from_args(args), host=args.host, port=args.port)
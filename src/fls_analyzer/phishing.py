@@ -0,0 +1,189 @@
+# src/fls_analyzer/phishing.py
+
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import urljoin, urlsplit
+
+import numpy as np
+
+from .url_utils import registered_domain
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+MODEL_PATH = os.path.join(PROJECT_ROOT, 'config', 'phishing_model.json')
+
+# Brands commonly impersonated on FLS pages (fake logins, "verify to watch")
+BRANDS = ('paypal', 'apple', 'icloud', 'microsoft', 'outlook', 'office365', 'netflix',
+          'amazon', 'facebook', 'instagram', 'google', 'gmail', 'coinbase', 'binance',
+          'metamask', 'steam', 'dazn', 'espn', 'nhl', 'uefa', 'bank')
+
+CREDENTIAL_PHRASES = ('sign in', 'log in', 'login', 'verify your', 'confirm your',
+                      'account suspended', 'update your payment', 'card number',
+                      'security code', 'social security', 'seed phrase')
+
+# Substrings that signal packed or obfuscated JavaScript, counted in scripts only
+OBFUSCATION_MARKERS = ('eval(', 'atob(', 'unescape(', 'fromcharcode(', '\\x')
+
+# Regexes all start with a literal, so each is a fast scan of the page
+_PASSWORD_RE = re.compile(r'<input[^>]*type\s*=\s*["\']?password')
+_FORM_RE = re.compile(r'<form\b([^>]*)>')
+_ACTION_RE = re.compile(r'action\s*=\s*["\']?([^"\'\s>]*)')
+_SCRIPT_RE = re.compile(r'<script[^>]*>(.*?)</script>', re.DOTALL)
+_TITLE_RE = re.compile(r'<title[^>]*>([^<]{0,300})')
+_HIDDEN_IFRAME_RE = re.compile(r'<iframe[^>]*(?:display\s*:\s*none|width\s*=\s*["\']?0\b|height\s*=\s*["\']?0\b)')
+_BRAND_RE = re.compile(r'\b(' + '|'.join(BRANDS) + r')\b')
+_IP_HOST_RE = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+
+FEATURES = (
+    'password_input',        # page asks for a password
+    'form_count',            # log(1 + number of forms)
+    'external_form_action',  # a form posts to another registered domain
+    'mailto_or_php_action',  # a form posts to mailto: or a bare .php handler
+    'brand_mismatch',        # title names a brand the domain does not contain
+    'credential_phrases',    # log(1 + credential-harvesting phrases), pages with forms only
+    'obfuscated_js',         # log(1 + obfuscation markers in scripts)
+    'hidden_iframe',         # an invisible iframe
+    'ip_host',               # URL host is a bare IP address
+    'suspicious_url',        # '@' in URL, very long URL or deeply nested subdomains
+)
+
+# Hand-set starting weights, used until a model is trained on labeled pages
+# and saved to config/phishing_model.json (see fit() and save_model())
+DEFAULT_MODEL = {
+    'features': list(FEATURES),
+    'weights': [2.5, 0.3, 1.8, 1.5, 2.0, 0.8, 0.6, 0.7, 1.2, 0.9],
+    'bias': -4.5,
+    'threshold': 0.5,
+}
+
+
+def extract_features(html: str, page_url: str) -> np.ndarray:
+    """
+    Computes the FEATURES vector for one page.
+
+    The HTML is lowercased once and every check is a substring count or a
+    regex anchored on a literal, so a typical page takes well under a
+    millisecond. Phrase counting, the costliest part, is skipped on pages
+    without a form, since those cannot harvest credentials.
+    """
+    lower = html.lower() if html else ''
+    vector = np.zeros(len(FEATURES), dtype=np.float32)
+    page_domain = registered_domain(page_url)
+
+    if 'password' in lower and _PASSWORD_RE.search(lower):
+        vector[0] = 1.0
+
+    forms = 0
+    for form in _FORM_RE.finditer(lower):
+        forms += 1
+        action = _ACTION_RE.search(form.group(1))
+        if not action or not action.group(1):
+            continue
+        target = action.group(1)
+        if target.startswith('mailto:') or (target.endswith('.php') and '://' not in target):
+            vector[3] = 1.0
+        action_domain = registered_domain(urljoin(page_url, target))
+        if action_domain and page_domain and action_domain != page_domain:
+            vector[2] = 1.0
+    vector[1] = np.log1p(forms)
+
+    title = _TITLE_RE.search(lower)
+    if title:
+        for brand in _BRAND_RE.findall(title.group(1)):
+            if brand not in page_domain:
+                vector[4] = 1.0
+                break
+
+    if forms or vector[0]:
+        vector[5] = np.log1p(sum(lower.count(phrase) for phrase in CREDENTIAL_PHRASES))
+    if '<script' in lower:
+        scripts = ''.join(_SCRIPT_RE.findall(lower))
+        vector[6] = np.log1p(sum(scripts.count(marker) for marker in OBFUSCATION_MARKERS))
+    if '<iframe' in lower and _HIDDEN_IFRAME_RE.search(lower):
+        vector[7] = 1.0
+
+    host = urlsplit(page_url).hostname or ''
+    vector[8] = float(bool(_IP_HOST_RE.match(host)))
+    vector[9] = float('@' in page_url or len(page_url) > 100 or host.count('.') >= 4)
+    return vector
+
+
+def feature_matrix(pages) -> np.ndarray:
+    """Stacks the feature vectors of (html, page_url) pairs into an (n, k) matrix."""
+    rows = [extract_features(html, url) for html, url in pages]
+    if not rows:
+        return np.zeros((0, len(FEATURES)), dtype=np.float32)
+    return np.vstack(rows)
+
+
+class PhishingModel:
+    """A logistic regression over FEATURES, scored a whole batch at a time."""
+
+    def __init__(self, weights, bias: float, threshold: float = 0.5):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.threshold = threshold
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        return 1.0 / (1.0 + np.exp(-(features @ self.weights + self.bias)))
+
+    def score_pages(self, pages) -> np.ndarray:
+        """Returns the phishing probability of each (html, page_url) pair."""
+        return self.predict_proba(feature_matrix(pages))
+
+    def to_dict(self) -> dict:
+        return {'features': list(FEATURES), 'weights': self.weights.tolist(),
+                'bias': self.bias, 'threshold': self.threshold}
+
+
+def load_model(path: str = MODEL_PATH) -> PhishingModel:
+    """Loads the trained model, falling back to DEFAULT_MODEL."""
+    spec = DEFAULT_MODEL
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            spec = json.load(f)
+        if spec.get('features') != list(FEATURES):
+            print(f"[!] {path} was trained on different features. Using default weights.")
+            spec = DEFAULT_MODEL
+    return PhishingModel(spec['weights'], spec['bias'], spec.get('threshold', 0.5))
+
+
+def save_model(model: PhishingModel, path: str = MODEL_PATH):
+    with open(path, 'w') as f:
+        json.dump(model.to_dict(), f, indent=2)
+
+
+def fit(features: np.ndarray, labels: np.ndarray, epochs: int = 500,
+        learning_rate: float = 0.1, l2: float = 1e-3) -> PhishingModel:
+    """Trains a PhishingModel by batch gradient descent on labeled feature rows."""
+    labels = np.asarray(labels, dtype=np.float32)
+    weights = np.zeros(features.shape[1], dtype=np.float32)
+    bias = 0.0
+    for _ in range(epochs):
+        error = 1.0 / (1.0 + np.exp(-(features @ weights + bias))) - labels
+        weights -= learning_rate * (features.T @ error / len(labels) + l2 * weights)
+        bias -= learning_rate * float(error.mean())
+    return PhishingModel(weights, bias)
+
+
+if __name__ == '__main__':
+    # Scores saved pages: python -m src.fls_analyzer.phishing page.html [page2.html ...]
+    # Each file's URL is read from a first-line '<!-- url: ... -->' comment if present.
+    pages = []
+    for path in sys.argv[1:]:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            html = f.read()
+        first_line = html.split('\n', 1)[0]
+        url = first_line[len('<!-- url:'):-len('-->')].strip() if first_line.startswith('<!-- url:') else 'http://' + os.path.basename(path)
+        pages.append((html, url))
+
+    model = load_model()
+    started = time.perf_counter()
+    scores = model.score_pages(pages)
+    elapsed = time.perf_counter() - started
+    for (_, url), score in zip(pages, scores):
+        print(f"{score:.3f}  {'PHISHING' if score >= model.threshold else 'ok':8}  {url}")
+    if pages:
+        print(f"Scored {len(pages)} pages in {elapsed * 1000:.1f} ms ({len(pages) / elapsed:.0f} pages/s).")
@@ -1,55 +1,37 @@
 # src/fls_analyzer/privacy_analysis.py
 
-import re
 from selenium import webdriver
-from bs4 import BeautifulSoup
 
-# Regex patterns for finding common Google tracking IDs
-# TODO: Expand this to include other ad networks like Criteo, etc.
-GOOGLE_ID_PATTERNS = {
-    'GA_UA': re.compile(r'UA-\d{4,10}-\d{1,4}'),
-    'GA_G': re.compile(r'G-[A-Z0-9]{10}'),
-    'GTM': re.compile(r'GTM-[A-Z0-9]{7}'),
-    'ADSENSE': re.compile(r'pub-\d{15,20}')
-}
+from .id_scanner import IDScanner
+from .script_analysis import ScriptAnalyzer
 
-# Simple list of strings to look for in script content to detect fingerprinting
-# This is a basic heuristic approach. A more advanced method would use JS instrumentation.
-FINGERPRINTING_KEYWORDS = [
-    'canvas.todataurl',
-    'getclientrects',
-    'navigatordetails', 
-    'audiocontext',
-    'getplugindata'
-]
+# Google, Criteo, Taboola, Yandex Metrica, Facebook Pixel, PropellerAds and
+# Adsterra IDs are all found in one scan; the patterns are registered in
+# config/id_patterns.json
+_id_scanner = None
 
+# Fingerprinting is detected per unique script by script_analysis.ScriptAnalyzer;
+# this one serves callers that don't pass their own
+_default_script_analyzer = None
 
-def _find_google_ids(page_source: str) -> dict:
-    """Finds all Google publisher/tracking IDs in the page source."""
-    found_ids = {}
-    for id_type, pattern in GOOGLE_ID_PATTERNS.items():
-        matches = pattern.findall(page_source)
-        if matches:
-            found_ids[id_type] = list(set(matches)) 
-    return found_ids
 
+def _find_google_ids(page_source: str) -> dict:
+    """Finds all publisher/tracking IDs (Google's and other networks') in the page source."""
+    global _id_scanner
+    if _id_scanner is None:
+        _id_scanner = IDScanner.from_config()
+    return _id_scanner.scan(page_source)
 
-def _detect_fingerprinting(page_source: str) -> list:
-    """Detects potential fingerprinting techniques via keyword matching in scripts."""
-    detected_techniques = []
-    soup = BeautifulSoup(page_source, 'html.parser')
-    scripts = soup.find_all('script')
-    
-    for script in scripts:
-        script_content = str(script) 
-        for keyword in FINGERPRINTING_KEYWORDS:
-            if keyword.lower() in script_content.lower() and keyword not in detected_techniques:
-                detected_techniques.append(keyword)
 
-    return detected_techniques
+def _script_analyzer():
+    global _default_script_analyzer
+    if _default_script_analyzer is None:
+        _default_script_analyzer = ScriptAnalyzer()
+    return _default_script_analyzer
 
 
-def analyze_privacy_from_source(page_source: str) -> dict:
+def analyze_privacy_from_source(page_source: str, script_analyzer: ScriptAnalyzer = None,
+                                page_url: str = None) -> dict:
     """
     Analyzes a given HTML page source for privacy-related metrics.
     
@@ -58,6 +40,9 @@ def analyze_privacy_from_source(page_source: str) -> dict:
     
     Args:
         page_source: The HTML content of the page as a string.
+        script_analyzer: Caches per-script verdicts across pages; an
+            in-memory one is used if not given.
+        page_url: The page's URL, to resolve relative script URLs.
         
     Returns:
         A dictionary containing the analysis results.
@@ -68,11 +53,14 @@ def analyze_privacy_from_source(page_source: str) -> dict:
         }
         
     google_ids = _find_google_ids(page_source)
-    fingerprinting = _detect_fingerprinting(page_source)
+    scripts = (script_analyzer or _script_analyzer()).analyze_page(page_source, page_url)
     
     return {
         "google_ids": google_ids,
-        "fingerprinting_techniques": fingerprinting,
+        "fingerprinting_techniques": scripts.pop("fingerprinting"),
+        # {technique: [hashes of the scripts using it]}
+        "fingerprinting_scripts": scripts.pop("fingerprinting_scripts"),
+        "scripts": scripts,
     }
 
 
@@ -0,0 +1,136 @@
+# src/fls_analyzer/rate_limiter.py
+
+import hashlib
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from . import db_handler
+
+# Longest single sleep while waiting for a token, so a key whose quota
+# frees up sooner than estimated (e.g. another worker exited) is noticed
+MAX_WAIT_SECONDS = 15
+
+
+class QuotaExhausted(Exception):
+    """Raised when no key can be used within the caller's timeout."""
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter shared by every process using the same database.
+
+    Each API key has a bucket refilled at per_minute tokens per minute (holding
+    at most `burst`) and a per-day request count that resets at midnight UTC.
+    The buckets live in the api_quotas table and every take is a compare-and-
+    swap on the row's updated_at, so any number of workers, on one machine or
+    several against PostgreSQL, share each key's quota without exceeding it.
+    acquire() rotates across the keys, handing out whichever has a token.
+
+    Usage:
+        limiter = RateLimiter('virustotal', keys, per_minute=4, per_day=500)
+        headers = {'x-apikey': limiter.acquire()}
+    """
+
+    def __init__(self, name: str, keys: list, per_minute: float, per_day: int,
+                 burst: float = 1):
+        if not keys:
+            raise ValueError(f"No API keys configured for {name}")
+        self.name = name
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.burst = burst
+        self._keys = {self._key_id(key): key for key in keys}
+        self._order = list(self._keys)
+        self._next = 0
+        self.waited = 0.0
+
+    def _key_id(self, key: str) -> str:
+        return f"{self.name}:{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+    def _ensure_rows(self, session):
+        existing = set(session.execute(
+            select(db_handler.APIQuota.key_id).where(db_handler.APIQuota.key_id.in_(self._order))
+        ).scalars())
+        missing = [key_id for key_id in self._order if key_id not in existing]
+        if not missing:
+            return
+        now = datetime.utcnow()
+        stmt = db_handler._dialect_insert(session)(db_handler.APIQuota.__table__).on_conflict_do_nothing()
+        session.execute(stmt, [
+            {'key_id': key_id, 'tokens': self.burst, 'updated_at': now,
+             'day': now.date(), 'day_count': 0}
+            for key_id in missing
+        ])
+        session.commit()
+
+    def _try_take(self, session, key_id: str):
+        """
+        Takes one token from a key's bucket if it has one.
+
+        Returns 0 on success, otherwise the number of seconds until the key
+        should have a token again.
+        """
+        quota = session.get(db_handler.APIQuota, key_id, populate_existing=True)
+        now = datetime.utcnow()
+        elapsed = max(0.0, (now - quota.updated_at).total_seconds())
+        tokens = min(self.burst, quota.tokens + elapsed * self.per_minute / 60)
+        day, day_count = quota.day, quota.day_count
+        if day != now.date():
+            day, day_count = now.date(), 0
+
+        if day_count >= self.per_day:
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            return (midnight - now).total_seconds()
+        if tokens < 1:
+            return (1 - tokens) * 60 / self.per_minute
+
+        table = db_handler.APIQuota.__table__
+        result = session.execute(
+            update(table)
+            .where(table.c.key_id == key_id, table.c.updated_at == quota.updated_at)
+            .values(tokens=tokens - 1, updated_at=now, day=day, day_count=day_count + 1)
+        )
+        session.commit()
+        # Another process took from this bucket first; have the caller retry now
+        return 0 if result.rowcount == 1 else 0.01
+
+    def acquire(self, timeout: float = None) -> str:
+        """
+        Blocks until a request may be made and returns the API key to make it with.
+
+        Raises QuotaExhausted if no key frees up within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        session = db_handler.get_session()
+        try:
+            self._ensure_rows(session)
+            while True:
+                waits = []
+                for offset in range(len(self._order)):
+                    key_id = self._order[(self._next + offset) % len(self._order)]
+                    wait = self._try_take(session, key_id)
+                    if wait == 0:
+                        self._next = (self._next + offset + 1) % len(self._order)
+                        return self._keys[key_id]
+                    waits.append(wait)
+
+                wait = min(min(waits), MAX_WAIT_SECONDS)
+                if deadline is not None and time.monotonic() + wait > deadline:
+                    raise QuotaExhausted(f"No {self.name} quota left within {timeout}s")
+                time.sleep(wait)
+                self.waited += wait
+        finally:
+            session.close()
+
+    def usage(self) -> dict:
+        """Returns {key_id: requests made today} for this limiter's keys."""
+        today = datetime.utcnow().date()
+        with db_handler.get_session() as session:
+            rows = session.execute(
+                select(db_handler.APIQuota.key_id, db_handler.APIQuota.day,
+                       db_handler.APIQuota.day_count)
+                .where(db_handler.APIQuota.key_id.in_(self._order))
+            )
+            return {row.key_id: (row.day_count if row.day == today else 0) for row in rows}
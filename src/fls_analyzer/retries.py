@@ -0,0 +1,72 @@
+# src/fls_analyzer/retries.py
+
+import os
+import random
+from datetime import datetime, timedelta
+
+# How a failed analysis is retried:
+#   quota      - the API refused for lack of quota (429); not the URL's fault,
+#                so it is retried after RETRY_QUOTA_DELAY without using up one
+#                of its attempts
+#   transient  - timeouts, connection errors, 5xx, analyses that never
+#                finished; retried with exponential backoff
+#   permanent  - the API rejected the URL itself (e.g. 400) or the key
+#                (401/403); never retried. Waiting doesn't fix a bad key, and
+#                retrying it as quota would loop on it forever
+ERROR_QUOTA = 'quota'
+ERROR_TRANSIENT = 'transient'
+ERROR_PERMANENT = 'permanent'
+
+# Attempts (leases) after which a transiently failing URL is given up on
+RETRY_MAX_ATTEMPTS = int(os.getenv('FLS_RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = timedelta(minutes=int(os.getenv('FLS_RETRY_BASE_MINUTES', '10')))
+RETRY_MAX_DELAY = timedelta(hours=24)
+RETRY_QUOTA_DELAY = timedelta(hours=1)
+
+QUOTA_STATUSES = {429}
+PERMANENT_STATUSES = {400, 401, 403, 405, 413, 414, 422}
+
+
+def classify_status(status: int) -> str:
+    """Error kind for an HTTP error status."""
+    if status in QUOTA_STATUSES:
+        return ERROR_QUOTA
+    if status in PERMANENT_STATUSES:
+        return ERROR_PERMANENT
+    return ERROR_TRANSIENT
+
+
+def classify_exception(exc: BaseException) -> str:
+    """
+    Error kind for an exception raised while analyzing a URL.
+
+    HTTP errors are classified by status, whether they come from aiohttp
+    (exc.status) or requests (exc.response.status_code); anything else, such
+    as timeouts and dropped connections, is transient.
+    """
+    status = getattr(exc, 'status', None)
+    if status is None:
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+    if isinstance(status, int) and status >= 400:
+        return classify_status(status)
+    return ERROR_TRANSIENT
+
+
+def next_attempt_at(error_kind: str, attempts: int, now: datetime = None):
+    """
+    When to retry a URL that failed with error_kind on its `attempts`-th try.
+
+    Returns None if it should not be retried. Transient failures back off
+    exponentially from RETRY_BASE_DELAY, with up to 25% jitter so URLs that
+    failed together (an outage) don't all come back at once.
+    """
+    now = now or datetime.utcnow()
+    if error_kind == ERROR_PERMANENT:
+        return None
+    if error_kind == ERROR_QUOTA:
+        return now + RETRY_QUOTA_DELAY
+    if attempts >= RETRY_MAX_ATTEMPTS:
+        return None
+    delay = min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+    return now + delay * random.uniform(1.0, 1.25)
@@ -0,0 +1,255 @@
+# src/fls_analyzer/sandbox.py
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from . import db_handler, retries
+
+# Cuckoo-compatible REST API (cuckoo api / CAPE); see mock_sandbox.py for a local stand-in
+SANDBOX_URL = os.getenv('SANDBOX_URL', 'http://localhost:8090').rstrip('/')
+SANDBOX_API_TOKEN = os.getenv('SANDBOX_API_TOKEN')
+
+# Payloads being submitted or polled at once
+SANDBOX_MAX_IN_FLIGHT = int(os.getenv('SANDBOX_MAX_IN_FLIGHT', '8'))
+
+# Failed requests (5xx, timeouts, dropped connections) after which a payload
+# is given up on; quota and auth errors don't count
+SANDBOX_MAX_ATTEMPTS = int(os.getenv('SANDBOX_MAX_ATTEMPTS', '5'))
+
+# A task is polled every POLL_INTERVAL seconds and abandoned once it is
+# ANALYSIS_TIMEOUT old
+POLL_INTERVAL = float(os.getenv('SANDBOX_POLL_INTERVAL', '30'))
+ANALYSIS_TIMEOUT = timedelta(hours=1)
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=300)
+
+# Task states after which the report can be fetched, or never will be
+DONE_STATES = {'reported'}
+FAILED_STATES = {'failed_analysis', 'failed_processing', 'failed_reporting'}
+
+
+class SandboxError(Exception):
+    """The sandbox rejected a payload or its analysis failed."""
+
+
+class SandboxClient:
+    """Thin async wrapper over the sandbox's task API."""
+
+    def __init__(self, http, base_url: str = SANDBOX_URL, token: str = SANDBOX_API_TOKEN):
+        self.http = http
+        self.base_url = base_url
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    async def _json(self, method: str, path: str, **kwargs):
+        async with self.http.request(method, self.base_url + path, headers=self.headers,
+                                     **kwargs) as response:
+            if response.status == 404:
+                raise SandboxError(f"{path} not found on the sandbox.")
+            response.raise_for_status()
+            return await response.json()
+
+    async def submit(self, path: str, file_name: str = None) -> int:
+        """Uploads a file for analysis and returns its task id."""
+        with open(path, 'rb') as f:
+            form = aiohttp.FormData()
+            form.add_field('file', f, filename=file_name or os.path.basename(path))
+            result = await self._json('POST', '/tasks/create/file', data=form)
+        task_id = result.get('task_id') or (result.get('task_ids') or [None])[0]
+        if task_id is None:
+            raise SandboxError(f"Sandbox did not accept {file_name or path}: {result}")
+        return int(task_id)
+
+    async def status(self, task_id: int) -> str:
+        result = await self._json('GET', f'/tasks/view/{task_id}')
+        return result['task']['status']
+
+    async def report(self, task_id: int) -> dict:
+        return await self._json('GET', f'/tasks/report/{task_id}')
+
+    async def wait_for_report(self, task_id: int, submitted_at: datetime,
+                              poll_interval: float = POLL_INTERVAL) -> dict:
+        """Polls a task until its report is ready and returns the report."""
+        while True:
+            status = await self.status(task_id)
+            if status in DONE_STATES:
+                return await self.report(task_id)
+            if status in FAILED_STATES:
+                raise SandboxError(f"Sandbox task {task_id} ended in state {status}.")
+            if datetime.utcnow() - submitted_at > ANALYSIS_TIMEOUT:
+                raise SandboxError(f"Sandbox task {task_id} timed out (last state {status}).")
+            await asyncio.sleep(poll_interval)
+
+
+def summarize_report(report: dict) -> dict:
+    """Pulls the indicators the study reports on out of a full sandbox report."""
+    network = report.get('network') or {}
+    behavior = (report.get('behavior') or {}).get('summary') or {}
+    return {
+        'score': (report.get('info') or {}).get('score'),
+        'signatures': [sig.get('name') for sig in report.get('signatures') or []],
+        'persistence_methods': [
+            key for key in behavior.get('regkey_written') or []
+            if '\\currentversion\\run' in key.lower()
+        ],
+        'network_activity': {
+            'dns_requests': [entry.get('request') for entry in network.get('dns') or []],
+            'http_posts_to': [entry.get('uri') for entry in network.get('http') or []
+                              if entry.get('method') == 'POST'],
+        },
+        'files_created': behavior.get('file_created') or [],
+    }
+
+
+class SandboxQueue:
+    """
+    Submits stored payloads to the sandbox and collects their reports.
+
+    Payloads are keyed by SHA-256 in the downloads table, so each file is
+    analyzed once however many pages pushed it; a payload already reported
+    (or failed) is never submitted again. The task id is committed as soon as
+    a payload is accepted, so a restarted queue resumes polling instead of
+    uploading it again. At most max_in_flight payloads are being uploaded or
+    polled at a time, and reports are stored compressed in the database.
+    Failed requests are retried, classified as in retries.py: a payload is
+    given up on after a permanent error or max_attempts transient ones.
+    """
+
+    def __init__(self, session, base_url: str = SANDBOX_URL, token: str = SANDBOX_API_TOKEN,
+                 max_in_flight: int = SANDBOX_MAX_IN_FLIGHT, poll_interval: float = POLL_INTERVAL,
+                 max_attempts: int = SANDBOX_MAX_ATTEMPTS):
+        self.session = session
+        self.base_url = base_url
+        self.token = token
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._tasks = {}  # sha256 -> asyncio.Task
+        self.counts = {'submitted': 0, 'resumed': 0, 'reported': 0, 'failed': 0, 'retried': 0}
+        self.started = time.monotonic()
+
+    async def _analyze(self, client: SandboxClient, download) -> dict:
+        if download.sandbox_status == 'submitted' and download.sandbox_task_id:
+            self.counts['resumed'] += 1
+            task_id, submitted_at = download.sandbox_task_id, download.sandbox_submitted_at
+        else:
+            if not os.path.exists(download.storage_path):
+                raise SandboxError(f"Payload file {download.storage_path} is missing.")
+            task_id = await client.submit(download.storage_path, download.file_name)
+            submitted_at = datetime.utcnow()
+            db_handler.save_sandbox_task(self.session, download.sha256, task_id)
+            self.counts['submitted'] += 1
+        return await client.wait_for_report(task_id, submitted_at, self.poll_interval)
+
+    async def _process(self, client: SandboxClient, download):
+        sha256 = download.sha256
+        try:
+            report = await self._analyze(client, download)
+        except SandboxError as e:
+            print(f"  [!] Sandbox: {sha256[:12]} failed: {e}")
+            db_handler.record_sandbox_failure(self.session, sha256, str(e))
+            self.counts['failed'] += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            self.session.rollback()
+            error_kind = retries.classify_exception(e)
+            attempts = 0
+            if error_kind != retries.ERROR_QUOTA:
+                attempts = db_handler.record_sandbox_error(self.session, sha256, f"{e!r}")
+            if error_kind == retries.ERROR_PERMANENT or attempts >= self.max_attempts:
+                print(f"  [!] Sandbox: giving up on {sha256[:12]} after a {error_kind} error: {e}")
+                db_handler.record_sandbox_failure(self.session, sha256, f"{e!r}")
+                self.counts['failed'] += 1
+                self.session.commit()
+                return
+            # Left as is and retried (or resumed) after a pause, holding the slot
+            # meanwhile so an unreachable sandbox is not hammered
+            print(f"  [!] Sandbox: request for {sha256[:12]} failed ({error_kind}): {e}")
+            self.counts['retried'] += 1
+            await asyncio.sleep(self.poll_interval)
+            return
+        else:
+            summary = summarize_report(report)
+            db_handler.store_sandbox_report(self.session, sha256, report, summary['score'])
+            self.counts['reported'] += 1
+            print(f"  > Sandbox: {sha256[:12]} scored {summary['score']}, "
+                  f"{len(summary['signatures'])} signatures.")
+        self.session.commit()
+
+    def _claim(self, client: SandboxClient, limit: int) -> int:
+        downloads = db_handler.get_downloads_for_sandbox(self.session, limit, exclude=self._tasks)
+        for download in downloads:
+            task = asyncio.create_task(self._process(client, download))
+            self._tasks[download.sha256] = task
+            task.add_done_callback(lambda _, sha256=download.sha256: self._tasks.pop(sha256, None))
+        return len(downloads)
+
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.started
+        c = self.counts
+        return (f"{len(self._tasks)} in flight; {c['submitted']} submitted, {c['resumed']} resumed, "
+                f"{c['reported']} reported, {c['failed']} failed, {c['retried']} retried "
+                f"({c['reported'] / elapsed if elapsed else 0:.1f} reports/s)")
+
+    async def run(self, once: bool = False, idle_seconds: float = 60):
+        """
+        Runs until cancelled, taking new payloads as slots free up.
+
+        With once=True, returns when no payload is left to analyze.
+        """
+        async with aiohttp.ClientSession(timeout=HTTP_TIMEOUT) as http:
+            client = SandboxClient(http, self.base_url, self.token)
+            try:
+                while True:
+                    free = self.max_in_flight - len(self._tasks)
+                    claimed = self._claim(client, free) if free > 0 else 0
+                    if self._tasks:
+                        await asyncio.wait(list(self._tasks.values()), timeout=idle_seconds,
+                                           return_when=asyncio.FIRST_COMPLETED)
+                    elif not claimed:
+                        if once:
+                            return
+                        await asyncio.sleep(idle_seconds)
+            finally:
+                # Submitted tasks stay 'submitted' and are resumed next run
+                for task in self._tasks.values():
+                    task.cancel()
+                await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+async def _analyze_file(path: str, base_url: str, token: str) -> dict:
+    async with aiohttp.ClientSession(timeout=HTTP_TIMEOUT) as http:
+        client = SandboxClient(http, base_url, token)
+        task_id = await client.submit(path)
+        report = await client.wait_for_report(task_id, datetime.utcnow())
+    return {'task_id': task_id, 'summary': summarize_report(report), 'report': report}
+
+
+def analyze_file(path: str, base_url: str = SANDBOX_URL, token: str = SANDBOX_API_TOKEN) -> dict:
+    """Submits one file and blocks until its report is in. Returns task id, summary and report."""
+    return asyncio.run(_analyze_file(path, base_url, token))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyze stored drive-by payloads in the sandbox.")
+    parser.add_argument('--once', action='store_true',
+                        help="Exit once every stored payload has been analyzed.")
+    parser.add_argument('--max-in-flight', type=int, default=SANDBOX_MAX_IN_FLIGHT)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--max-attempts', type=int, default=SANDBOX_MAX_ATTEMPTS)
+    args = parser.parse_args()
+
+    session = db_handler.get_session()
+    queue = SandboxQueue(session, max_in_flight=args.max_in_flight, poll_interval=args.poll_interval,
+                         max_attempts=args.max_attempts)
+    print(f"--- FLS Sandbox Queue ({SANDBOX_URL}) ---")
+    try:
+        asyncio.run(queue.run(once=args.once))
+    except KeyboardInterrupt:
+        print("\n[!] Shutdown signal received.")
+    finally:
+        print(f"[*] Sandbox: {queue.report()}")
+        session.close()
@@ -6,7 +6,8 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
-import tldextract
+
+from .url_utils import registered_domain
 
 # Domains to ignore when scraping for FLS links
 DOMAIN_BLOCKLIST = [
@@ -15,17 +16,35 @@ DOMAIN_BLOCKLIST = [
     'discord.gg', 'reddit.com', 't.me', 'dailymotion.com'
 ]
 
-def _setup_driver():
-    """Configures the selenium webdriver."""
+def _setup_driver(download_dir: str = None):
+    """
+    Configures the selenium webdriver.
+
+    With download_dir, downloads are allowed without prompting and saved
+    there under their DevTools GUID, and the performance log is enabled so
+    the download events can be read back (see drive_by.py).
+    """
     chrome_options = Options()
     chrome_options.add_argument("--headless")
     chrome_options.add_argument("--no-sandbox")
     chrome_options.add_argument("--disable-dev-shm-usage")
     chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36")
+    if download_dir:
+        chrome_options.add_experimental_option('prefs', {
+            'download.default_directory': download_dir,
+            'download.prompt_for_download': False,
+            'safebrowsing.enabled': False,
+        })
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
     
     try:
         service = Service(ChromeDriverManager().install())
         driver = webdriver.Chrome(service=service, options=chrome_options)
+        if download_dir:
+            # Headless Chrome drops downloads unless told where to put them
+            driver.execute_cdp_cmd('Browser.setDownloadBehavior', {
+                'behavior': 'allowAndName', 'downloadPath': download_dir, 'eventsEnabled': True,
+            })
     except Exception as e:
         print(f"Error setting up chromedriver: {e}")
         return None
@@ -46,7 +65,7 @@ def scrape_links_from_url(agg_url: str) -> set:
         return set()
 
     found_urls = set()
-    agg_domain = tldextract.extract(agg_url).registered_domain
+    agg_domain = registered_domain(agg_url)
 
     try:
         driver.get(agg_url)
@@ -64,8 +83,8 @@ def scrape_links_from_url(agg_url: str) -> set:
             if not link or not link.startswith('http'):
                 continue
 
-            link_domain_info = tldextract.extract(link)
-            link_domain = link_domain_info.registered_domain
+            # Links to bare IPs and unknown suffixes are not FLS candidates
+            link_domain = registered_domain(link, strict=True)
             
             if link_domain and link_domain != agg_domain and link_domain not in DOMAIN_BLOCKLIST:
                 found_urls.add(link)
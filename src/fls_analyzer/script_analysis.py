@@ -0,0 +1,488 @@
+# src/fls_analyzer/script_analysis.py
+
+import hashlib
+import html
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict, namedtuple
+from urllib.parse import urljoin
+
+import ahocorasick
+import requests
+
+from . import db_handler
+
+# Bump when the checks below change, so cached verdicts are recomputed
+ANALYZER_VERSION = 4
+
+# Lowercase substrings naming browser APIs used to fingerprint visitors.
+# Every one found counts as a fingerprinting technique, as in the study's
+# original keyword list (which they include)
+FINGERPRINTING_APIS = (
+    # Canvas
+    'canvas.todataurl', 'todataurl', 'toblob(', 'getimagedata', 'measuretext',
+    'ispointinpath', 'globalcompositeoperation',
+    # WebGL
+    'webgl_debug_renderer_info', 'unmasked_renderer_webgl', 'unmasked_vendor_webgl',
+    'getsupportedextensions', 'getshaderprecisionformat', 'getcontextattributes',
+    # Audio
+    'audiocontext', 'offlineaudiocontext', 'createoscillator', 'createdynamicscompressor',
+    'createanalyser', 'getfloatfrequencydata', 'startrendering',
+    # Fonts and layout
+    'getclientrects', 'document.fonts', 'fonts.check(', 'querylocalfonts',
+    # WebRTC local addresses
+    'rtcpeerconnection', 'createdatachannel', 'onicecandidate', 'stun:',
+    # Browser and device properties
+    'navigatordetails', 'getplugindata', 'navigator.plugins', 'navigator.mimetypes',
+    'hardwareconcurrency', 'devicememory', 'getbattery', 'enumeratedevices',
+    'maxtouchpoints', 'useragentdata', 'gethighentropyvalues', 'navigator.connection',
+    'navigator.languages', 'navigator.webdriver', 'donottrack', 'cpuclass', 'oscpu',
+    'screen.colordepth', 'screen.pixeldepth', 'availwidth', 'availheight', 'devicepixelratio',
+    'gettimezoneoffset', 'resolvedoptions().timezone', 'getvoices', 'getgamepads',
+    'permissions.query', 'storage.estimate', 'opendatabase', 'deviceorientation', 'devicemotion',
+    # Fingerprinting libraries
+    'fingerprintjs', 'fingerprint2', 'clientjs', 'evercookie', 'thumbmarkjs',
+)
+
+# Opt-in stricter definition (FLS_STRICT_FINGERPRINTING=1): most APIs above are
+# also read by ordinary pages (time zones, pixel ratios, canvas exports), so
+# only these, which ordinary pages rarely touch (GPU and audio-stack probes,
+# font enumeration, client hints, the fingerprinting libraries), count...
+STRONG_FINGERPRINTING_APIS = frozenset((
+    'ispointinpath', 'webgl_debug_renderer_info', 'unmasked_renderer_webgl', 'unmasked_vendor_webgl',
+    'getshaderprecisionformat', 'offlineaudiocontext', 'createdynamicscompressor', 'querylocalfonts',
+    'navigatordetails', 'getplugindata', 'gethighentropyvalues', 'cpuclass', 'oscpu',
+    'fingerprintjs', 'fingerprint2', 'clientjs', 'evercookie', 'thumbmarkjs',
+))
+# ...unless a script reads this many of the others: a fingerprinter collects
+# many, a page a few
+FINGERPRINTING_MIN_WEAK_APIS = 6
+STRICT_FINGERPRINTING = os.getenv('FLS_STRICT_FINGERPRINTING') == '1'
+
+# Lowercase substrings of in-browser cryptominer libraries and their pools
+MINER_SIGNATURES = (
+    'coinhive', 'coin-hive', 'cryptonight', 'coinimp', 'crypto-loot', 'cryptoloot',
+    'webminepool', 'jsecoin', 'minero.cc', 'deepminer', 'webmr.js', 'stratum+tcp',
+)
+
+# Calls that unpack or run code built at runtime
+DYNAMIC_CODE_CALLS = ('eval(', 'atob(', 'unescape(', 'fromcharcode(', 'new function(')
+
+# A script counts as obfuscated once it trips this many of the checks in
+# _obfuscation_signals()
+OBFUSCATION_MIN_SIGNALS = 2
+
+# Unique scripts whose verdicts are kept in memory between DB lookups
+MEMORY_CACHE_SIZE = 50000
+# External scripts larger than this are not fetched
+MAX_SCRIPT_BYTES = 2 * 1024 * 1024
+# Seconds one external script may take to download, in total
+FETCH_TIMEOUT = 10
+# Seconds a page's external scripts may take to download between them;
+# scripts not fetched by then are left out of the page's result
+PAGE_FETCH_BUDGET = 30
+
+_SCRIPT_RE = re.compile(r'<script\b([^>]*)>(.*?)</script\s*>', re.IGNORECASE | re.DOTALL)
+_SRC_RE = re.compile(r'\bsrc\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+_TYPE_RE = re.compile(r'\btype\s*=\s*["\']?([^"\'\s>]+)', re.IGNORECASE)
+_WRAPPER_START_RE = re.compile(r'\s*(?:<!--|<!\[CDATA\[)')
+_WRAPPER_ENDS = ('-->', ']]>')
+_ESCAPE_RE = re.compile(r'\\x[0-9a-fA-F]{2}|\\u[0-9a-fA-F]{4}')
+# Identifiers like _0x3f2a1b, left behind by common JS obfuscators
+_HEX_IDENTIFIER_RE = re.compile(r'\b_0x[0-9a-f]{4,}\b')
+
+# Script types that hold JavaScript; others (JSON-LD, templates) are skipped
+JS_TYPES = {'', 'text/javascript', 'application/javascript', 'module',
+            'text/ecmascript', 'application/ecmascript'}
+
+# A script on a page: its normalized-source hash, and its URL if external
+PageScript = namedtuple('PageScript', ['script_hash', 'src'])
+
+
+class KeywordMatcher:
+    """
+    Counts occurrences of many lowercase keywords in one pass over a text.
+
+    Backed by an Aho-Corasick automaton, so the cost of a scan depends on
+    the text's length and not on how many keywords there are.
+    """
+
+    def __init__(self, keywords):
+        self._automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            self._automaton.add_word(keyword, keyword)
+        self._automaton.make_automaton()
+
+    def count(self, lower: str) -> Counter:
+        """{keyword: occurrences} for the keywords found in already-lowercased text."""
+        return Counter(keyword for _, keyword in self._automaton.iter(lower))
+
+    def present(self, text: str) -> set:
+        """The keywords that occur in text, matched as given (case-sensitively)."""
+        return {keyword for _, keyword in self._automaton.iter(text)}
+
+
+_KEYWORDS = KeywordMatcher(set(FINGERPRINTING_APIS + MINER_SIGNATURES + DYNAMIC_CODE_CALLS))
+
+
+def _script_elements(page_source: str):
+    """
+    Yields the (attributes, body) of each <script> element, in page order.
+
+    Scans for the tags with str.find on the page lowercased once, which is
+    much faster than a regex on pages with megabytes of inline JavaScript.
+    Matches the same elements as _SCRIPT_RE, which is used instead if
+    lowercasing changes the page's length (a few non-ASCII characters do).
+    """
+    lower = page_source.lower()
+    if len(lower) != len(page_source):
+        for match in _SCRIPT_RE.finditer(page_source):
+            yield match.group(1), match.group(2)
+        return
+    position = 0
+    while True:
+        start = lower.find('<script', position)
+        if start < 0:
+            return
+        position = start + len('<script')
+        if position < len(lower) and (lower[position].isalnum() or lower[position] == '_'):
+            continue  # Another tag, e.g. <scripts>
+        tag_end = lower.find('>', position)
+        if tag_end < 0:
+            return
+        search = tag_end + 1
+        while True:
+            close = lower.find('</script', search)
+            if close < 0:
+                return
+            after = close + len('</script')
+            while after < len(lower) and lower[after].isspace():
+                after += 1
+            if after < len(lower) and lower[after] == '>':
+                break
+            search = close + 1
+        yield page_source[position:tag_end], page_source[tag_end + 1:close]
+        position = after + 1
+
+
+def extract_scripts(page_source: str, page_url: str = None) -> list:
+    """
+    Returns the JavaScript on a page as (src, inline source) pairs, in page order.
+
+    External scripts have their absolute URL as src and no source; inline
+    scripts have src None.
+    """
+    scripts = []
+    for attrs, body in _script_elements(page_source or ''):
+        script_type = _TYPE_RE.search(attrs)
+        if script_type and script_type.group(1).lower() not in JS_TYPES:
+            continue
+        src = _SRC_RE.search(attrs)
+        if src:
+            url = html.unescape(next(group for group in src.groups() if group is not None).strip())
+            if url:
+                scripts.append((urljoin(page_url, url) if page_url else url, None))
+                continue
+        if body.strip():
+            scripts.append((None, body))
+    return scripts
+
+
+def normalize_script(source: str) -> str:
+    """
+    Canonical form of a script for hashing: surrounding HTML comment/CDATA
+    wrappers removed, lines stripped and blank lines dropped, so copies
+    differing only in indentation or line endings share one hash.
+    """
+    lines = (line.strip() for line in source.replace('\r\n', '\n').replace('\r', '\n').split('\n'))
+    normalized = '\n'.join(line for line in lines if line)
+    # Only the ends are checked; an unanchored regex would try every position
+    start = _WRAPPER_START_RE.match(normalized)
+    if start:
+        normalized = normalized[start.end():]
+    if normalized.endswith(_WRAPPER_ENDS):
+        normalized = normalized[:-3]
+    return normalized.strip()
+
+
+def script_hash(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def _entropy(text: str) -> float:
+    """Shannon entropy in bits per character."""
+    if not text:
+        return 0.0
+    total = len(text)
+    return -sum(count / total * math.log2(count / total) for count in Counter(text).values())
+
+
+def _obfuscation_signals(source: str, per_kb, dynamic_calls: int) -> list:
+    signals = []
+    longest_line = max(map(len, source.split('\n')), default=0)
+    if longest_line > 5000 and _entropy(source[:65536]) > 5.2:
+        signals.append('packed')
+    if per_kb(len(_ESCAPE_RE.findall(source))) > 20:
+        signals.append('escaped_strings')
+    if per_kb(dynamic_calls) > 1:
+        signals.append('dynamic_code')
+    # The regex can't skip ahead to '_0x' on its own, so count those first
+    if source.count('_0x') > 10 and len(_HEX_IDENTIFIER_RE.findall(source)) > 10:
+        signals.append('hex_identifiers')
+    return signals
+
+
+def strict_fingerprinting(apis: list) -> list:
+    """
+    The APIs that count under the opt-in strict definition: a script's
+    strong APIs, or all of them if it reads FINGERPRINTING_MIN_WEAK_APIS others.
+    """
+    weak = [api for api in apis if api not in STRONG_FINGERPRINTING_APIS]
+    if len(weak) >= FINGERPRINTING_MIN_WEAK_APIS:
+        return list(apis)
+    return [api for api in apis if api in STRONG_FINGERPRINTING_APIS]
+
+
+def analyze_script(source: str) -> dict:
+    """
+    Statically analyzes one script's (normalized) source.
+
+    Returns a JSON-serializable verdict: the fingerprinting APIs and miner
+    signatures it contains, eval/atob counts and their density per KB, and
+    the obfuscation checks it trips. All keywords are counted in a single
+    pass over the lowercased source.
+
+    fingerprinting lists every API found; see strict_fingerprinting() for
+    the opt-in stricter reading.
+    """
+    counts = _KEYWORDS.count(source.lower())
+    kb = max(len(source) / 1024, 1.0)
+
+    def per_kb(count):
+        return count / kb
+
+    signals = _obfuscation_signals(source, per_kb, sum(counts[call] for call in DYNAMIC_CODE_CALLS))
+    eval_count, atob_count = counts['eval('], counts['atob(']
+    return {
+        'fingerprinting': [api for api in FINGERPRINTING_APIS if api in counts],
+        'miners': [sig for sig in MINER_SIGNATURES if sig in counts],
+        'eval_count': eval_count,
+        'atob_count': atob_count,
+        'eval_atob_per_kb': round(per_kb(eval_count + atob_count), 3),
+        'obfuscation_signals': signals,
+        'obfuscated': len(signals) >= OBFUSCATION_MIN_SIGNALS,
+    }
+
+
+def fetch_script(url: str):
+    """
+    Downloads an external script. Returns its source, or None if it can't be
+    fetched within FETCH_TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + FETCH_TIMEOUT
+    try:
+        with requests.get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            # The timeout above is per read, so a server trickling bytes is
+            # cut off by the deadline instead
+            body, size = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > MAX_SCRIPT_BYTES or time.monotonic() > deadline:
+                    return None
+                body.append(chunk)
+            return b''.join(body).decode(response.encoding or 'utf-8', errors='replace')
+    except (requests.RequestException, OSError):
+        return None
+
+
+class ScriptAnalyzer:
+    """
+    Analyzes each unique script once and builds page results from the verdicts.
+
+    Scripts are hashed after normalization. A verdict is looked up in memory,
+    then in the script_verdicts table (if a session is given), and only
+    computed on a miss; new verdicts are kept in memory and handed to the
+    caller by take_new_verdicts() to be written with the page results.
+    External scripts are fetched once per URL per process, and at most
+    fetch_budget seconds are spent fetching a page's scripts. A fetched
+    script's source is kept until its verdict is stored (see
+    store_new_verdicts()), so a verdict dropped from memory before then is
+    computed again rather than lost. stats counts lookups since the last
+    take_stats(), so the cache hit rate can be reported per crawl.
+    """
+
+    def __init__(self, session=None, fetch=fetch_script, memory_size: int = MEMORY_CACHE_SIZE,
+                 fetch_budget: float = PAGE_FETCH_BUDGET, strict: bool = STRICT_FINGERPRINTING):
+        self.session = session
+        self.strict = strict
+        self.fetch = fetch
+        self.memory_size = memory_size
+        self.fetch_budget = fetch_budget
+        self._verdicts = OrderedDict()  # script_hash -> verdict, least recently used first
+        self._external = OrderedDict()  # script URL -> script_hash, or None if it can't be fetched
+        self._sources = OrderedDict()   # script_hash -> normalized source, until its verdict is stored
+        self._unstored = set()          # hashes of computed verdicts not yet committed
+        self._new = {}                  # script_hash -> (size, verdict), not yet stored
+        self.stats = Counter()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.memory_size:
+            cache.popitem(last=False)
+
+    def _external_script(self, url: str, deadline: float):
+        """Returns (script_hash, normalized source or None) for a script URL, or None."""
+        if url in self._external:
+            self._external.move_to_end(url)
+            hash_ = self._external[url]
+            return hash_ and (hash_, self._sources.get(hash_))
+        if time.monotonic() > deadline:
+            # Not cached as a failure: another page may have time for it
+            self.stats['fetch_skipped'] += 1
+            return None
+        self.stats['fetched'] += 1
+        source = self.fetch(url)
+        hash_ = None
+        if source is not None:
+            normalized = normalize_script(source)
+            hash_ = script_hash(normalized)
+            self._remember(self._sources, hash_, normalized)
+        else:
+            self.stats['fetch_errors'] += 1
+        self._remember(self._external, url, hash_)
+        return hash_ and (hash_, self._sources.get(hash_))
+
+    def _resolve(self, scripts: list) -> dict:
+        """Finds or computes the verdict of every (script_hash, normalized source) given."""
+        verdicts, missing = {}, {}
+        for hash_, normalized in scripts:
+            self.stats['scripts'] += 1
+            if hash_ in verdicts or hash_ in missing:
+                # Repeated on the same page
+                self.stats['memory_hits'] += 1
+            elif hash_ in self._verdicts:
+                self._verdicts.move_to_end(hash_)
+                verdicts[hash_] = self._verdicts[hash_]
+                self.stats['memory_hits'] += 1
+            elif hash_ in self._new:
+                verdicts[hash_] = self._new[hash_][1]
+                self.stats['memory_hits'] += 1
+            else:
+                missing[hash_] = normalized
+
+        if missing:
+            stored = {}
+            if self.session is not None:
+                stored = db_handler.get_script_verdicts(self.session, missing, ANALYZER_VERSION)
+            for hash_, normalized in missing.items():
+                verdict = stored.get(hash_)
+                if verdict is not None:
+                    self.stats['db_hits'] += 1
+                elif normalized is not None:
+                    verdict = analyze_script(normalized)
+                    self._new[hash_] = (len(normalized), verdict)
+                    self._unstored.add(hash_)
+                    self.stats['analyzed'] += 1
+                else:
+                    continue
+                verdicts[hash_] = verdict
+                self._remember(self._verdicts, hash_, verdict)
+
+        # Fetched sources are only kept for verdicts that exist nowhere but in memory
+        for hash_, _ in scripts:
+            if hash_ not in self._unstored:
+                self._sources.pop(hash_, None)
+        return verdicts
+
+    def analyze_page(self, page_source: str, page_url: str = None) -> dict:
+        """
+        Returns a page's script findings, assembled from per-script verdicts.
+
+        The fingerprinting techniques and miners are the union over its
+        scripts; fingerprinting_scripts maps each technique to the hashes of
+        the scripts using it. With strict=True only the APIs that count under
+        strict_fingerprinting() are techniques; fingerprinting_apis lists
+        every API read either way. script_hashes lists every script in page
+        order.
+        """
+        page_scripts, to_resolve = [], []
+        deadline = time.monotonic() + self.fetch_budget
+        for src, body in extract_scripts(page_source, page_url):
+            if src is None:
+                normalized = normalize_script(body)
+                if not normalized:
+                    continue
+                entry = (script_hash(normalized), normalized)
+            else:
+                entry = self._external_script(src, deadline)
+                if entry is None:
+                    continue
+            page_scripts.append(PageScript(entry[0], src))
+            to_resolve.append(entry)
+
+        verdicts = self._resolve(to_resolve)
+        fingerprinting, apis, miners = {}, set(), set()
+        result = {'script_hashes': [script.script_hash for script in page_scripts],
+                  'eval_count': 0, 'atob_count': 0, 'obfuscated_scripts': 0}
+        for script in page_scripts:
+            verdict = verdicts.get(script.script_hash)
+            if verdict is None:
+                continue
+            counted = verdict['fingerprinting']
+            if self.strict:
+                counted = strict_fingerprinting(counted)
+            for api in counted:
+                fingerprinting.setdefault(api, {})[script.script_hash] = None
+            apis.update(verdict['fingerprinting'])
+            miners.update(verdict['miners'])
+            result['eval_count'] += verdict['eval_count']
+            result['atob_count'] += verdict['atob_count']
+            result['obfuscated_scripts'] += verdict['obfuscated']
+        result['fingerprinting'] = sorted(fingerprinting)
+        result['fingerprinting_scripts'] = {api: list(fingerprinting[api]) for api in result['fingerprinting']}
+        result['fingerprinting_apis'] = sorted(apis)
+        result['miners'] = sorted(miners)
+        return result
+
+    def take_new_verdicts(self) -> dict:
+        """Returns the verdicts computed since the last call, for store_new_verdicts()."""
+        new, self._new = self._new, {}
+        return new
+
+    def verdicts_stored(self, hashes):
+        """Drops the sources kept for verdicts that are now in the database."""
+        for hash_ in hashes:
+            self._unstored.discard(hash_)
+            self._sources.pop(hash_, None)
+
+    def take_stats(self) -> Counter:
+        """Returns the lookup counts since the last call and starts counting afresh."""
+        stats, self.stats = self.stats, Counter()
+        return stats
+
+
+def format_stats(stats) -> str:
+    """One-line summary of ScriptAnalyzer stats, e.g. for the end of a crawl."""
+    scripts = stats['scripts']
+    hits = stats['memory_hits'] + stats['db_hits']
+    rate = hits / scripts if scripts else 0.0
+    return (f"{scripts} scripts, {rate:.1%} cache hits ({stats['memory_hits']} memory, "
+            f"{stats['db_hits']} DB), {stats['analyzed']} analyzed; "
+            f"{stats['fetched']} external fetched, {stats['fetch_errors']} failed, "
+            f"{stats['fetch_skipped']} over the page's time budget")
+
+
+def store_new_verdicts(session, verdicts: dict, analyzer: ScriptAnalyzer = None):
+    """
+    Stores verdicts from ScriptAnalyzer.take_new_verdicts() (run by the write
+    buffer). Returns the callback that lets the analyzer drop their sources
+    once committed.
+    """
+    db_handler.store_script_verdicts(session, verdicts, ANALYZER_VERSION)
+    if analyzer is not None:
+        return lambda: analyzer.verdicts_stored(verdicts)
@@ -1,33 +1,148 @@
 # src/fls_analyzer/security_analysis.py
 
+import base64
+import json
 import os
 import requests
 import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+from . import retries, sandbox, vt_cache
+from .rate_limiter import RateLimiter
+
 # Load API keys from .env file for security
 load_dotenv()
-# TODO: import this key from a .env file when you're done with testing
-VT_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
+# Several keys may be given, comma-separated, to spread requests across them
+VT_API_KEYS = [
+    key.strip()
+    for key in (os.getenv("VIRUSTOTAL_API_KEYS") or os.getenv("VIRUSTOTAL_API_KEY") or "").split(",")
+    if key.strip()
+]
 
-VT_URL_SCAN_ENDPOINT = 'https://www.virustotal.com/api/v3/urls'
-VT_URL_ANALYSIS_ENDPOINT = 'https://www.virustotal.com/api/v3/analyses/{}'
+# Per-key quotas, shared by every analyzer process (public API defaults)
+VT_REQUESTS_PER_MINUTE = float(os.getenv("VT_REQUESTS_PER_MINUTE", "4"))
+VT_REQUESTS_PER_DAY = int(os.getenv("VT_REQUESTS_PER_DAY", "500"))
 
+# Override to run against a local mock (see mock_virustotal.py)
+VT_API_URL = os.getenv("VT_API_URL", "https://www.virustotal.com/api/v3").rstrip("/")
+VT_URL_SCAN_ENDPOINT = f'{VT_API_URL}/urls'
+VT_URL_ANALYSIS_ENDPOINT = VT_API_URL + '/analyses/{}'
+VT_URL_REPORT_ENDPOINT = VT_API_URL + '/urls/{}'
 
-def get_virustotal_report(url_to_scan: str) -> dict:
-    if not VT_API_KEY:
-        return {"error": "VirusTotal API key not found. Please set VIRUSTOTAL_API_KEY in .env file."}
+# Existing VT reports younger than this are reused instead of rescanning
+VT_REPORT_MAX_AGE = timedelta(days=int(os.getenv("VT_REPORT_MAX_AGE_DAYS", "7")))
+
+# Outcome of the report lookups made by this process
+LOOKUP_STATS = {'cached': 0, 'hits': 0, 'stale': 0, 'misses': 0, 'domain_fallback': 0}
+
+
+_limiter = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns this process' limiter over the shared VT quota."""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter('virustotal', VT_API_KEYS,
+                               VT_REQUESTS_PER_MINUTE, VT_REQUESTS_PER_DAY)
+    return _limiter
+
+
+def _vt_headers() -> dict:
+    """Waits for quota on one of the configured keys and returns request headers for it."""
+    return {'x-apikey': get_rate_limiter().acquire()}
+
+
+def vt_url_id(url: str) -> str:
+    """Returns VirusTotal's identifier for a URL (unpadded URL-safe base64)."""
+    return base64.urlsafe_b64encode(url.encode()).decode().strip('=')
+
+
+def lookup_virustotal_report(url: str, max_age: timedelta = VT_REPORT_MAX_AGE):
+    """
+    Fetches VirusTotal's existing report for a URL without submitting it.
+
+    Returns the report's analysis stats if its last analysis is newer than
+    max_age, or None if VT has no report or only a stale one.
+    """
+    response = requests.get(VT_URL_REPORT_ENDPOINT.format(vt_url_id(url)), headers=_vt_headers())
+    if response.status_code == 404:
+        LOOKUP_STATS['misses'] += 1
+        return None
+    response.raise_for_status()
+    return fresh_report_stats(response.json()['data']['attributes'], max_age)
+
+
+def fresh_report_stats(attributes: dict, max_age: timedelta = VT_REPORT_MAX_AGE):
+    """Returns the stats of a VT URL report's attributes if recent enough, else None."""
+    analyzed = attributes.get('last_analysis_date')
+    if not analyzed or 'last_analysis_stats' not in attributes:
+        LOOKUP_STATS['misses'] += 1
+        return None
+    if datetime.now(timezone.utc) - datetime.fromtimestamp(analyzed, timezone.utc) > max_age:
+        LOOKUP_STATS['stale'] += 1
+        return None
+    LOOKUP_STATS['hits'] += 1
+    return attributes['last_analysis_stats']
+
+
+def get_virustotal_report(url_to_scan: str, max_report_age: timedelta = VT_REPORT_MAX_AGE,
+                          domain_fallback: bool = True) -> dict:
+    """
+    Returns the VirusTotal analysis stats for a URL.
+
+    Answers come from, in order: the local verdict cache (vt_cache), VT's
+    existing report for the URL if newer than max_report_age (one request),
+    and only then a fresh scan that is submitted and polled. Fetched verdicts
+    are cached. If the URL cannot be scanned, the error is returned with its
+    'error_kind' (see retries.py), so the caller can schedule a retry; with
+    domain_fallback set it also carries the cached rollup for the URL's
+    registered domain under 'domain_verdict', for reports to fall back on.
+    That rollup is the worst verdict of other URLs, not this URL's own.
+    """
+    cached = vt_cache.get_url_verdict(url_to_scan)
+    if cached is not None:
+        LOOKUP_STATS['cached'] += 1
+        print("  > VT: Using cached verdict.")
+        return cached
+
+    stats = _fetch_virustotal_report(url_to_scan, max_report_age)
+    if "error" not in stats:
+        vt_cache.store_verdict(url_to_scan, stats)
+        return stats
+
+    if domain_fallback:
+        domain_stats = vt_cache.get_domain_verdict(url_to_scan)
+        if domain_stats is not None:
+            LOOKUP_STATS['domain_fallback'] += 1
+            print(f"  > VT: {stats['error']} Domain verdict: {domain_stats.get('malicious', 0)} malicious.")
+            stats['domain_verdict'] = domain_stats
+    return stats
+
+
+def _fetch_virustotal_report(url_to_scan: str, max_report_age: timedelta) -> dict:
+    if not VT_API_KEYS:
+        return {"error": "VirusTotal API key not found. Please set VIRUSTOTAL_API_KEY(S) in .env file.",
+                "error_kind": retries.ERROR_PERMANENT}
+
+    # Every request below waits for quota on one of the keys
+    try:
+        stats = lookup_virustotal_report(url_to_scan, max_report_age)
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        return {"error": f"Failed to look up VT report: {e}", "error_kind": retries.classify_exception(e)}
+    if stats is not None:
+        print("  > VT: Reusing existing report.")
+        return stats
 
-    headers = {'x-apikey': VT_API_KEY}
-    
     # Submit the URL for scanning
     try:
         scan_payload = {'url': url_to_scan}
-        response = requests.post(VT_URL_SCAN_ENDPOINT, data=scan_payload, headers=headers)
+        response = requests.post(VT_URL_SCAN_ENDPOINT, data=scan_payload, headers=_vt_headers())
         response.raise_for_status()
         analysis_id = response.json()['data']['id']
     except requests.exceptions.RequestException as e:
-        return {"error": f"Failed to submit URL to VirusTotal: {e}"}
+        return {"error": f"Failed to submit URL to VirusTotal: {e}", "error_kind": retries.classify_exception(e)}
 
     # Wait for the analysis to complete. This can be slow.
     print(f"  > VT: Submitted {url_to_scan}. Waiting for analysis...")
@@ -37,7 +152,7 @@ def get_virustotal_report(url_to_scan: str) -> dict:
     for _ in range(10): # Poll up to 10 times (e.g., 2 minutes)
         try:
             time.sleep(15) # Wait 15 seconds between checks
-            analysis_response = requests.get(analysis_url, headers=headers)
+            analysis_response = requests.get(analysis_url, headers=_vt_headers())
             analysis_response.raise_for_status()
             result = analysis_response.json()
 
@@ -45,32 +160,25 @@ def get_virustotal_report(url_to_scan: str) -> dict:
                 print("  > VT: Analysis complete.")
                 return result['data']['attributes']['stats']
         except requests.exceptions.RequestException as e:
-            return {"error": f"Failed to retrieve VT analysis: {e}"}
+            return {"error": f"Failed to retrieve VT analysis: {e}", "error_kind": retries.classify_exception(e)}
 
-    return {"error": "VirusTotal analysis timed out."}
+    return {"error": "VirusTotal analysis timed out.", "error_kind": retries.ERROR_TRANSIENT}
 
 
 def analyze_in_cuckoo(file_path: str) -> dict:
     """
-    Placeholder function to simulate submitting a file to Cuckoo Sandbox.
-    
-    In a real implementation, this would involve using the Cuckoo API
-    to submit the file and retrieve a report ID.
+    Submits one file to the Cuckoo sandbox and waits for its report.
+
+    For ad-hoc checks; payloads captured by the threat analyzer are queued
+    and analyzed in bulk by sandbox.SandboxQueue instead.
+
+    Returns:
+        dict: The sandbox task id, a summary of the indicators and the full report.
     """
     print(f"\n[CUCKOO] Submitting {os.path.basename(file_path)} for analysis...")
-    print("[CUCKOO] Analysis complete (simulated).")
-    return {
-        "summary": {
-            "file_name": os.path.basename(file_path),
-            "persistence_methods": ["Registry Run Key (HKCU)"],
-            "network_activity": {
-                "dns_requests": ["updates.topcreativeformat.com", "badsite.ru"],
-                "http_posts_to": ["http://updates.topcreativeformat.com/report"]
-            },
-            "files_created": ["%AppData%\\Roaming\\SysUtil\\updater.exe"]
-        },
-        "report_path": f"/path/to/cuckoo/reports/{os.path.basename(file_path)}.json"
-    }
+    result = sandbox.analyze_file(file_path)
+    print(f"[CUCKOO] Analysis complete (task {result['task_id']}).")
+    return result
 
 
 if __name__ == '__main__':
@@ -87,6 +195,6 @@ if __name__ == '__main__':
         
     print(f"\n--- Testing Cuckoo analysis for: {dummy_file} ---")
     cuckoo_results = analyze_in_cuckoo(dummy_file)
-    print("Cuckoo Results:", json.dumps(cuckoo_results, indent=2))
+    print("Cuckoo Results:", json.dumps(cuckoo_results['summary'], indent=2))
     
     os.remove(dummy_file)
@@ -0,0 +1,185 @@
+# src/fls_analyzer/threat_intel.py
+
+import csv
+import json
+import os
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from .url_utils import canonical_url, url_hash
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+FEEDS_CONFIG = os.path.join(PROJECT_ROOT, 'config', 'threat_feeds.json')
+
+# A feed hit: which feed, its category, how the URL matched and on what entry
+Match = namedtuple('Match', ['feed', 'category', 'match_type', 'indicator'])
+
+
+class FeedIndex:
+    """
+    The entries of one feed file, compiled for constant-time lookups.
+
+    Entries are sorted into three indexes by their shape:
+      - full URLs ('http://evil.example/dl.exe'): exact match on the hash
+        of the canonical URL
+      - bare hosts or domains ('evil.example'): match the host and every
+        subdomain of it
+      - host plus path without a scheme ('evil.example/dl/'), or a URL
+        ending in '*': match any URL on that host whose path starts with it
+    """
+
+    def __init__(self, name: str, category: str):
+        self.name = name
+        self.category = category
+        self.urls = {}      # url_hash -> canonical URL
+        self.hosts = set()
+        self.prefixes = {}  # host -> [path prefix, ...]
+
+    def __len__(self):
+        return len(self.urls) + len(self.hosts) + sum(map(len, self.prefixes.values()))
+
+    def add(self, entry: str):
+        entry = entry.strip()
+        if not entry or entry.startswith('#'):
+            return
+        if '://' not in entry:
+            host, _, path = entry.partition('/')
+            if path:
+                self._add_prefix(host, '/' + path)
+            else:
+                self.hosts.add(host.lower().rstrip('.'))
+            return
+        if entry.endswith('*'):
+            parts = urlsplit(entry[:-1])
+            if parts.hostname:
+                self._add_prefix(parts.hostname, parts.path or '/')
+            return
+        canonical = canonical_url(entry)
+        self.urls[url_hash(canonical)] = canonical
+
+    def _add_prefix(self, host: str, path: str):
+        self.prefixes.setdefault(host.lower(), []).append(path)
+
+
+def _feed_entries(path: str):
+    """Yields the indicators in a feed file: CSV dumps or one entry per line."""
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        if not path.endswith('.csv'):
+            yield from f
+            return
+        # URLhaus/PhishTank-style dumps: the URL is the first field that looks like one
+        for row in csv.reader(line for line in f if not line.startswith('#')):
+            for field in row:
+                if field.startswith(('http://', 'https://')):
+                    yield field
+                    break
+
+
+def load_feed(name: str, category: str, path: str) -> FeedIndex:
+    """Parses one feed file into a FeedIndex."""
+    index = FeedIndex(name, category)
+    for entry in _feed_entries(path):
+        index.add(entry)
+    return index
+
+
+class _CompiledIndex:
+    """All loaded feeds merged into one set of lookup tables."""
+
+    def __init__(self, feeds: list):
+        self.urls, self.hosts, self.prefixes = {}, {}, {}
+        for feed in feeds:
+            for hash64, url in feed.urls.items():
+                self.urls.setdefault(hash64, (feed, url))
+            for host in feed.hosts:
+                self.hosts.setdefault(host, feed)
+            for host, paths in feed.prefixes.items():
+                self.prefixes.setdefault(host, []).extend((path, feed) for path in paths)
+
+
+class ThreatIntelMatcher:
+    """
+    Matches URLs against downloaded threat-intel feeds, with no network calls.
+
+    reload() re-reads only the feed files that changed since the last load,
+    builds a fresh merged index next to the live one and swaps it in with a
+    single assignment, so match() always sees either the old or the new feeds
+    in full. A lookup is a few dict and set probes.
+    """
+
+    def __init__(self, config_path: str = FEEDS_CONFIG):
+        self.config_path = config_path
+        self._feeds = {}      # name -> (file signature, FeedIndex)
+        self._index = _CompiledIndex([])
+
+    def _feed_specs(self) -> list:
+        if not os.path.exists(self.config_path):
+            return []
+        with open(self.config_path, 'r') as f:
+            config = json.load(f)
+        feeds_dir = os.path.join(PROJECT_ROOT, config.get('feeds_dir', 'data/feeds'))
+        return [
+            (spec['name'], spec.get('category', 'malware'), os.path.join(feeds_dir, spec['file']))
+            for spec in config.get('feeds', [])
+        ]
+
+    def reload(self) -> dict:
+        """
+        Loads new or changed feed files and drops feeds whose file is gone.
+
+        Returns {feed name: entry count} for the feeds that were (re)loaded.
+        """
+        feeds, reloaded = {}, {}
+        for name, category, path in self._feed_specs():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size, category)
+            current = self._feeds.get(name)
+            if current and current[0] == signature:
+                feeds[name] = current
+                continue
+            try:
+                index = load_feed(name, category, path)
+            except (OSError, csv.Error) as e:
+                print(f"  [!] Could not load threat feed {name}: {e}")
+                if current:
+                    feeds[name] = current
+                continue
+            feeds[name] = (signature, index)
+            reloaded[name] = len(index)
+
+        if reloaded or feeds.keys() != self._feeds.keys():
+            compiled = _CompiledIndex([index for _, index in feeds.values()])
+            self._feeds, self._index = feeds, compiled
+        return reloaded
+
+    @property
+    def feed_sizes(self) -> dict:
+        return {name: len(index) for name, (_, index) in self._feeds.items()}
+
+    def match(self, url: str):
+        """Returns a Match for the first indicator the URL hits, or None."""
+        index = self._index
+        canonical = canonical_url(url)
+        hit = index.urls.get(url_hash(canonical))
+        if hit and hit[1] == canonical:
+            return Match(hit[0].name, hit[0].category, 'url', hit[1])
+
+        try:
+            parts = urlsplit(canonical)
+        except ValueError:
+            return None
+        host = parts.hostname or ''
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            feed = index.hosts.get('.'.join(labels[i:]))
+            if feed:
+                return Match(feed.name, feed.category, 'host', '.'.join(labels[i:]))
+
+        path = parts.path or '/'
+        for prefix, feed in index.prefixes.get(host, ()):
+            if path.startswith(prefix):
+                return Match(feed.name, feed.category, 'path', host + prefix)
+        return None
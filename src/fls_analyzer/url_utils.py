@@ -0,0 +1,70 @@
+# src/fls_analyzer/url_utils.py
+
+import hashlib
+from functools import lru_cache
+from urllib.parse import urlsplit
+import tldextract
+
+# Number of distinct hostnames to keep resolved in memory
+DOMAIN_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def _registered_domain_for_host(host: str) -> str:
+    """Resolves a hostname to its registered domain, or '' for IPs and unknown suffixes (cached)."""
+    return tldextract.extract(host).registered_domain
+
+
+def registered_domain(url: str, strict: bool = False) -> str:
+    """
+    Returns the registered domain (eTLD+1) of a URL, e.g. 'example.co.uk'.
+
+    Lookups are cached per hostname, since FLS pages on the same host are
+    scraped over and over. Returns an empty string for URLs without a host.
+    IPs and hosts with an unknown suffix have no registered domain: the bare
+    host is returned for them, or an empty string if strict.
+    """
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return ''
+    if not host:
+        return ''
+    return _registered_domain_for_host(host) or ('' if strict else host)
+
+
+def url_hash(url: str) -> int:
+    """
+    Returns a stable signed 64-bit hash of a URL.
+
+    Stored in scraped_urls.url_hash so known URLs can be indexed and loaded
+    as fixed-size integers instead of strings.
+    """
+    digest = hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalizes a URL for use as a cache key.
+
+    Lowercases the scheme and host, drops default ports, fragments and
+    credentials, and gives an empty path a '/'. The query string is kept
+    as is, since it often selects the stream.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if port and port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{port}'
+    canonical = f'{scheme}://{host}{parts.path or "/"}'
+    if parts.query:
+        canonical += f'?{parts.query}'
+    return canonical
@@ -0,0 +1,152 @@
+# src/fls_analyzer/vt_archive.py
+
+import argparse
+import json
+from datetime import datetime
+
+import zstandard
+from sqlalchemy import case, func, select
+
+from . import db_handler
+
+# Level 10 shrinks a typical ~20 KB per-engine response to ~2 KB while
+# compressing thousands of responses per second
+ZSTD_LEVEL = 10
+
+# Engine categories that count towards a positive verdict by default
+POSITIVE_CATEGORIES = ('malicious',)
+
+
+def compress_payload(payload: dict) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+        json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    )
+
+
+def decompress_payload(blob: bytes) -> dict:
+    return json.loads(zstandard.ZstdDecompressor().decompress(blob))
+
+
+def engine_results(payload: dict) -> dict:
+    """Returns {engine name: category} from an archived analysis or URL report."""
+    attributes = payload.get('attributes') or {}
+    results = attributes.get('results') or attributes.get('last_analysis_results') or {}
+    return {engine: (result or {}).get('category') for engine, result in results.items()}
+
+
+def archive_result(session, url_id: int, stats: dict, source: str, payload: dict = None):
+    """
+    Archives the VT response behind a URL's verdict. The caller commits.
+
+    Args:
+        stats: The analysis stats the verdict was taken from.
+        source: 'analysis' (a fresh scan), 'report' (VT's existing URL
+            report) or 'cache' (the local verdict cache).
+        payload: {'type': 'analysis' or 'url', 'attributes': ...} as
+            returned by VT, or None if only the stats are known.
+    """
+    blob = engine_count = analysis_date = None
+    if payload is not None:
+        blob = compress_payload(payload)
+        engine_count = len(engine_results(payload)) or None
+        attributes = payload.get('attributes') or {}
+        timestamp = attributes.get('date') or attributes.get('last_analysis_date')
+        if timestamp:
+            analysis_date = datetime.utcfromtimestamp(timestamp)
+    db_handler.record_vt_report(session, url_id, source, stats, blob, engine_count, analysis_date)
+
+
+def _events_query(*columns):
+    reports = db_handler.VTReport.__table__
+    return (
+        select(db_handler.Event.name.label('event_name'), *columns)
+        .select_from(reports)
+        .join(db_handler.ScrapedURL, db_handler.ScrapedURL.id == reports.c.url_id)
+        .join(db_handler.Event, db_handler.Event.id == db_handler.ScrapedURL.event_id)
+    )
+
+
+def threshold_sweep(session, thresholds, include_suspicious: bool = False) -> dict:
+    """
+    Counts URLs flagged by more than each threshold's number of engines.
+
+    Runs as one aggregate query over the extracted columns, so it needs no
+    decompression. Returns {event name: {'analyzed': n, threshold: positives}}.
+    """
+    reports = db_handler.VTReport.__table__
+    flagged = reports.c.malicious
+    if include_suspicious:
+        flagged = flagged + func.coalesce(reports.c.suspicious, 0)
+    columns = [func.count().label('analyzed')] + [
+        func.sum(case((flagged > threshold, 1), else_=0)).label(f't{threshold}')
+        for threshold in thresholds
+    ]
+    query = _events_query(*columns).where(reports.c.malicious.isnot(None)).group_by(db_handler.Event.name)
+    return {
+        row.event_name: {'analyzed': row.analyzed,
+                         **{threshold: row[f't{threshold}'] or 0 for threshold in thresholds}}
+        for row in session.execute(query).mappings()
+    }
+
+
+def engine_subset_counts(session, engines, threshold: int = 0,
+                         categories=POSITIVE_CATEGORIES) -> dict:
+    """
+    Counts URLs flagged by more than `threshold` of the given engines.
+
+    Decompresses the archived payloads, streamed in url_id order; URLs
+    archived without a payload are reported as 'no_payload'. Returns
+    {event name: {'analyzed': n, 'positive': k, 'no_payload': m}}.
+    """
+    reports = db_handler.VTReport.__table__
+    engines, categories = set(engines), set(categories)
+    decompressor = zstandard.ZstdDecompressor()
+    query = _events_query(reports.c.url_id, reports.c.payload)
+    counts = {}
+    for rows in db_handler.iter_keyset(session, query, reports.c.url_id):
+        for row in rows:
+            event = counts.setdefault(row.event_name, {'analyzed': 0, 'positive': 0, 'no_payload': 0})
+            if row.payload is None:
+                event['no_payload'] += 1
+                continue
+            results = engine_results(json.loads(decompressor.decompress(row.payload)))
+            event['analyzed'] += 1
+            hits = sum(1 for engine, category in results.items()
+                       if engine in engines and category in categories)
+            event['positive'] += hits > threshold
+    return counts
+
+
+if __name__ == '__main__':
+    # Re-evaluates archived VT verdicts offline, e.g.:
+    #   python -m src.fls_analyzer.vt_archive --thresholds 1 3 5 10
+    #   python -m src.fls_analyzer.vt_archive --engines Kaspersky ESET-NOD32 BitDefender --threshold 1
+    parser = argparse.ArgumentParser(description="Recompute VT verdicts from the archived responses.")
+    parser.add_argument('--thresholds', type=int, nargs='+',
+                        default=[1, 2, 3, 5, db_handler.VT_POSITIVE_THRESHOLD, 10])
+    parser.add_argument('--include-suspicious', action='store_true',
+                        help="Count 'suspicious' engine verdicts as positive too.")
+    parser.add_argument('--engines', nargs='+',
+                        help="Only count these engines (decompresses every payload).")
+    parser.add_argument('--threshold', type=int, default=0,
+                        help="With --engines: positive when more than this many of them flag a URL.")
+    args = parser.parse_args()
+
+    session = db_handler.get_session()
+    try:
+        if args.engines:
+            categories = POSITIVE_CATEGORIES + (('suspicious',) if args.include_suspicious else ())
+            counts = engine_subset_counts(session, args.engines, args.threshold, categories)
+            for event_name, event in sorted(counts.items()):
+                share = event['positive'] / event['analyzed'] * 100 if event['analyzed'] else 0.0
+                print(f"{event_name}: {event['positive']}/{event['analyzed']} flagged ({share:.1f}%), "
+                      f"{event['no_payload']} without a stored payload")
+        else:
+            thresholds = sorted(set(args.thresholds))
+            sweep = threshold_sweep(session, thresholds, args.include_suspicious)
+            print("event".ljust(28) + "analyzed".rjust(10) + ''.join(f">{t}".rjust(9) for t in thresholds))
+            for event_name, event in sorted(sweep.items()):
+                print(event_name.ljust(28) + str(event['analyzed']).rjust(10) + ''.join(
+                    f"{event[t] / event['analyzed'] * 100:8.1f}%" for t in thresholds))
+    finally:
+        session.close()
@@ -0,0 +1,269 @@
+# src/fls_analyzer/vt_async.py
+
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from . import db_handler, retries, security_analysis, vt_cache
+
+# URLs being worked on at once (cache check, lookup, submit or polling)
+VT_MAX_IN_FLIGHT = int(os.getenv('VT_MAX_IN_FLIGHT', '50'))
+
+# An analysis is first polled this long after submission, then every
+# POLL_INTERVAL, and abandoned once it is ANALYSIS_TIMEOUT old
+FIRST_POLL_DELAY = float(os.getenv('VT_FIRST_POLL_DELAY', '30'))
+POLL_INTERVAL = float(os.getenv('VT_POLL_INTERVAL', '15'))
+ANALYSIS_TIMEOUT = timedelta(minutes=20)
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=60)
+
+# Quota goes to polls before new lookups and submissions
+PRIORITY_POLL = 0
+PRIORITY_NEW = 1
+
+
+class AnalysisFailed(Exception):
+    """A submitted analysis timed out or disappeared on VT's side."""
+
+
+class VTPipeline:
+    """
+    Keeps many VirusTotal analyses in flight at once.
+
+    Each URL goes through the local verdict cache, then VT's existing report,
+    and only then is submitted. Submitted analysis ids are written to
+    vt_pending_analyses straight away and a single poller checks all of them,
+    oldest first, so one slow analysis no longer holds up the others and a
+    restarted worker resumes polling instead of submitting again. Every
+    request waits for quota from the shared rate limiter. Results are handed
+    to on_result(url_id, stats, source, payload) as they complete, in any
+    order. If the URL could not be analyzed, stats holds an 'error' message
+    and an 'error_kind' (see retries.py); otherwise source says where the
+    verdict came from ('cache', 'report' or 'analysis') and
+    payload is VT's full response for archiving, or None if the verdict came
+    from the local cache (see vt_archive.archive_result).
+    """
+
+    def __init__(self, session, on_result, max_in_flight: int = VT_MAX_IN_FLIGHT):
+        self.session = session
+        self.on_result = on_result
+        self.max_in_flight = max_in_flight
+        self.limiter = security_analysis.get_rate_limiter()
+
+        self._tasks = set()
+        self._waiters = None  # (priority, seq, future) awaiting quota, created in run()
+        self._seq = 0
+        self._outstanding = {}  # analysis_id -> [future, submitted_at, next_poll]
+        self.latencies = deque(maxlen=1000)  # seconds from submission to result
+        self.counts = {'cached': 0, 'reused': 0, 'submitted': 0, 'resumed': 0,
+                       'completed': 0, 'errors': 0}
+
+    # --- HTTP ---
+
+    async def _headers(self, priority: int) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        await self._waiters.put((priority, self._seq, future))
+        return {'x-apikey': await future}
+
+    async def _dispatch_quota(self):
+        """Hands each token from the shared limiter to the most urgent waiting request."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for demand before taking a token from the shared bucket
+            waiter = await self._waiters.get()
+            self._waiters.put_nowait(waiter)
+            # The limiter blocks on the DB-backed bucket, so wait for it off the loop
+            key = await loop.run_in_executor(None, self.limiter.acquire)
+            while not self._waiters.empty():
+                _, _, future = self._waiters.get_nowait()
+                if not future.done():
+                    future.set_result(key)
+                    break
+
+    async def _request(self, http, method: str, url: str, priority: int = PRIORITY_NEW, **kwargs):
+        headers = await self._headers(priority)
+        async with http.request(method, url, headers=headers, **kwargs) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    # --- Per-URL flow ---
+
+    async def _analyze(self, http, url_id: int, url: str) -> tuple:
+        """Returns (stats, source, payload) for one URL."""
+        cached = vt_cache.get_url_verdict(url)
+        if cached is not None:
+            self.counts['cached'] += 1
+            return cached, 'cache', None
+
+        pending = db_handler.get_pending_vt_analysis(self.session, url_id)
+        if pending is not None:
+            self.counts['resumed'] += 1
+            analysis_id, submitted_at = pending.analysis_id, pending.submitted_at
+        else:
+            report = await self._request(
+                http, 'GET', security_analysis.VT_URL_REPORT_ENDPOINT.format(security_analysis.vt_url_id(url))
+            )
+            if report is not None:
+                attributes = report['data']['attributes']
+                stats = security_analysis.fresh_report_stats(attributes)
+                if stats is not None:
+                    self.counts['reused'] += 1
+                    vt_cache.store_verdict(url, stats)
+                    return stats, 'report', {'type': 'url', 'attributes': attributes}
+
+            submitted = await self._request(http, 'POST', security_analysis.VT_URL_SCAN_ENDPOINT,
+                                            data={'url': url})
+            analysis_id, submitted_at = submitted['data']['id'], datetime.utcnow()
+            db_handler.save_pending_vt_analysis(self.session, url_id, analysis_id, submitted_at)
+            self.counts['submitted'] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        next_poll = max(time.monotonic(),
+                        time.monotonic() + FIRST_POLL_DELAY - (datetime.utcnow() - submitted_at).total_seconds())
+        self._outstanding[analysis_id] = [future, submitted_at, next_poll]
+        try:
+            attributes = await future
+        finally:
+            self._outstanding.pop(analysis_id, None)
+        self.latencies.append((datetime.utcnow() - submitted_at).total_seconds())
+        stats = attributes['stats']
+        vt_cache.store_verdict(url, stats)
+        return stats, 'analysis', {'type': 'analysis', 'attributes': attributes}
+
+    async def _process(self, http, url_id: int, url: str):
+        source = payload = None
+        try:
+            stats, source, payload = await self._analyze(http, url_id, url)
+        except AnalysisFailed as e:
+            stats = {"error": str(e), "error_kind": retries.ERROR_TRANSIENT}
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            stats = {"error": f"VirusTotal request failed: {e!r}", "error_kind": retries.classify_exception(e)}
+        except Exception as e:
+            # E.g. a DB error from the cache or pending-analysis writes; the URL
+            # must still be reported, or its lease is held until it expires
+            print(f"  [!] Analysis of URL {url_id} failed unexpectedly: {e!r}")
+            self.session.rollback()
+            stats = {"error": f"Unexpected error: {e!r}", "error_kind": retries.ERROR_TRANSIENT}
+
+        # The error is classified above and the caller schedules the retry;
+        # a domain's rollup is never stored in place of a failed URL's verdict
+        if "error" in stats:
+            self.counts['errors'] += 1
+        else:
+            self.counts['completed'] += 1
+        self.on_result(url_id, stats, source, payload)
+
+    # --- Shared poller ---
+
+    async def _poll_forever(self, http):
+        while True:
+            now = time.monotonic()
+            due = sorted(
+                (entry[1], analysis_id) for analysis_id, entry in self._outstanding.items()
+                if entry[2] <= now
+            )
+            if not due:
+                await asyncio.sleep(1)
+                continue
+            for _, analysis_id in due:
+                entry = self._outstanding.get(analysis_id)
+                if entry is None or entry[0].done():
+                    continue
+                future, submitted_at, _ = entry
+                if datetime.utcnow() - submitted_at > ANALYSIS_TIMEOUT:
+                    future.set_exception(AnalysisFailed("VirusTotal analysis timed out."))
+                    continue
+                entry[2] = time.monotonic() + POLL_INTERVAL
+                try:
+                    result = await self._request(
+                        http, 'GET', security_analysis.VT_URL_ANALYSIS_ENDPOINT.format(analysis_id),
+                        priority=PRIORITY_POLL,
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # Transient; the analysis is polled again on its next turn
+                    print(f"  [!] VT poll of {analysis_id} failed: {e}")
+                    continue
+                if future.done():
+                    continue
+                if result is None:
+                    future.set_exception(AnalysisFailed(f"VirusTotal analysis {analysis_id} not found."))
+                elif result['data']['attributes']['status'] == 'completed':
+                    future.set_result(result['data']['attributes'])
+
+    # --- Driver ---
+
+    def metrics(self) -> dict:
+        """Queue depth, completion counts and submission-to-result latency."""
+        latencies = sorted(self.latencies)
+        return {
+            'in_flight': len(self._tasks),
+            'awaiting_quota': self._waiters.qsize() if self._waiters else 0,
+            'polling': len(self._outstanding),
+            **self.counts,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+        }
+
+    def report(self) -> str:
+        m = self.metrics()
+        return (f"{m['in_flight']} in flight ({m['polling']} polling, "
+                f"{m['awaiting_quota']} waiting for quota); "
+                f"{m['completed']} done, {m['errors']} errors; {m['cached']} cached, "
+                f"{m['reused']} reused, {m['submitted']} submitted, {m['resumed']} resumed; "
+                f"analysis latency avg {m['latency_avg']:.0f}s, p95 {m['latency_p95']:.0f}s")
+
+    async def run(self, claim, idle, min_claim: int = 1, metrics_interval: float = 60,
+                  heartbeat=None, heartbeat_interval: float = 5 * 60):
+        """
+        Runs until cancelled or interrupted.
+
+        claim(limit) must return up to `limit` (url_id, url) pairs to analyze.
+        It is called once at least min_claim slots are free (or nothing is in
+        flight). idle() is awaited when there is nothing to claim or in flight.
+        heartbeat(), if given, is called every heartbeat_interval seconds
+        while URLs are in flight, e.g. to renew their leases: with a slow
+        quota, a full pipeline can take longer than one lease to drain.
+        """
+        self._waiters = asyncio.PriorityQueue()
+        async with aiohttp.ClientSession(timeout=HTTP_TIMEOUT) as http:
+            poller = asyncio.create_task(self._poll_forever(http))
+            dispatcher = asyncio.create_task(self._dispatch_quota())
+            last_report = last_heartbeat = time.monotonic()
+            try:
+                while True:
+                    free = self.max_in_flight - len(self._tasks)
+                    if free >= min(min_claim, self.max_in_flight) or not self._tasks:
+                        claimed = claim(free)
+                    else:
+                        claimed = []
+                    for url_id, url in claimed:
+                        task = asyncio.create_task(self._process(http, url_id, url))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+
+                    if not self._tasks:
+                        await idle()
+                    else:
+                        await asyncio.wait(self._tasks, timeout=5,
+                                           return_when=asyncio.FIRST_COMPLETED)
+
+                    if heartbeat and self._tasks and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                        heartbeat()
+                        last_heartbeat = time.monotonic()
+                    if time.monotonic() - last_report >= metrics_interval:
+                        print(f"[*] VT pipeline: {self.report()}")
+                        last_report = time.monotonic()
+            finally:
+                # Submitted analyses stay in vt_pending_analyses for the next run
+                poller.cancel()
+                dispatcher.cancel()
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(poller, dispatcher, *self._tasks, return_exceptions=True)
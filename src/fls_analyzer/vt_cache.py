@@ -0,0 +1,135 @@
+# src/fls_analyzer/vt_cache.py
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, String, inspect, select
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from . import db_handler
+from .url_utils import canonical_url, registered_domain
+
+# VT verdicts are kept in their own database so they survive rebuilding
+# fls_data.db. Point VT_CACHE_URL at a shared server to share one cache
+# between machines.
+VT_CACHE_URL_ENV = 'VT_CACHE_URL'
+VT_CACHE_PATH = os.path.join(db_handler.DB_DIR, 'vt_cache.db')
+
+# Cached verdicts older than this are ignored and fetched again
+VT_CACHE_TTL = timedelta(days=int(os.getenv('VT_CACHE_TTL_DAYS', '7')))
+
+SCOPE_URL = 'url'
+SCOPE_DOMAIN = 'domain'
+
+CacheBase = declarative_base()
+
+
+class VTVerdict(CacheBase):
+    """
+    A cached VirusTotal verdict.
+
+    URL rows hold the stats VT returned for that (canonical) URL. Domain rows
+    are a rollup of every URL verdict cached for the registered domain: each
+    category holds the highest count seen, so the domain row reflects the
+    worst URL on it. A rollup's fetched_at is when its first verdict was
+    fetched, so it expires a TTL later however many URLs keep arriving, and
+    url_count counts each URL once per rollup.
+
+    Domain rows describe other URLs. They are for reports on URLs that never
+    got their own scan, never a verdict to store for a URL.
+    """
+    __tablename__ = 'vt_verdicts'
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    stats = Column(db_handler.JSONType, nullable=False)
+    url_count = Column(Integer, default=1, nullable=False)
+    fetched_at = Column(DateTime, nullable=False, index=True)
+
+
+_Session = None
+
+
+def get_session():
+    """Provides a session on the verdict cache, creating its table on first use."""
+    global _Session
+    if _Session is None:
+        engine = db_handler.get_engine(
+            os.getenv(VT_CACHE_URL_ENV) or f'sqlite:///{VT_CACHE_PATH}'
+        )
+        if not inspect(engine).has_table(VTVerdict.__tablename__):
+            CacheBase.metadata.create_all(engine)
+        _Session = sessionmaker(bind=engine)
+    return _Session()
+
+
+def _fresh(session, scope: str, key: str, ttl: timedelta):
+    return session.execute(
+        select(VTVerdict.stats)
+        .where(VTVerdict.scope == scope, VTVerdict.key == key,
+               VTVerdict.fetched_at >= datetime.utcnow() - ttl)
+    ).scalar_one_or_none()
+
+
+def get_url_verdict(url: str, ttl: timedelta = VT_CACHE_TTL):
+    """Returns the cached VT stats for a URL, or None if missing or expired."""
+    with get_session() as session:
+        return _fresh(session, SCOPE_URL, canonical_url(url), ttl)
+
+
+def get_domain_verdict(url: str, ttl: timedelta = VT_CACHE_TTL):
+    """Returns the rolled-up VT stats for a URL's registered domain, or None."""
+    domain = registered_domain(url)
+    if not domain:
+        return None
+    with get_session() as session:
+        return _fresh(session, SCOPE_DOMAIN, domain, ttl)
+
+
+def get_domain_verdicts(domains, ttl: timedelta = None, chunk_size: int = db_handler.INSERT_CHUNK_SIZE) -> dict:
+    """
+    Returns {registered domain: rolled-up VT stats} for the given domains.
+
+    For reports, so by default rollups of any age are returned; pass ttl to
+    skip expired ones. Domains without a rollup are left out.
+    """
+    verdicts = {}
+    with get_session() as session:
+        for chunk in db_handler._chunked(sorted(set(domains)), chunk_size):
+            query = select(VTVerdict.key, VTVerdict.stats).where(
+                VTVerdict.scope == SCOPE_DOMAIN, VTVerdict.key.in_(chunk))
+            if ttl is not None:
+                query = query.where(VTVerdict.fetched_at >= datetime.utcnow() - ttl)
+            verdicts.update(session.execute(query).tuples().all())
+    return verdicts
+
+
+def store_verdict(url: str, stats: dict, fetched_at: datetime = None):
+    """
+    Caches a URL's VT stats and folds them into its domain's rollup.
+
+    Runs in its own short transaction, independent of the caller's session.
+    """
+    fetched_at = fetched_at or datetime.utcnow()
+    domain = registered_domain(url)
+    key = canonical_url(url)
+    with get_session() as session:
+        previous = session.get(VTVerdict, (SCOPE_URL, key))
+        previous_at = previous.fetched_at if previous is not None else None
+        session.merge(VTVerdict(scope=SCOPE_URL, key=key, stats=stats,
+                                url_count=1, fetched_at=fetched_at))
+        if domain:
+            rollup = session.get(VTVerdict, (SCOPE_DOMAIN, domain))
+            if rollup is None or rollup.fetched_at < fetched_at - VT_CACHE_TTL:
+                # Start over rather than folding in an expired rollup
+                session.merge(VTVerdict(scope=SCOPE_DOMAIN, key=domain, stats=dict(stats),
+                                        url_count=1, fetched_at=fetched_at))
+            else:
+                merged = dict(rollup.stats)
+                for category, count in stats.items():
+                    merged[category] = max(merged.get(category, 0), count)
+                rollup.stats = merged
+                # A refetched URL is already counted in this rollup
+                if previous_at is None or previous_at < rollup.fetched_at:
+                    rollup.url_count += 1
+                # fetched_at stays at the rollup's start so that it expires
+        session.commit()
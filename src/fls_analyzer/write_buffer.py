@@ -0,0 +1,149 @@
+# src/fls_analyzer/write_buffer.py
+
+import signal
+import time
+
+# Defaults for how long results may sit in memory before they are committed
+DEFAULT_MAX_ITEMS = 50
+DEFAULT_MAX_DELAY = 30.0  # seconds
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer that applies queued database writes as one group commit.
+
+    Each queued write is a callable taking the session. Writes are only run
+    when the buffer flushes, inside a single transaction, so a group of results
+    costs one commit (one fsync under WAL) and the write lock is held only for
+    the flush itself. The buffer flushes once it holds max_items writes or its
+    oldest write is max_delay seconds old; the time limit is checked whenever
+    add() or maybe_flush() is called, so idle loops should call maybe_flush().
+
+    A write that also updates in-memory state (a cache, a counter) returns a
+    callable doing so instead; it is called only once the group is committed,
+    so a rolled-back group leaves that state untouched.
+
+    Usage:
+        buffer = WriteBuffer(session)
+        buffer.install_signal_handlers()
+        try:
+            buffer.add(db_handler.record_security_result, url_id, vt_score)
+        finally:
+            buffer.close()
+    """
+
+    def __init__(self, session, max_items: int = DEFAULT_MAX_ITEMS,
+                 max_delay: float = DEFAULT_MAX_DELAY):
+        self.session = session
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._pending = []
+        self._oldest = None
+        self._flushing = False
+        self._closed = False
+        self._deferred_signal = None
+
+        self.flushes = 0
+        self.items_written = 0
+        self.largest_batch = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, write, *args, **kwargs):
+        """
+        Queues write(session, *args, **kwargs) and flushes if a threshold is
+        reached. If the write returns a callable, it is called after the commit.
+        """
+        if not self._pending:
+            self._oldest = time.monotonic()
+        self._pending.append((write, args, kwargs))
+        self.maybe_flush()
+
+    def maybe_flush(self) -> bool:
+        """Flushes if the size or age threshold has been reached."""
+        if not self._pending:
+            return False
+        if (len(self._pending) >= self.max_items
+                or time.monotonic() - self._oldest >= self.max_delay):
+            self.flush()
+            return True
+        return False
+
+    def flush(self) -> int:
+        """
+        Runs all queued writes in one transaction and commits.
+
+        If any write fails the whole group is rolled back and the error is
+        raised; the queue is left intact so the caller can retry or give up.
+        A signal held during a failed flush is dropped, since the error already
+        ends the caller's loop. Returns the number of writes committed.
+        """
+        if not self._pending:
+            return 0
+        batch = self._pending
+        started = time.monotonic()
+        self._flushing = True
+        try:
+            on_commit = [write(self.session, *args, **kwargs) for write, args, kwargs in batch]
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            self._deferred_signal = None
+            raise
+        finally:
+            self._flushing = False
+        latency = time.monotonic() - started
+        for callback in on_commit:
+            if callable(callback):
+                callback()
+
+        self._pending = []
+        self._oldest = None
+        self.flushes += 1
+        self.items_written += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        print(f"  [db] Committed {len(batch)} writes in {latency * 1000:.0f} ms.")
+
+        # A signal that arrived mid-flush is delivered now that the data is safe
+        if self._deferred_signal is not None and not self._closed:
+            self._deferred_signal = None
+            raise KeyboardInterrupt
+        return len(batch)
+
+    def close(self) -> int:
+        """
+        Final flush on shutdown. From here on signals are held instead of
+        raised, so the caller's remaining cleanup (releasing leases, closing
+        the session) runs to the end. Returns the number of writes committed.
+        """
+        self._closed = True
+        return self.flush()
+
+    def install_signal_handlers(self):
+        """
+        Turns SIGTERM into KeyboardInterrupt, like SIGINT, so the caller's
+        cleanup (and final flush) also runs under a process manager. Either
+        signal arriving during a flush is held until the commit completes, and
+        after close() it is not raised at all.
+        """
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+
+    def _handle_signal(self, signum, frame):
+        if self._flushing or self._closed:
+            self._deferred_signal = signum
+            return
+        raise KeyboardInterrupt
+
+    def report(self) -> str:
+        if not self.flushes:
+            return "no writes committed"
+        return (f"{self.items_written} writes in {self.flushes} commits "
+                f"(avg batch {self.items_written / self.flushes:.1f}, max {self.largest_batch}; "
+                f"avg latency {self.total_latency / self.flushes * 1000:.0f} ms, "
+                f"max {self.max_latency * 1000:.0f} ms)")
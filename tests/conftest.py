@@ -0,0 +1,72 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Add project root to the Python path, as the scripts do
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+
+class Drained(Exception):
+    """Every URL handed to run_vt_pipeline has been reported."""
+
+
+def use_vt_cache(tmp_path, monkeypatch):
+    """Points vt_cache at a fresh database under tmp_path."""
+    from src.fls_analyzer import vt_cache
+    monkeypatch.setenv(vt_cache.VT_CACHE_URL_ENV, f"sqlite:///{tmp_path / 'vt_cache.db'}")
+    monkeypatch.setattr(vt_cache, '_Session', None)
+
+
+def run_vt_pipeline(monkeypatch, session, app, urls: dict, on_result=None, heartbeat=None,
+                    **kwargs) -> tuple:
+    """
+    Analyzes urls ({url_id: url}) with a VTPipeline against app, a
+    mock_virustotal app served on a local port, with an unlimited quota.
+
+    Returns ({url_id: (stats, source, payload)}, the pipeline) once every URL
+    has been reported. on_result, if given, is called first for each result;
+    heartbeat, if given, on every turn of the pipeline with URLs in flight.
+    """
+    import asyncio
+    from aiohttp.test_utils import TestServer
+    from src.fls_analyzer import security_analysis, vt_async
+    from src.fls_analyzer.rate_limiter import RateLimiter
+
+    monkeypatch.setattr(security_analysis, '_limiter', RateLimiter('virustotal', ['test-key'], 1e9, 10 ** 9))
+    monkeypatch.setattr(vt_async, 'FIRST_POLL_DELAY', 0)
+    monkeypatch.setattr(vt_async, 'POLL_INTERVAL', 0.1)
+    results = {}
+    queue = list(urls.items())
+
+    def claim(limit):
+        claimed, queue[:] = queue[:limit], queue[limit:]
+        return claimed
+
+    def record(url_id, stats, source, payload):
+        if on_result is not None:
+            on_result(url_id, stats, source, payload)
+        results[url_id] = (stats, source, payload)
+
+    async def idle():
+        raise Drained()
+
+    async def main():
+        server = TestServer(app)
+        await server.start_server()
+        base = str(server.make_url('')).rstrip('/')
+        monkeypatch.setattr(security_analysis, 'VT_URL_SCAN_ENDPOINT', f'{base}/urls')
+        monkeypatch.setattr(security_analysis, 'VT_URL_ANALYSIS_ENDPOINT', base + '/analyses/{}')
+        monkeypatch.setattr(security_analysis, 'VT_URL_REPORT_ENDPOINT', base + '/urls/{}')
+        pipeline = vt_async.VTPipeline(session, record, **kwargs)
+        try:
+            await pipeline.run(claim, idle, heartbeat=heartbeat, heartbeat_interval=0)
+        except Drained:
+            pass
+        finally:
+            await server.close()
+        return pipeline
+
+    pipeline = asyncio.run(main())
+    return results, pipeline
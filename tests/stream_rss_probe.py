@@ -0,0 +1,63 @@
+# tests/stream_rss_probe.py
+
+"""
+Reads a database through one of the streaming helpers and prints, as JSON,
+the process' peak RSS (in MB) after each chunk. Run in a fresh interpreter
+by test_streaming_memory.py, so the peak reflects only this read.
+
+    python tests/stream_rss_probe.py sqlite:////tmp/synthetic.db keyset|privacy
+"""
+
+import importlib
+import json
+import os
+import resource
+import sys
+
+from sqlalchemy import select
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, 'scripts'))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def main():
+    database_url, mode = sys.argv[1], sys.argv[2]
+    os.environ['FLS_DATABASE_URL'] = database_url
+    from src.fls_analyzer import db_handler
+
+    samples, rows_read = [], 0
+    if mode == 'keyset':
+        urls = db_handler.ScrapedURL.__table__
+        session = db_handler.get_session()
+        query = select(urls.c.id, urls.c.url, urls.c.first_seen)
+        for rows in db_handler.iter_keyset(session, query, urls.c.id):
+            rows_read += len(rows)
+            samples.append(peak_rss_mb())
+        session.close()
+    else:
+        # Table II's aggregation, sampled after each chunk it folds in
+        figures = importlib.import_module('4_generate_figures')
+        iter_rows = db_handler.iter_rows
+
+        def sampled(*args, **kwargs):
+            nonlocal rows_read
+            for rows in iter_rows(*args, **kwargs):
+                yield rows
+                rows_read += len(rows)
+                samples.append(peak_rss_mb())
+
+        db_handler.iter_rows = sampled
+        figures.aggregate_privacy_stats()
+
+    print(json.dumps({'rows': rows_read, 'peak_rss_mb': samples}))
+
+
+if __name__ == '__main__':
+    main()
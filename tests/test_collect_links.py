@@ -0,0 +1,92 @@
+# tests/test_collect_links.py
+
+import importlib.util
+import os
+
+import pytest
+
+from conftest import PROJECT_ROOT
+from src.fls_analyzer import db_handler
+from src.fls_analyzer.bloom import BloomFilter
+from src.fls_analyzer.url_utils import url_hash
+
+AGGREGATOR = 'https://aggregator.example'
+STORED = [f'https://s{i}.streams.example/watch' for i in range(5)]
+
+
+def _load_script():
+    """Imports scripts/1_collect_links.py, whose name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(
+        'collect_links', os.path.join(PROJECT_ROOT, 'scripts', '1_collect_links.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+collect_links = _load_script()
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A fresh database holding STORED."""
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, STORED, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def known_urls(session):
+    return collect_links.load_known_urls(session)
+
+
+def _store(session, links, known_urls, stats) -> int:
+    cycle = db_handler.start_collection_cycle(session)
+    on_commit = collect_links.store_links(session, AGGREGATOR, 1, cycle.id, set(links), known_urls, stats)
+    session.commit()
+    on_commit()
+    return cycle.id
+
+
+def _sighted(session, cycle_id: int) -> set:
+    return {url for url, in session.query(db_handler.ScrapedURL.url)
+            .join(db_handler.URLSighting, db_handler.URLSighting.url_id == db_handler.ScrapedURL.id)
+            .filter(db_handler.URLSighting.last_cycle_id == cycle_id)}
+
+
+def test_known_links_are_sighted_without_an_id_lookup(session, known_urls, monkeypatch):
+    def no_lookup(*args, **kwargs):
+        raise AssertionError('get_url_ids called')
+
+    monkeypatch.setattr(db_handler, 'get_url_ids', no_lookup)
+    stats = {'links': 0, 'filtered': 0, 'false_positives': 0}
+    new = 'https://new.streams.example/watch'
+    cycle_id = _store(session, STORED + [new], known_urls, stats)
+
+    assert _sighted(session, cycle_id) == set(STORED) | {new}
+    assert stats == {'links': 6, 'filtered': 5, 'false_positives': 0}
+    assert new in known_urls
+    assert session.query(db_handler.ScrapedURL).count() == 6
+
+
+def test_a_filter_false_positive_is_still_stored(session, known_urls):
+    unseen = 'https://collision.streams.example/watch'
+    known_urls.add_hash(url_hash(unseen))  # as if its bits were all set by other URLs
+    stats = {'links': 0, 'filtered': 0, 'false_positives': 0}
+    cycle_id = _store(session, [STORED[0], unseen], known_urls, stats)
+
+    assert _sighted(session, cycle_id) == {STORED[0], unseen}
+    assert stats['false_positives'] == 1 and stats['filtered'] == 1
+    assert db_handler.get_url_ids(session, [unseen])
+
+
+def test_relisted_links_extend_their_interval(session, known_urls):
+    stats = {'links': 0, 'filtered': 0, 'false_positives': 0}
+    for _ in range(3):
+        _store(session, STORED[:2], known_urls, stats)
+    sightings = session.query(db_handler.URLSighting).all()
+    assert len(sightings) == 2
+    assert all(s.sightings == 3 for s in sightings)
@@ -0,0 +1,80 @@
+# tests/test_domains.py
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from src.fls_analyzer import db_handler
+from src.fls_analyzer.url_utils import registered_domain, url_hash
+
+URLS = ['https://a.streams.example.co.uk/watch/1', 'https://b.streams.example.co.uk/watch/2',
+        'http://192.0.2.7/live']
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    yield session
+    session.close()
+
+
+def _domains(session) -> dict:
+    return {d.name: d for d in session.query(db_handler.Domain)}
+
+
+@pytest.mark.parametrize('url, domain, strict_domain', [
+    ('https://a.streams.example.co.uk/watch', 'example.co.uk', 'example.co.uk'),
+    ('http://192.0.2.7/live', '192.0.2.7', ''),
+    ('https://intranet.unknownsuffix/x', 'intranet.unknownsuffix', ''),
+    ('not a url', '', ''),
+])
+def test_registered_domain(url, domain, strict_domain):
+    assert registered_domain(url) == domain
+    assert registered_domain(url, strict=True) == strict_domain
+
+
+def test_ingest_counts_each_url_once(session):
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    db_handler.insert_new_urls(session, URLS[:1], event_id=1, aggregator_id=None)  # already stored
+    session.commit()
+
+    domains = _domains(session)
+    assert {name: d.url_count for name, d in domains.items()} == {'example.co.uk': 2, '192.0.2.7': 1}
+    assert domains['example.co.uk'].first_seen is not None
+
+
+def test_max_vt_score_only_rises(session):
+    ids = db_handler.insert_new_urls(session, URLS[:2], event_id=1, aggregator_id=None)
+    for url, score in zip(URLS[:2], (7, 2)):
+        db_handler.record_security_result(session, ids[url], score)
+    session.commit()
+    assert _domains(session)['example.co.uk'].max_vt_score == 7
+
+
+def test_publisher_ids_are_counted_once_per_domain(session):
+    ids = db_handler.insert_new_urls(session, URLS[:2], event_id=1, aggregator_id=None)
+    assert db_handler.add_domain_publisher_ids(session, ids[URLS[0]], ['UA-1-1', 'pub-1']) == 2
+    assert db_handler.add_domain_publisher_ids(session, ids[URLS[1]], ['UA-1-1', 'UA-2-1']) == 1
+    session.commit()
+    assert _domains(session)['example.co.uk'].publisher_id_count == 3
+
+
+def test_backfill_links_old_urls_and_folds_in_results(session):
+    # URLs stored before the domains table existed
+    seen = datetime(2025, 4, 1)
+    session.execute(insert(db_handler.ScrapedURL.__table__), [
+        {'id': i + 1, 'url': url, 'url_hash': url_hash(url), 'event_id': 1, 'first_seen': seen}
+        for i, url in enumerate(URLS)
+    ])
+    session.add(db_handler.SecurityAnalysis(url_id=1, vt_score=4))
+    session.commit()
+
+    assert db_handler.backfill_domains(session, chunk_size=2) == 3
+    assert db_handler.backfill_domains(session) == 0  # nothing left to link
+    session.commit()
+    domains = _domains(session)
+    assert domains['example.co.uk'].url_count == 2 and domains['example.co.uk'].max_vt_score == 4
+    assert domains['example.co.uk'].first_seen == seen
@@ -0,0 +1,78 @@
+# tests/test_export.py
+
+import pyarrow.dataset as ds
+import pytest
+
+from src.fls_analyzer import db_handler, export
+
+URLS = [f'https://s{i}.streams.example/watch' for i in range(30)]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def _raw(export_dir):
+    """The exported rows as a plain Parquet reader sees them, without load_dataset's dedupe."""
+    return ds.dataset(str(export_dir), format='parquet', partitioning=export.PARTITIONING).to_table()
+
+
+def _part_files(export_dir) -> list:
+    return sorted(path for path in export_dir.rglob('*.parquet') if not path.name.startswith('_'))
+
+
+def test_reexported_urls_replace_their_old_rows(session, tmp_path):
+    export_dir = tmp_path / 'export'
+    assert export.export_dataset(session, str(export_dir), chunk_size=7) == len(URLS)
+    assert len(_part_files(export_dir)) == 1  # the chunks' files compacted into one
+
+    ids = db_handler.get_url_ids(session, URLS[:3])
+    db_handler.record_security_result(session, ids[URLS[0]], None, intel_feed='urlhaus',
+                                      intel_match_type='url', intel_indicator=URLS[0])
+    for url_id in ids.values():
+        db_handler.record_phishing_result(session, url_id, 0.9, True)
+    session.commit()
+
+    assert export.export_dataset(session, str(export_dir)) >= 3
+    raw = _raw(export_dir).to_pandas()
+    assert len(raw) == len(URLS) and raw['url_id'].is_unique
+    assert len(_part_files(export_dir)) == 1
+    flagged = raw[raw['url_id'].isin(ids.values())]
+    assert flagged['is_phishing'].all() and (flagged['phishing_score'] == 0.9).all()
+
+    df = export.load_dataset(columns=['url_id', 'phishing_score', 'intel_feed', 'event', 'day'],
+                             export_dir=str(export_dir))
+    assert len(df) == len(URLS) and set(df['event']) == {'UCL 2025'}
+    assert df['phishing_score'].notna().sum() == 3
+    assert df.loc[df['url_id'] == ids[URLS[0]], 'intel_feed'].item() == 'urlhaus'
+
+
+def test_interrupted_compaction_leaves_no_gap(session, tmp_path, monkeypatch):
+    export_dir = tmp_path / 'export'
+    export.export_dataset(session, str(export_dir))
+    url_id = db_handler.get_url_ids(session, URLS[:1])[URLS[0]]
+    db_handler.record_phishing_result(session, url_id, 0.8, True)
+    session.commit()
+
+    monkeypatch.setattr(export, '_compact_partition', lambda *args: None)
+    export.export_dataset(session, str(export_dir))
+    assert len(_raw(export_dir)) > len(URLS)  # duplicates, but every row is there
+    df = export.load_dataset(columns=['url_id', 'phishing_score'], export_dir=str(export_dir))
+    assert len(df) == len(URLS)
+    assert df.loc[df['url_id'] == url_id, 'phishing_score'].item() == 0.8
+
+    monkeypatch.undo()
+    export.export_dataset(session, str(export_dir))
+    assert _raw(export_dir).num_rows == len(URLS)
+
+
+def test_load_dataset_before_the_first_export(tmp_path):
+    df = export.load_dataset(columns=['url_id', 'intel_feed'], export_dir=str(tmp_path / 'none'))
+    assert df.empty and list(df.columns) == ['url_id', 'intel_feed']
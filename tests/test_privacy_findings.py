@@ -0,0 +1,59 @@
+# tests/test_privacy_findings.py
+
+import pytest
+
+from src.fls_analyzer import db_handler
+
+URLS = ['https://a.streams.example/watch', 'https://b.streams.example/watch']
+
+VP_DATA = {
+    'CA': {'google_ids': {'GA_UA': ['UA-111-1'], 'ADSENSE': ['pub-1234567890123456']},
+           'fingerprinting_techniques': ['canvas.todataurl', 'audiocontext']},
+    'US': {'google_ids': {'GA_UA': ['UA-111-1']},
+           'fingerprinting_techniques': ['canvas.todataurl']},
+}
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def _ids(session) -> dict:
+    return db_handler.get_url_ids(session, URLS)
+
+
+def test_findings_are_stored_as_rows_per_vantage_point(session):
+    ids = _ids(session)
+    db_handler.record_privacy_result(session, ids[URLS[0]], VP_DATA, ['UA-111-1', 'pub-1234567890123456'])
+    db_handler.record_privacy_result(session, ids[URLS[1]], {'US': VP_DATA['US']}, ['UA-111-1'])
+    session.commit()
+
+    assert session.query(db_handler.PublisherIDFinding).count() == 4
+    assert [row.url for row in db_handler.get_urls_sharing_id(session, 'UA-111-1')] == URLS
+    assert [row.url for row in db_handler.get_urls_sharing_id(session, 'pub-1234567890123456')] == URLS[:1]
+    assert db_handler.count_urls_with_technique(session, 'canvas.todataurl') == 2
+    assert db_handler.count_urls_with_technique(session, 'audiocontext', vantage_point='US') == 0
+    assert db_handler.count_urls_with_technique(session, 'nonexistent') == 0
+
+
+def test_backfill_explodes_existing_json_once(session):
+    ids = _ids(session)
+    # A result stored before the findings tables existed
+    session.add(db_handler.PrivacyAnalysis(url_id=ids[URLS[0]], vp_analysis_data=VP_DATA,
+                                           google_publisher_ids=['UA-111-1']))
+    session.add(db_handler.PrivacyAnalysis(url_id=ids[URLS[1]], vp_analysis_data=None,
+                                           google_publisher_ids=[]))
+    session.commit()
+
+    for _ in range(2):  # re-running adds nothing
+        assert db_handler.backfill_privacy_findings(session, chunk_size=1) == 2
+        session.commit()
+    assert session.query(db_handler.PublisherIDFinding).count() == 3
+    assert session.query(db_handler.FingerprintFinding).count() == 3
@@ -0,0 +1,53 @@
+# tests/test_rate_limiter.py
+
+import threading
+
+import pytest
+
+from src.fls_analyzer import db_handler
+from src.fls_analyzer.rate_limiter import QuotaExhausted, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+
+
+def test_keys_are_rotated():
+    limiter = RateLimiter('vt', ['k1', 'k2'], per_minute=1e6, per_day=100)
+    assert [limiter.acquire() for _ in range(4)] == ['k1', 'k2', 'k1', 'k2']
+    assert set(limiter.usage().values()) == {2}
+
+
+def test_workers_share_one_bucket():
+    # Two processes' limiters over the same key: the burst is handed out once
+    limiters = [RateLimiter('vt', ['k1'], per_minute=0.001, per_day=100, burst=3) for _ in range(2)]
+    taken, refused = [], []
+
+    def take(limiter):
+        for _ in range(3):
+            try:
+                taken.append(limiter.acquire(timeout=0.05))
+            except QuotaExhausted:
+                refused.append(limiter)
+
+    threads = [threading.Thread(target=take, args=(limiter,)) for limiter in limiters]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(taken) == 3 and len(refused) == 3
+    assert limiters[0].usage() == limiters[1].usage() and sum(limiters[0].usage().values()) == 3
+
+
+def test_the_daily_quota_is_not_exceeded():
+    limiter = RateLimiter('vt', ['k1', 'k2'], per_minute=1e6, per_day=1)
+    assert sorted(limiter.acquire() for _ in range(2)) == ['k1', 'k2']
+    with pytest.raises(QuotaExhausted):
+        limiter.acquire(timeout=0.5)
+
+
+def test_keys_are_required():
+    with pytest.raises(ValueError):
+        RateLimiter('vt', [], per_minute=4, per_day=500)
@@ -0,0 +1,90 @@
+# tests/test_retries.py
+
+from datetime import datetime
+
+import pytest
+import requests
+
+from src.fls_analyzer import db_handler, retries
+
+URL = 'https://stream.example/watch'
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, [URL], event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize('status, kind', [
+    (429, retries.ERROR_QUOTA),
+    (401, retries.ERROR_PERMANENT),
+    (403, retries.ERROR_PERMANENT),
+    (400, retries.ERROR_PERMANENT),
+    (503, retries.ERROR_TRANSIENT),
+])
+def test_http_errors_are_classified_by_status(status, kind):
+    assert retries.classify_status(status) == kind
+    assert retries.classify_exception(_http_error(status)) == kind
+
+
+def test_errors_without_a_status_are_transient():
+    assert retries.classify_exception(TimeoutError()) == retries.ERROR_TRANSIENT
+    assert retries.classify_exception(requests.ConnectionError()) == retries.ERROR_TRANSIENT
+
+
+def test_transient_retries_back_off_until_the_attempts_run_out():
+    now = datetime(2026, 1, 1)
+    first = retries.next_attempt_at(retries.ERROR_TRANSIENT, 1, now) - now
+    second = retries.next_attempt_at(retries.ERROR_TRANSIENT, 2, now) - now
+    assert retries.RETRY_BASE_DELAY <= first <= retries.RETRY_BASE_DELAY * 1.25
+    assert second >= 2 * retries.RETRY_BASE_DELAY
+    assert retries.next_attempt_at(retries.ERROR_TRANSIENT, retries.RETRY_MAX_ATTEMPTS, now) is None
+    assert retries.next_attempt_at(retries.ERROR_PERMANENT, 1, now) is None
+    # Quota errors wait, however many attempts were made
+    assert (retries.next_attempt_at(retries.ERROR_QUOTA, retries.RETRY_MAX_ATTEMPTS, now)
+            == now + retries.RETRY_QUOTA_DELAY)
+
+
+def _fail(session, error_kind: str) -> db_handler.SecurityTask:
+    url_ids = db_handler.claim_tasks(session, 'security', 'w1', limit=1, lease_seconds=60)
+    state = db_handler.fail_task(session, 'security', url_ids[0], 'w1', error_kind, 'boom')
+    session.commit()
+    task = session.query(db_handler.SecurityTask).one()
+    assert task.state == state
+    return task
+
+
+def test_quota_errors_hand_back_their_attempt(session):
+    task = _fail(session, retries.ERROR_QUOTA)
+    assert task.state == db_handler.TASK_RETRY and task.attempts == 0
+
+
+def test_a_rejected_key_is_not_retried(session):
+    kind = retries.classify_exception(_http_error(401))
+    task = _fail(session, kind)
+    assert task.state == db_handler.TASK_FAILED and task.error_kind == retries.ERROR_PERMANENT
+
+
+def test_old_error_markers_are_rescheduled(session):
+    url_id = db_handler.get_url_ids(session, [URL])[URL]
+    session.add(db_handler.SecurityAnalysis(url_id=url_id, vt_score=-1))
+    _fail(session, retries.ERROR_PERMANENT)
+
+    assert db_handler.requeue_vt_errors(session) == 1
+    session.commit()
+    task = session.query(db_handler.SecurityTask).one()
+    assert task.state == db_handler.TASK_RETRY and task.attempts == 0
+    assert task.next_attempt_at <= datetime.utcnow()
+    assert session.query(db_handler.SecurityAnalysis).one().vt_score is None
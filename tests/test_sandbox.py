@@ -0,0 +1,122 @@
+# tests/test_sandbox.py
+
+import asyncio
+import hashlib
+from datetime import datetime
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.fls_analyzer import db_handler, mock_sandbox, sandbox
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A session on a fresh SQLite database holding two payloads."""
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    now = datetime.utcnow()
+    for i in range(2):
+        data = f'payload {i}'.encode() * 64
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = tmp_path / sha256
+        path.write_bytes(data)
+        session.add(db_handler.Download(sha256=sha256, size=len(data), file_name=f'payload-{i}.exe',
+                                        storage_path=str(path), first_seen=now, last_seen=now))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _run_queue(session, app, **kwargs) -> tuple:
+    """Runs the queue against `app` until no payload is left; returns (queue, server stats)."""
+    async def run():
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            queue = sandbox.SandboxQueue(session, base_url=str(server.make_url('')).rstrip('/'),
+                                         token=None, poll_interval=0.05, **kwargs)
+            await asyncio.wait_for(queue.run(once=True, idle_seconds=0.1), timeout=30)
+            async with aiohttp.ClientSession() as http:
+                async with http.get(server.make_url('/stats')) as response:
+                    stats = await response.json()
+        finally:
+            await server.close()
+        return queue, stats
+
+    return asyncio.run(run())
+
+
+def _downloads(session) -> list:
+    session.expire_all()
+    return session.query(db_handler.Download).order_by(db_handler.Download.sha256).all()
+
+
+def test_payloads_are_submitted_polled_and_reported(session):
+    queue, stats = _run_queue(session, mock_sandbox.create_app(analysis_seconds=0.2))
+
+    assert queue.counts['submitted'] == 2 and queue.counts['reported'] == 2
+    assert stats['submitted'] == 2 and stats['reports_served'] == 2
+    for download in _downloads(session):
+        assert download.sandbox_status == 'reported'
+        assert download.sandbox_task_id is not None
+        report = db_handler.get_sandbox_report(session, download.sha256)
+        assert report['target']['file']['sha256'] == download.sha256
+        assert download.sandbox_score == report['info']['score']
+
+
+def test_resumed_task_unknown_to_the_sandbox_fails(session):
+    download = _downloads(session)[0]
+    db_handler.save_sandbox_task(session, download.sha256, 999)
+
+    queue, stats = _run_queue(session, mock_sandbox.create_app(analysis_seconds=0))
+
+    assert queue.counts['resumed'] == 1 and queue.counts['failed'] == 1
+    assert stats['submitted'] == 1  # only the other payload is uploaded
+    resumed = next(d for d in _downloads(session) if d.sha256 == download.sha256)
+    assert resumed.sandbox_status == 'failed'
+    assert 'not found' in resumed.sandbox_error
+
+
+def test_failed_submissions_are_retried(session):
+    failures = {'left': 2}
+
+    @web.middleware
+    async def fail_first_submits(request, handler):
+        if request.path == '/tasks/create/file' and failures['left']:
+            failures['left'] -= 1
+            return web.json_response({'error': 'busy'}, status=503)
+        return await handler(request)
+
+    app = mock_sandbox.create_app(analysis_seconds=0)
+    app.middlewares.append(fail_first_submits)
+    queue, _ = _run_queue(session, app, max_in_flight=1)
+
+    assert queue.counts['retried'] == 2 and queue.counts['reported'] == 2
+    downloads = _downloads(session)
+    assert all(d.sandbox_status == 'reported' for d in downloads)
+    assert sum(d.sandbox_attempts or 0 for d in downloads) == 2
+
+
+def test_server_errors_are_capped_at_max_attempts(session):
+    app = mock_sandbox.create_app(analysis_seconds=0, error_rate=1.0, error_status=503)
+    queue, stats = _run_queue(session, app, max_attempts=3)
+
+    assert queue.counts['failed'] == 2 and queue.counts['reported'] == 0
+    assert queue.counts['retried'] == 2 * (3 - 1)
+    assert stats['errors'] == 2 * 3
+    for download in _downloads(session):
+        assert download.sandbox_status == 'failed'
+        assert download.sandbox_attempts == 3
+        assert '503' in download.sandbox_error
+
+
+def test_permanent_errors_are_not_retried(session):
+    app = mock_sandbox.create_app(analysis_seconds=0, error_rate=1.0, error_status=400)
+    queue, _ = _run_queue(session, app)
+
+    assert queue.counts['failed'] == 2 and queue.counts['retried'] == 0
+    assert all(d.sandbox_attempts == 1 for d in _downloads(session))
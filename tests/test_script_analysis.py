@@ -0,0 +1,135 @@
+# tests/test_script_analysis.py
+
+import time
+
+import pytest
+
+from src.fls_analyzer import db_handler, script_analysis
+from src.fls_analyzer.script_analysis import ScriptAnalyzer
+
+# The study's original fingerprinting keywords, which must keep counting
+BASELINE_KEYWORDS = ('canvas.todataurl', 'getclientrects', 'navigatordetails', 'audiocontext', 'getplugindata')
+BASELINE_CALLS = {
+    'canvas.todataurl': "var png = canvas.toDataURL('image/png');",
+    'getclientrects': "var rects = span.getClientRects();",
+    'navigatordetails': "collect(navigatorDetails);",
+    'audiocontext': "var ctx = new AudioContext();",
+    'getplugindata': "var plugins = getPluginData();",
+}
+
+
+EXTERNAL = 'https://cdn.example/fp.js'
+
+
+def _page(*bodies) -> str:
+    return ''.join(f'<script>{body}</script>' for body in bodies)
+
+
+def _external_page(*srcs) -> str:
+    return ''.join(f'<script src="{src}"></script>' for src in srcs)
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize('keyword', BASELINE_KEYWORDS)
+def test_baseline_keywords_are_fingerprinting_techniques(keyword):
+    result = ScriptAnalyzer(strict=False).analyze_page(_page(BASELINE_CALLS[keyword]))
+    assert keyword in result['fingerprinting']
+    assert keyword in result['fingerprinting_scripts']
+
+
+def test_strict_mode_is_opt_in_and_keeps_every_api_listed():
+    page = _page(BASELINE_CALLS['canvas.todataurl'], "gl.getParameter(ext.UNMASKED_RENDERER_WEBGL);")
+    default = ScriptAnalyzer(strict=False).analyze_page(page)
+    strict = ScriptAnalyzer(strict=True).analyze_page(page)
+
+    assert 'canvas.todataurl' in default['fingerprinting']
+    assert strict['fingerprinting'] == ['unmasked_renderer_webgl']
+    assert strict['fingerprinting_apis'] == default['fingerprinting_apis']
+
+
+def test_strict_mode_counts_many_weak_apis():
+    weak = ['todataurl', 'getclientrects', 'audiocontext', 'hardwareconcurrency', 'devicememory', 'maxtouchpoints']
+    assert script_analysis.strict_fingerprinting(weak) == weak
+    assert script_analysis.strict_fingerprinting(weak[:5]) == []
+
+
+def test_each_unique_script_is_analyzed_once(session):
+    analyzer = ScriptAnalyzer(session, strict=False)
+    first = analyzer.analyze_page(_page(BASELINE_CALLS['audiocontext'], 'var x = 1;'))
+    # The same script re-indented is the same script
+    second = analyzer.analyze_page(_page('  ' + BASELINE_CALLS['audiocontext'] + '\r\n'))
+    assert second['script_hashes'] == first['script_hashes'][:1]
+    assert analyzer.stats['analyzed'] == 2 and analyzer.stats['memory_hits'] == 1
+
+    script_analysis.store_new_verdicts(session, analyzer.take_new_verdicts())
+    session.commit()
+    restarted = ScriptAnalyzer(session, strict=False)
+    assert restarted.analyze_page(_page(BASELINE_CALLS['audiocontext']))['fingerprinting'] == ['audiocontext']
+    assert restarted.stats['db_hits'] == 1 and restarted.stats['analyzed'] == 0
+
+
+def test_a_verdict_evicted_before_it_is_stored_is_recomputed(session):
+    fetched = []
+
+    def fetch(url):
+        fetched.append(url)
+        return BASELINE_CALLS['canvas.todataurl']
+
+    analyzer = ScriptAnalyzer(session, fetch=fetch, memory_size=1, strict=False)
+    analyzer.analyze_page(_external_page(EXTERNAL))
+    pending = analyzer.take_new_verdicts()  # handed to the write buffer, not committed yet
+    analyzer.analyze_page(_page('var x = 1;'))  # pushes fp.js's verdict out of memory
+
+    result = analyzer.analyze_page(_external_page(EXTERNAL))
+    assert 'canvas.todataurl' in result['fingerprinting'] and fetched == [EXTERNAL]
+
+    # Once committed, the source is let go and the verdict comes from the database
+    stored = script_analysis.store_new_verdicts(session, pending, analyzer)
+    session.commit()
+    stored()
+    analyzer.take_new_verdicts()
+    analyzer.analyze_page(_page('var x = 1;'))
+    result = analyzer.analyze_page(_external_page(EXTERNAL))
+    assert 'canvas.todataurl' in result['fingerprinting'] and fetched == [EXTERNAL]
+    assert analyzer.stats['db_hits'] == 1
+
+
+def test_external_fetches_share_a_page_time_budget():
+    def slow_fetch(url):
+        time.sleep(0.1)
+        return f'var src = "{url}";'
+
+    analyzer = ScriptAnalyzer(fetch=slow_fetch, fetch_budget=0.05)
+    urls = [f'https://cdn.example/{i}.js' for i in range(3)]
+    result = analyzer.analyze_page(_external_page(*urls))
+    assert len(result['script_hashes']) == 1 and analyzer.stats['fetch_skipped'] == 2
+
+    # Skipped scripts are not remembered as failures; the next page fetches them
+    result = analyzer.analyze_page(_external_page(*urls[1:]))
+    assert len(result['script_hashes']) == 1 and analyzer.stats['fetched'] == 2
+    assert 'over the page\'s time budget' in script_analysis.format_stats(analyzer.take_stats())
+
+
+def test_keyword_matcher_counts_like_a_scan_per_keyword():
+    keywords = set(script_analysis.FINGERPRINTING_APIS + script_analysis.MINER_SIGNATURES)
+    source = ' '.join(BASELINE_CALLS.values()).lower() * 3 + ' new CoinHive.Anonymous(k)'.lower()
+    expected = {keyword: source.count(keyword) for keyword in keywords if keyword in source}
+    # Keywords inside other keywords ('todataurl' in 'canvas.todataurl') count for both
+    assert script_analysis.KeywordMatcher(keywords).count(source) == expected
+    assert script_analysis.KeywordMatcher(['UA-', 'pub-']).present('ua- UA-1 x') == {'UA-'}
+
+
+@pytest.mark.parametrize('prefix', ['', '<p>İstanbul</p>'])  # 'İ'.lower() is two characters
+def test_script_extraction_is_unchanged_by_the_fast_scan(prefix):
+    page = (prefix + '<SCRIPT type="text/javascript">var a;</SCRIPT><script type="application/ld+json">{}'
+            '</script><script src=/player.js></script>')
+    assert script_analysis.extract_scripts(page, 'https://site.example/watch') == [
+        (None, 'var a;'), ('https://site.example/player.js', None)]
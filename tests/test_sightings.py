@@ -0,0 +1,77 @@
+# tests/test_sightings.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.fls_analyzer import db_handler
+
+LINK = 'https://s1.streams.example/watch'
+OTHER = 'https://s2.streams.example/watch'
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A fresh database with two stored links and one aggregator."""
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    session.add(db_handler.Aggregator(id=1, url='https://aggregator.example', event_id=1))
+    db_handler.insert_new_urls(session, [LINK, OTHER], event_id=1, aggregator_id=1)
+    session.commit()
+    yield session
+    session.close()
+
+
+def _cycles(session, count: int) -> list:
+    return [db_handler.start_collection_cycle(session).id for _ in range(count)]
+
+
+def _intervals(session, url: str) -> list:
+    url_id = db_handler.get_url_ids(session, [url])[url]
+    return [(s.first_cycle_id, s.last_cycle_id, s.sightings)
+            for s in session.query(db_handler.URLSighting).filter_by(url_id=url_id)
+            .order_by(db_handler.URLSighting.first_cycle_id)]
+
+
+def test_consecutive_listings_extend_one_interval(session):
+    c1, c2, c3 = _cycles(session, 3)
+    for cycle_id in (c1, c2, c3):
+        db_handler.record_sightings(session, cycle_id, 1, [LINK])
+    db_handler.record_sightings(session, c3, 1, [LINK])  # the same cycle again is a no-op
+    session.commit()
+    assert _intervals(session, LINK) == [(c1, c3, 3)]
+
+
+def test_a_missed_listing_opens_a_new_interval(session):
+    c1, c2, c3 = _cycles(session, 3)
+    db_handler.record_sightings(session, c1, 1, [LINK, OTHER])
+    db_handler.record_sightings(session, c2, 1, [OTHER])  # scraped, but LINK was gone
+    db_handler.record_sightings(session, c3, 1, [LINK, OTHER])
+    session.commit()
+
+    assert _intervals(session, LINK) == [(c1, c1, 1), (c3, c3, 1)]
+    assert _intervals(session, OTHER) == [(c1, c3, 3)]
+    assert db_handler.get_cycle_churn(session, c3) == {'appeared': 1, 'persisted': 1, 'disappeared': 0}
+
+
+def test_a_failed_scrape_does_not_split_intervals(session):
+    c1, _, c3 = _cycles(session, 3)  # the aggregator was not scraped in the middle cycle
+    db_handler.record_sightings(session, c1, 1, [LINK])
+    db_handler.record_sightings(session, c3, 1, [LINK])
+    session.commit()
+    assert _intervals(session, LINK) == [(c1, c3, 2)]
+
+
+def test_lifetimes_span_all_intervals(session):
+    c1, c2, c3 = _cycles(session, 3)
+    start = datetime(2025, 4, 1)
+    db_handler.record_sightings(session, c1, 1, [LINK], seen_at=start)
+    db_handler.record_sightings(session, c2, 1, [OTHER], seen_at=start + timedelta(minutes=30))
+    db_handler.record_sightings(session, c3, 1, [LINK], seen_at=start + timedelta(hours=1))
+    session.commit()
+
+    url_id = db_handler.get_url_ids(session, [LINK])[LINK]
+    (lifetime,) = db_handler.get_link_lifetimes(session, [url_id])
+    assert lifetime.intervals == 2 and lifetime.sightings == 2 and lifetime.aggregator_count == 1
+    assert lifetime.last_seen - lifetime.first_seen == timedelta(hours=1)
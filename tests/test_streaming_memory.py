@@ -0,0 +1,86 @@
+# tests/test_streaming_memory.py
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+from src.fls_analyzer import db_handler
+
+# Size of the synthetic database. The default keeps the suite quick; the
+# full-scale check (`make test-memory`) sets 5M, which takes minutes
+SYNTHETIC_ROWS = int(os.getenv('FLS_TEST_SYNTHETIC_ROWS', '200000'))
+# Peak RSS may grow this much between the first tenth of the read and the end
+RSS_GROWTH_LIMIT_MB = 32
+# ...and never exceed this in total (interpreter, pandas and matplotlib included)
+RSS_PEAK_LIMIT_MB = 400
+
+PROBE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stream_rss_probe.py')
+
+
+@pytest.fixture(scope='module')
+def synthetic_db(tmp_path_factory):
+    """
+    A database with SYNTHETIC_ROWS URLs, each with a privacy result.
+
+    The schema comes from the models; the rows are generated inside SQLite
+    with a recursive CTE, so even 5M of them take seconds to build, not hours.
+    """
+    path = tmp_path_factory.mktemp('stream') / 'synthetic.db'
+    url = f'sqlite:///{path}'
+    db_handler.Base.metadata.create_all(create_engine(url))
+
+    conn = sqlite3.connect(path)
+    conn.executescript(f"""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        INSERT INTO events (id, name) VALUES (1, 'UCL 2025'), (2, 'NHL Stanley Cup 2025');
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {SYNTHETIC_ROWS})
+        INSERT INTO scraped_urls (id, url, event_id, first_seen)
+        SELECT i, 'https://stream' || (i % 5000) || '.example/watch/' || i, 1 + i % 2,
+               datetime('2025-04-01', '+' || (i % 60) || ' days')
+        FROM n;
+        INSERT INTO privacy_analysis (url_id, google_publisher_ids, vp_analysis_data, analyzed_at)
+        SELECT id,
+               json_array('UA-' || (id % 997) || '-1'),
+               json_object('CA', json_object(
+                   'google_ids', json_object('GA_UA', json_array('UA-' || (id % 997) || '-1')),
+                   'fingerprinting_techniques',
+                   CASE WHEN id % 7 = 0 THEN json_array('webgl_debug_renderer_info') ELSE json_array() END)),
+               first_seen
+        FROM scraped_urls;
+    """)
+    conn.commit()
+    conn.close()
+    return url
+
+
+def _probe(database_url: str, mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, PROBE, database_url, mode],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    # The figure script prints nothing while aggregating, but stay tolerant
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _assert_flat(result: dict):
+    samples = result['peak_rss_mb']
+    assert result['rows'] == SYNTHETIC_ROWS
+    early = samples[max(len(samples) // 10 - 1, 0)]
+    growth = samples[-1] - early
+    print(f"peak RSS {early:.0f} MB after 10% of {result['rows']} rows, {samples[-1]:.0f} MB at the end")
+    assert growth < RSS_GROWTH_LIMIT_MB, f"peak RSS grew {growth:.0f} MB while streaming"
+    assert samples[-1] < RSS_PEAK_LIMIT_MB
+
+
+def test_iter_keyset_reads_in_flat_memory(synthetic_db):
+    _assert_flat(_probe(synthetic_db, 'keyset'))
+
+
+def test_privacy_stats_aggregate_in_flat_memory(synthetic_db):
+    _assert_flat(_probe(synthetic_db, 'privacy'))
@@ -0,0 +1,91 @@
+# tests/test_threat_analyzer.py
+
+import importlib.util
+import os
+
+import pytest
+
+from conftest import PROJECT_ROOT
+from src.fls_analyzer import db_handler, drive_by, retries
+from src.fls_analyzer.write_buffer import WriteBuffer
+
+URL = 'https://stream.example/watch/1'
+
+
+def _load_script():
+    """Imports scripts/2_analyze_threats.py, whose name isn't a valid module name."""
+    spec = importlib.util.spec_from_file_location(
+        'analyze_threats', os.path.join(PROJECT_ROOT, 'scripts', '2_analyze_threats.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+analyze_threats = _load_script()
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A fresh database with one URL, leased to worker 'w'."""
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    monkeypatch.setenv('VT_CACHE_URL', f"sqlite:///{tmp_path / 'vt_cache.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, [URL], event_id=1, aggregator_id=None)
+    session.commit()
+    db_handler.claim_tasks(session, 'security', 'w', 1, 600)
+    yield session
+    session.close()
+
+
+def _payload(tmp_path):
+    path = tmp_path / 'payload.exe'
+    path.write_bytes(b'MZ' + b'\0' * 64)
+    sha256, size = drive_by.hash_file(str(path))
+    return drive_by.CapturedDownload(sha256, size, 'setup.exe', URL + '/dl', str(path))
+
+
+def test_payloads_are_kept_when_vt_gives_up(session, tmp_path):
+    url_id = db_handler.get_url_ids(session, [URL])[URL]
+    payload = _payload(tmp_path)
+
+    analyze_threats.store_downloads(session, url_id, [payload])
+    analyze_threats.store_failure(session, url_id, 'w', retries.ERROR_PERMANENT, 'VT rejected the URL')
+    session.commit()
+
+    assert db_handler.queue_counts(session, 'security') == {db_handler.TASK_FAILED: 1}
+    download = session.get(db_handler.Download, payload.sha256)
+    assert download is not None and download.url_count == 1
+    record = session.query(db_handler.SecurityAnalysis).filter_by(url_id=url_id).one()
+    assert record.drive_by_download_detected and record.vt_score is None
+
+
+def test_payloads_are_stored_once_when_the_url_is_retried(session, tmp_path):
+    url_id = db_handler.get_url_ids(session, [URL])[URL]
+    payload = _payload(tmp_path)
+    for _ in range(2):
+        analyze_threats.store_downloads(session, url_id, [payload])
+    analyze_threats.store_result(session, url_id, 'w', 0)
+    session.commit()
+
+    assert session.get(db_handler.Download, payload.sha256).url_count == 1
+    assert db_handler.queue_counts(session, 'security') == {db_handler.TASK_DONE: 1}
+
+
+def test_analyzer_stores_verdicts_without_visits(session):
+    urls = ['https://stream.example/watch/2', 'https://stream.example/watch/3']
+    db_handler.insert_new_urls(session, urls, event_id=1, aggregator_id=None)
+    session.commit()
+    analyzer = analyze_threats.ThreatAnalyzer(session, 'bench', WriteBuffer(session, 10, 60))
+
+    claimed = analyzer.claim(10)
+    assert [url for _, url in claimed] == urls
+    (ok_id, _), (failed_id, _) = claimed
+    analyzer.on_result(ok_id, {'malicious': 3}, 'report', {'type': 'url'})
+    analyzer.on_result(failed_id, {'error': 'bad request', 'error_kind': retries.ERROR_PERMANENT}, None, None)
+    analyzer.flush()
+
+    assert session.query(db_handler.SecurityAnalysis).filter_by(url_id=ok_id).one().vt_score == 3
+    states = dict(session.query(db_handler.SecurityTask.url_id, db_handler.SecurityTask.state))
+    assert states[ok_id] == db_handler.TASK_DONE and states[failed_id] == db_handler.TASK_FAILED
+    assert analyzer.shutdown() == 0  # the fixture's own lease belongs to another worker
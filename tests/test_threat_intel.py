@@ -0,0 +1,82 @@
+# tests/test_threat_intel.py
+
+import json
+import os
+
+import pytest
+
+from src.fls_analyzer import db_handler
+from src.fls_analyzer.threat_intel import Match, ThreatIntelMatcher
+
+
+@pytest.fixture
+def feeds_dir(tmp_path):
+    (tmp_path / 'urlhaus.csv').write_text(
+        '# id,dateadded,url,url_status\n'
+        '1,"2025-04-01","http://Evil.example/dl/payload.exe#x","online"\n'
+    )
+    (tmp_path / 'phishing.txt').write_text(
+        '# hosts and path prefixes\n'
+        'phish.example\n'
+        'cdn.example/login/\n'
+        'https://files.example/drop/*\n'
+    )
+    config = {'feeds_dir': str(tmp_path), 'feeds': [
+        {'name': 'urlhaus', 'category': 'malware', 'file': 'urlhaus.csv'},
+        {'name': 'phishtank', 'category': 'phishing', 'file': 'phishing.txt'},
+        {'name': 'missing', 'file': 'not-downloaded.txt'},
+    ]}
+    (tmp_path / 'feeds.json').write_text(json.dumps(config))
+    return tmp_path
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('HTTP://evil.example:80/dl/payload.exe', Match('urlhaus', 'malware', 'url', 'http://evil.example/dl/payload.exe')),
+    ('http://evil.example/dl/other.exe', None),
+    ('https://www.login.phish.example/watch', Match('phishtank', 'phishing', 'host', 'phish.example')),
+    ('https://notphish.example/', None),
+    ('https://cdn.example/login/reset?u=1', Match('phishtank', 'phishing', 'path', 'cdn.example/login/')),
+    ('https://cdn.example/live/1', None),
+    ('https://files.example/drop/a.zip', Match('phishtank', 'phishing', 'path', 'files.example/drop/')),
+])
+def test_match(feeds_dir, url, expected):
+    matcher = ThreatIntelMatcher(str(feeds_dir / 'feeds.json'))
+    assert matcher.reload() == {'urlhaus': 1, 'phishtank': 3}
+    assert matcher.match(url) == expected
+
+
+def test_reload_picks_up_only_changed_feeds(feeds_dir):
+    matcher = ThreatIntelMatcher(str(feeds_dir / 'feeds.json'))
+    matcher.reload()
+    assert matcher.reload() == {}
+
+    (feeds_dir / 'phishing.txt').write_text('phish.example\nnew-phish.example\n')
+    assert matcher.reload() == {'phishtank': 2}
+    assert matcher.match('https://new-phish.example/').feed == 'phishtank'
+
+    os.remove(feeds_dir / 'urlhaus.csv')
+    assert matcher.reload() == {} and matcher.feed_sizes == {'phishtank': 2}
+    assert matcher.match('http://evil.example/dl/payload.exe') is None
+
+
+def test_feed_matches_count_as_analyzed_threats(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    urls = ['http://evil.example/dl/payload.exe', 'https://clean.example/watch']
+    ids = db_handler.insert_new_urls(session, urls, event_id=1, aggregator_id=None)
+    db_handler.record_security_result(session, ids[urls[0]], None, intel_feed='urlhaus',
+                                      intel_match_type='url', intel_indicator=urls[0])
+    db_handler.record_security_result(session, ids[urls[1]], 0)
+    session.commit()
+
+    def counters():
+        (row,) = db_handler.get_threat_summary(session)
+        return {name: getattr(row, name) for name in db_handler.SUMMARY_COUNTERS}
+
+    incremental = counters()
+    assert incremental['analyzed_count'] == 2 and incremental['intel_positive_count'] == 1
+    assert incremental['vt_positive_count'] == 0
+    db_handler.rebuild_threat_summary(session)
+    assert counters() == incremental
+    session.close()
@@ -0,0 +1,60 @@
+# tests/test_vt_archive.py
+
+import pytest
+
+from src.fls_analyzer import db_handler, mock_virustotal, vt_archive
+
+URLS = [f'https://s{i}.streams.example.com/watch' for i in range(3)]
+
+
+def _analysis(url: str) -> dict:
+    """A completed analysis as VT returns it, with per-engine results."""
+    verdict = mock_virustotal._verdict(url, malicious_rate=0.5)
+    return {'type': 'analysis', 'attributes': {'date': 1743465600, 'status': 'completed', **verdict}}
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()  # seeds event 1, 'UCL 2025'
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_payloads_round_trip_compressed():
+    payload = _analysis(URLS[0])
+    blob = vt_archive.compress_payload(payload)
+    assert vt_archive.decompress_payload(blob) == payload
+    assert len(blob) < len(str(payload)) / 3
+    assert len(vt_archive.engine_results(payload)) == len(mock_virustotal.ENGINES)
+    # URL reports keep their results under another key
+    report = {'type': 'url', 'attributes': {'last_analysis_results': payload['attributes']['results']}}
+    assert vt_archive.engine_results(report) == vt_archive.engine_results(payload)
+
+
+def test_verdicts_are_recomputed_from_the_archive(session):
+    ids = db_handler.get_url_ids(session, URLS)
+    payloads = {url: _analysis(url) for url in URLS[:2]}
+    for url, payload in payloads.items():
+        vt_archive.archive_result(session, ids[url], payload['attributes']['stats'], 'analysis', payload)
+    # A cached verdict only has its stats
+    vt_archive.archive_result(session, ids[URLS[2]], {'malicious': 0, 'suspicious': 0}, 'cache')
+    session.commit()
+
+    report = session.get(db_handler.VTReport, ids[URLS[0]])
+    assert report.engine_count == len(mock_virustotal.ENGINES) and report.analysis_date.year == 2025
+
+    malicious = [payload['attributes']['stats']['malicious'] for payload in payloads.values()] + [0]
+    sweep = vt_archive.threshold_sweep(session, [0, 5])
+    assert sweep == {'UCL 2025': {'analyzed': 3, 0: sum(m > 0 for m in malicious), 5: sum(m > 5 for m in malicious)}}
+
+    engines = mock_virustotal.ENGINES[:10]
+    expected = sum(
+        any(vt_archive.engine_results(payload)[engine] == 'malicious' for engine in engines)
+        for payload in payloads.values()
+    )
+    assert vt_archive.engine_subset_counts(session, engines) == {
+        'UCL 2025': {'analyzed': 2, 'positive': expected, 'no_payload': 1}}
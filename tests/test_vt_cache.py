@@ -0,0 +1,81 @@
+# tests/test_vt_cache.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import use_vt_cache
+from src.fls_analyzer import db_handler, retries, security_analysis, vt_cache
+
+URLS = ['https://a.streams.example.com/watch/1', 'https://b.streams.example.com/watch/2',
+        'https://c.streams.example.com/watch/3']
+
+
+def _stats(malicious: int, suspicious: int = 0) -> dict:
+    return {'malicious': malicious, 'suspicious': suspicious, 'harmless': 60, 'undetected': 10}
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    use_vt_cache(tmp_path, monkeypatch)
+    db_handler.init_db()
+    session = db_handler.get_session()
+    yield session
+    session.close()
+
+
+def _rollup(domain: str):
+    with vt_cache.get_session() as cache:
+        return cache.get(vt_cache.VTVerdict, (vt_cache.SCOPE_DOMAIN, domain))
+
+
+def test_url_verdicts_are_keyed_by_canonical_url(session):
+    vt_cache.store_verdict(URLS[0], _stats(3))
+    assert vt_cache.get_url_verdict('HTTPS://A.Streams.Example.com:443/watch/1#player') == _stats(3)
+    assert vt_cache.get_url_verdict(URLS[1]) is None
+    # Expired verdicts are not served
+    vt_cache.store_verdict(URLS[1], _stats(0), fetched_at=datetime.utcnow() - timedelta(days=30))
+    assert vt_cache.get_url_verdict(URLS[1]) is None
+
+
+def test_domain_rollup_keeps_the_worst_count_per_category(session):
+    vt_cache.store_verdict(URLS[0], _stats(3))
+    vt_cache.store_verdict(URLS[1], _stats(1, suspicious=2))
+    vt_cache.store_verdict(URLS[0], _stats(4))  # a refetch is not another URL
+
+    rollup = _rollup('example.com')
+    assert rollup.stats == {**_stats(4), 'suspicious': 2} and rollup.url_count == 2
+    assert vt_cache.get_domain_verdict(URLS[2]) == rollup.stats
+    assert vt_cache.get_domain_verdicts(['example.com', 'unknown.example.com']) == {'example.com': rollup.stats}
+
+
+def test_a_failed_scan_carries_the_domain_verdict_without_caching_it(session, monkeypatch):
+    vt_cache.store_verdict(URLS[0], _stats(5))
+    monkeypatch.setattr(security_analysis, '_fetch_virustotal_report',
+                        lambda url, max_age: {'error': 'timeout', 'error_kind': retries.ERROR_TRANSIENT})
+
+    stats = security_analysis.get_virustotal_report(URLS[1])
+    assert stats['error'] == 'timeout' and stats['domain_verdict'] == _stats(5)
+    assert vt_cache.get_url_verdict(URLS[1]) is None
+    assert 'domain_verdict' not in security_analysis.get_virustotal_report(URLS[1], domain_fallback=False)
+
+
+def test_domain_fallbacks_stored_as_url_scores_are_requeued(session):
+    ids = db_handler.insert_new_urls(session, URLS[:2], event_id=1, aggregator_id=None)
+    # The first URL was scanned; an older analyzer stored the domain rollup for the second
+    db_handler.record_security_result(session, ids[URLS[0]], 2)
+    db_handler.record_vt_report(session, ids[URLS[0]], 'analysis', _stats(2))
+    db_handler.record_security_result(session, ids[URLS[1]], 9)
+    db_handler.record_vt_report(session, ids[URLS[1]], 'domain', _stats(9))
+    session.commit()
+
+    assert db_handler.requeue_domain_fallbacks(session) == 1
+    session.commit()
+    assert db_handler.requeue_domain_fallbacks(session) == 0
+
+    result = session.query(db_handler.SecurityAnalysis).filter_by(url_id=ids[URLS[1]]).one()
+    task = session.query(db_handler.SecurityTask).filter_by(url_id=ids[URLS[1]]).one()
+    assert result.vt_score is None and task.state == db_handler.TASK_RETRY
+    assert session.query(db_handler.VTReport).filter_by(source='domain').count() == 0
+    assert session.query(db_handler.Domain).filter_by(name='example.com').one().max_vt_score == 2
@@ -0,0 +1,87 @@
+# tests/test_vt_pipeline.py
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import run_vt_pipeline, use_vt_cache
+from src.fls_analyzer import db_handler, mock_virustotal, retries, vt_cache
+
+URLS = [f'https://s{i}.streams.example.com/watch' for i in range(4)]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    use_vt_cache(tmp_path, monkeypatch)
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def urls(session) -> dict:
+    return {url_id: url for url, url_id in db_handler.get_url_ids(session, URLS).items()}
+
+
+def test_submitted_analyses_are_polled_to_completion(session, monkeypatch, urls):
+    app = mock_virustotal.create_app(completion='0.2')
+    results, pipeline = run_vt_pipeline(monkeypatch, session, app, urls, max_in_flight=2)
+
+    assert set(results) == set(urls)
+    assert {source for _, source, _ in results.values()} == {'analysis'}
+    assert all(payload['attributes']['status'] == 'completed' for _, _, payload in results.values())
+    assert pipeline.metrics()['completed'] == len(URLS) and len(pipeline.latencies) == len(URLS)
+    # Submissions were recorded for a restarted worker to resume; the caller clears them
+    assert session.query(db_handler.PendingVTAnalysis).count() == len(URLS)
+
+    # Verdicts are cached, so a second pass makes no requests
+    app = mock_virustotal.create_app(completion='0.2')
+    results, pipeline = run_vt_pipeline(monkeypatch, session, app, urls)
+    assert {source for _, source, _ in results.values()} == {'cache'}
+    assert pipeline.counts['submitted'] == 0
+
+
+def test_a_pending_analysis_is_resumed_not_resubmitted(session, monkeypatch, urls):
+    url_id = min(urls)
+    db_handler.save_pending_vt_analysis(session, url_id, 'u-unknown-0', datetime.utcnow())
+    app = mock_virustotal.create_app(completion='0')
+    results, pipeline = run_vt_pipeline(monkeypatch, session, app, {url_id: urls[url_id]})
+
+    # The mock never saw that analysis, so polling it fails and the URL is retried later
+    stats, source, _ = results[url_id]
+    assert 'not found' in stats['error'] and stats['error_kind'] == retries.ERROR_TRANSIENT
+    assert source is None and pipeline.counts['resumed'] == 1 and pipeline.counts['submitted'] == 0
+
+
+def test_unexpected_errors_are_still_reported(session, monkeypatch, urls):
+    def broken_cache(url, stats, fetched_at=None):
+        raise RuntimeError('cache database is gone')
+
+    monkeypatch.setattr(vt_cache, 'store_verdict', broken_cache)
+    app = mock_virustotal.create_app(completion='0', known_rate=1.0)
+    results, pipeline = run_vt_pipeline(monkeypatch, session, app, urls)
+
+    assert set(results) == set(urls)
+    assert all('cache database is gone' in stats['error'] and stats['error_kind'] == retries.ERROR_TRANSIENT
+               for stats, _, _ in results.values())
+    assert pipeline.counts['errors'] == len(URLS)
+
+
+def test_leases_are_renewed_while_urls_are_in_flight(session, monkeypatch, urls):
+    claimed = db_handler.claim_tasks(session, 'security', 'w1', len(URLS), lease_seconds=1)
+    renewed = []
+    app = mock_virustotal.create_app(completion='0.5')
+    results, _ = run_vt_pipeline(
+        monkeypatch, session, app, {url_id: urls[url_id] for url_id in claimed},
+        heartbeat=lambda: renewed.append(db_handler.renew_leases(session, 'security', 'w1', 600)),
+    )
+
+    # Polling outlasted the one-second lease, which the heartbeat kept extending
+    assert len(results) == len(URLS) and renewed and renewed[0] == len(URLS)
+    tasks = session.query(db_handler.SecurityTask).all()
+    assert all(t.state == db_handler.TASK_LEASED and t.lease_expires_at > datetime.utcnow() + timedelta(minutes=5)
+               for t in tasks)
@@ -0,0 +1,47 @@
+# tests/test_vt_reports.py
+
+import time
+
+import pytest
+
+from conftest import run_vt_pipeline, use_vt_cache
+from src.fls_analyzer import db_handler, mock_virustotal, security_analysis
+
+URLS = [f'https://s{i}.streams.example/watch' for i in range(3)]
+STATS = {'malicious': 2, 'suspicious': 0, 'harmless': 60, 'undetected': 8, 'timeout': 0}
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    use_vt_cache(tmp_path, monkeypatch)
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize('attributes, expected, outcome', [
+    ({'last_analysis_date': time.time() - 86400, 'last_analysis_stats': STATS}, STATS, 'hits'),
+    ({'last_analysis_date': time.time() - 30 * 86400, 'last_analysis_stats': STATS}, None, 'stale'),
+    ({'last_analysis_stats': STATS}, None, 'misses'),
+    ({'last_analysis_date': time.time()}, None, 'misses'),
+])
+def test_fresh_report_stats(monkeypatch, attributes, expected, outcome):
+    monkeypatch.setattr(security_analysis, 'LOOKUP_STATS', dict.fromkeys(security_analysis.LOOKUP_STATS, 0))
+    assert security_analysis.fresh_report_stats(attributes) == expected
+    assert security_analysis.LOOKUP_STATS[outcome] == 1
+
+
+@pytest.mark.parametrize('report_age_days, source', [(1, 'report'), (30, 'analysis')])
+def test_pipeline_submits_only_without_a_recent_report(session, monkeypatch, report_age_days, source):
+    app = mock_virustotal.create_app(completion='0', known_rate=1.0, report_age_days=report_age_days)
+    ids = db_handler.get_url_ids(session, URLS)
+    results, pipeline = run_vt_pipeline(monkeypatch, session, app, {ids[url]: url for url in URLS})
+
+    assert {s for _, s, _ in results.values()} == {source}
+    assert all('error' not in stats for stats, _, _ in results.values())
+    reused = len(URLS) if source == 'report' else 0
+    assert pipeline.counts['reused'] == reused and pipeline.counts['submitted'] == len(URLS) - reused
@@ -0,0 +1,81 @@
+# tests/test_work_queues.py
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from src.fls_analyzer import db_handler, retries
+
+URLS = [f'https://s{i}.streams.example/watch' for i in range(5)]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    """A fresh database with URLS queued for every analysis."""
+    monkeypatch.setenv(db_handler.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'fls.db'}")
+    db_handler.init_db()
+    session = db_handler.get_session()
+    db_handler.insert_new_urls(session, URLS, event_id=1, aggregator_id=None)
+    session.commit()
+    yield session
+    session.close()
+
+
+def _expire_leases(session):
+    table = db_handler.SecurityTask.__table__
+    session.execute(update(table).where(table.c.state == db_handler.TASK_LEASED)
+                    .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    session.commit()
+
+
+def test_workers_claim_disjoint_batches(session):
+    first = db_handler.claim_tasks(session, 'security', 'w1', 3, 600)
+    second = db_handler.claim_tasks(session, 'security', 'w2', 3, 600)
+    assert len(first) == 3 and len(second) == 2 and not set(first) & set(second)
+    assert db_handler.claim_tasks(session, 'security', 'w3', 3, 600) == []
+    # The privacy queue is independent
+    assert len(db_handler.claim_tasks(session, 'privacy', 'w1', 10, 600)) == len(URLS)
+
+
+def test_a_result_from_a_lost_lease_is_discarded(session):
+    (url_id,) = db_handler.claim_tasks(session, 'security', 'w1', 1, 600)
+    _expire_leases(session)
+    assert db_handler.claim_tasks(session, 'security', 'w2', 1, 600) == [url_id]
+    assert not db_handler.complete_task(session, 'security', url_id, 'w1')
+    assert db_handler.complete_task(session, 'security', url_id, 'w2')
+
+
+def test_expired_leases_are_given_up_after_max_attempts(session, monkeypatch):
+    monkeypatch.setattr(retries, 'RETRY_MAX_ATTEMPTS', 2)
+    (url_id,) = db_handler.claim_tasks(session, 'security', 'w1', 1, 600)
+    for worker in ('w2', 'w3'):
+        _expire_leases(session)  # the worker crashed on this URL
+        claimed = db_handler.claim_tasks(session, 'security', worker, 1, 600)
+    assert url_id not in claimed
+    task = session.query(db_handler.SecurityTask).filter_by(url_id=url_id).one()
+    assert task.state == db_handler.TASK_FAILED and task.attempts == 2
+    assert 'Lease expired' in task.last_error
+
+
+def test_released_leases_hand_back_their_attempt(session):
+    claimed = db_handler.claim_tasks(session, 'security', 'w1', 2, 600)
+    assert db_handler.release_leases(session, 'security', 'w1') == 2
+    session.commit()
+    tasks = session.query(db_handler.SecurityTask).filter(db_handler.SecurityTask.url_id.in_(claimed)).all()
+    assert all(t.state == db_handler.TASK_PENDING and t.attempts == 0 and t.lease_owner is None
+               for t in tasks)
+
+
+def test_due_retries_are_requeued(session):
+    (url_id,) = db_handler.claim_tasks(session, 'security', 'w1', 1, 600)
+    db_handler.fail_task(session, 'security', url_id, 'w1', retries.ERROR_TRANSIENT, 'timeout')
+    session.commit()
+    assert db_handler.requeue_retries(session, 'security', 10) == 0  # not due yet
+
+    table = db_handler.SecurityTask.__table__
+    session.execute(update(table).where(table.c.url_id == url_id)
+                    .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+    session.commit()
+    assert db_handler.requeue_retries(session, 'security', 10) == 1
+    assert db_handler.queue_counts(session, 'security') == {db_handler.TASK_PENDING: len(URLS)}
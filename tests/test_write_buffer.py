@@ -0,0 +1,99 @@
+# tests/test_write_buffer.py
+
+import signal
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from src.fls_analyzer.write_buffer import WriteBuffer
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (x INTEGER PRIMARY KEY)'))
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _insert(session, x, applied):
+    session.execute(text('INSERT INTO t (x) VALUES (:x)'), {'x': x})
+    return lambda: applied.append(x)
+
+
+def _rows(session) -> list:
+    return session.execute(text('SELECT x FROM t ORDER BY x')).scalars().all()
+
+
+def test_on_commit_callbacks_run_only_after_a_commit(session):
+    buffer = WriteBuffer(session, max_items=10)
+    applied = []
+    buffer.add(_insert, 1, applied)
+    buffer.add(_insert, 1, applied)  # primary key conflict fails the group
+    with pytest.raises(Exception):
+        buffer.flush()
+    assert applied == [] and _rows(session) == []
+
+    buffer._pending.pop()
+    assert buffer.flush() == 1
+    assert applied == [1] and _rows(session) == [1]
+
+
+def test_signal_held_during_a_failed_flush_is_dropped(session):
+    buffer = WriteBuffer(session, max_items=10)
+
+    def interrupted_write(session):
+        buffer._handle_signal(signal.SIGINT, None)
+        raise RuntimeError('write failed')
+
+    buffer.add(interrupted_write)
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    buffer._pending = []
+    buffer.add(_insert, 2, [])
+    assert buffer.flush() == 1  # no stale KeyboardInterrupt
+
+
+def test_signals_are_held_after_close(session):
+    buffer = WriteBuffer(session, max_items=10)
+
+    def interrupted_write(session, x):
+        buffer._handle_signal(signal.SIGINT, None)
+        return _insert(session, x, [])
+
+    buffer.add(interrupted_write, 3)
+    assert buffer.close() == 1
+    buffer._handle_signal(signal.SIGTERM, None)  # e.g. while leases are released
+    assert _rows(session) == [3]
+
+    buffer = WriteBuffer(session, max_items=10)
+    buffer.add(interrupted_write, 4)
+    with pytest.raises(KeyboardInterrupt):
+        buffer.flush()
+
+
+def test_writes_are_grouped_until_a_threshold(session):
+    buffer = WriteBuffer(session, max_items=3, max_delay=3600)
+    applied = []
+    for x in (1, 2):
+        buffer.add(_insert, x, applied)
+    assert len(buffer) == 2 and _rows(session) == []  # nothing run yet
+
+    buffer.add(_insert, 3, applied)
+    assert len(buffer) == 0 and _rows(session) == [1, 2, 3]
+    assert buffer.flushes == 1 and buffer.largest_batch == 3
+    assert '3 writes in 1 commits' in buffer.report()
+
+
+def test_old_writes_are_flushed_by_maybe_flush(session):
+    buffer = WriteBuffer(session, max_items=100, max_delay=0.05)
+    buffer.add(_insert, 5, [])
+    assert not buffer.maybe_flush()
+    time.sleep(0.06)
+    assert buffer.maybe_flush()
+    assert _rows(session) == [5]
+    assert not buffer.maybe_flush()  # empty